@@ -0,0 +1,13 @@
+"""
+benchmarks
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Benchmarks for the myMDb project. None of them touch the real library.
+	generator.py:     builds made-up libraries of any size from a seed
+	fake_imdb.py:     a stand-in for IMDbPY that serves the made-up movies, with a configurable delay
+	run.py:           times the main entry points against a made-up library and writes the results as JSON
+	bench_objects.py: measures the memory use of tempMovie objects
+	startup.py:       times how long myMDb takes to start, up to its first menu
+	mirror.py:        times building and using the local IMDb mirror, from made-up dataset files
+"""
@@ -0,0 +1,117 @@
+"""
+bench_objects.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Measures how much memory tempMovie objects take and how fast they are built, used for myMDb project.
+The current tempMovie (__slots__, tuples, interned names) is compared with the original version
+(a plain class holding arrays), which is copied below as LegacyMovie.
+The movies are built the way db_personal.py builds them from db rows: every name arrives as its own string,
+even when the same person is in many movies.
+No database is needed.
+
+Usage:
+	python benchmarks/bench_objects.py [--movies 100000] [--people 20000] [--cast 10]
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from temp_objects import tempMovie
+
+"""
+The original tempMovie, kept here as the baseline.
+"""
+class LegacyMovie:
+	def __init__(self, title, director, writer, cast, year, runtime, mpaa, rating, watched, own):
+		self.title = title
+		self.director = director
+		self.writer = writer
+		self.cast = cast
+		self.year = year
+		self.runtime = runtime
+		self.mpaa = mpaa
+		self.rating = rating
+		self.watched = watched
+		self.own = own
+
+"""
+Makes the rows the movies are built from: (title, directors, writers, cast, year, runtime, mpaa, rating, watched, own).
+The same seed always gives the same rows.
+@params:
+	movies: int, number of rows
+	people: int, number of different names to pick the people from
+	cast:   int, number of actors per movie
+"""
+def makeRows(movies, people, cast, seed=1):
+	rng = random.Random(seed)
+	rows = []
+	for i in range(movies):
+		picked = rng.sample(xrange(people), cast + 2)
+		#"%s" builds a new string every time, the same way every row from the db comes with its own strings
+		names = ["PERSON %d" % n for n in picked]
+		rows.append(("MOVIE %d" % i, names[:1], names[1:2], names[2:], str(1920 + i % 100), str(80 + i % 90),
+		             "PG-13", str(i % 10), i % 2 == 0, i % 3 == 0))
+	return rows
+
+"""
+Adds up the bytes used by the objects, their attribute dictionaries, their arrays or tuples, and the strings in them.
+Each string is only counted once, however many objects share it.
+"""
+def footprint(objects):
+	seen = set()
+	total = 0
+	for obj in objects:
+		total += sys.getsizeof(obj)
+		if hasattr(obj, "__dict__"):
+			total += sys.getsizeof(obj.__dict__)
+			values = obj.__dict__.values()
+		else:
+			values = [getattr(obj, slot) for slot in obj.__slots__]
+		for value in values:
+			if isinstance(value, (list, tuple)):
+				total += sys.getsizeof(value)
+				parts = value
+			else:
+				parts = [value]
+			for part in parts:
+				if isinstance(part, basestring) and id(part) not in seen:
+					seen.add(id(part))
+					total += sys.getsizeof(part)
+	return total
+
+"""
+Builds one object per row with the given class, and measures the time taken and the memory used.
+@returns:
+	(seconds to build them all, bytes per object)
+"""
+def measure(cls, rows):
+	gc.collect()
+	start = time.time()
+	objects = [cls(*row) for row in rows]
+	elapsed = time.time() - start
+	return elapsed, footprint(objects) / float(len(objects))
+
+def main():
+	parser = argparse.ArgumentParser(description="Compare the memory use and build speed of tempMovie objects.")
+	parser.add_argument("--movies", type=int, default=100000, help="number of movies to build")
+	parser.add_argument("--people", type=int, default=20000, help="number of different names")
+	parser.add_argument("--cast", type=int, default=10, help="actors per movie")
+	args = parser.parse_args()
+
+	print "Building " + str(args.movies) + " movies with " + str(args.cast + 2) + " people each, from " + \
+	      str(args.people) + " names...\n"
+	results = []
+	for label, cls in (("original", LegacyMovie), ("current", tempMovie)):
+		#every class gets fresh rows, so neither one benefits from the strings the other interned
+		elapsed, size = measure(cls, makeRows(args.movies, args.people, args.cast))
+		results.append((label, elapsed, size))
+		print "%-10s %8.3f s  %10.0f movies/s  %8.0f bytes/movie" % (label, elapsed, args.movies / elapsed, size)
+	print "\nThe current tempMovie uses %.0f%% less memory per movie." % (100.0 * (1 - results[1][2] / results[0][2]))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,81 @@
+"""
+fake_imdb.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+A stand-in for IMDbPY's IMDb class, used by the myMDb benchmarks so they don't depend on IMDb being up (or fast).
+It serves made-up movies from generator.py, shaped like the IMDbPY objects db_web.py reads, and waits LATENCY
+seconds on every call to act like the network. The same search always gives the same results.
+To use it, point db_web.IMDB_FACTORY at it:
+	db_web.IMDB_FACTORY = lambda: FakeIMDb(latency=0.2)
+"""
+import random
+import time
+import zlib
+from benchmarks import generator
+
+#seconds every search_movie() and get_movie() call waits before answering
+LATENCY = 0.1
+
+#number of different movies the fake IMDb knows about
+CATALOG_SIZE = 1000000
+
+#most results a search gives back
+SEARCH_RESULTS = 20
+
+"""
+A movie or person, which IMDbPY represents as a dictionary that also has an id.
+"""
+class FakeItem(dict):
+	def __init__(self, item_id, fields):
+		dict.__init__(self, fields)
+		self.movieID = item_id
+		self.personID = item_id
+
+"""
+The fake IMDb. Takes the same (lack of) arguments as IMDb() by default.
+@params:
+	latency: float, seconds each call waits
+	seed:    int, seed of the movies served
+	catalog: int, number of different movies
+"""
+class FakeIMDb(object):
+	def __init__(self, latency=None, seed=generator.DEFAULT_SEED, catalog=None):
+		self.latency = LATENCY if latency is None else latency
+		self.seed = seed
+		self.catalog = catalog or CATALOG_SIZE
+		self.people = generator.peopleCount(self.catalog)
+		self.calls = 0
+
+	def _wait(self):
+		self.calls += 1
+		if self.latency > 0:
+			time.sleep(self.latency)
+
+	"""
+	Gives up to SEARCH_RESULTS basic movies (title, year, kind, but no people), picked from the title searched for.
+	"""
+	def search_movie(self, title):
+		self._wait()
+		rng = random.Random(zlib.crc32(title.encode("utf-8") if isinstance(title, unicode) else title))
+		results = []
+		for i in range(SEARCH_RESULTS):
+			index = rng.randrange(self.catalog)
+			movie = generator.makeMovie(index, self.people, self.seed)
+			results.append(FakeItem("%07d" % (index + 1), {"title": movie["title"], "year": int(movie["year"]), "kind": "movie"}))
+		return results
+
+	"""
+	Gives the full movie with the given id, with the fields db_web.extractFields() reads.
+	"""
+	def get_movie(self, movie_id):
+		self._wait()
+		movie = generator.makeMovie(int(movie_id) - 1, self.people, self.seed)
+		fields = {"title": movie["title"], "year": int(movie["year"]), "runtimes": [movie["runtime"]],
+		          "certificates": ["USA:" + movie["mpaa"]]}
+		for role in ("director", "writer", "cast"):
+			fields[role] = [FakeItem("%07d" % p, {"name": generator.personName(p)}) for p in movie[role]]
+		return FakeItem(movie_id, fields)
+
+#so this module can stand in for the imdb package itself
+IMDb = FakeIMDb
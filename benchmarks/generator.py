@@ -0,0 +1,255 @@
+"""
+generator.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Builds made-up movie libraries for the myMDb benchmarks.
+Everything comes from a seed, so the same size and seed always give exactly the same library:
+movie number i is built from its own random generator, and can be rebuilt on its own (fake_imdb.py relies on this).
+Casts are sized like real ones (mostly 10 to 30 people, a few much bigger), and some people are far more popular
+than others, so a handful of portfolios are big while most are small.
+"""
+import gzip
+import os
+import random
+from StringIO import StringIO
+from db_migrate import rebuildStats
+from temp_objects import tempMovie
+
+#the library sizes the benchmarks are usually run at
+SIZES = {"1k": 1000, "100k": 100000, "1m": 1000000}
+
+DEFAULT_SEED = 42
+
+#kilobytes of memory the SQLite loader lets the library file cache while it loads
+SQLITE_LOAD_CACHE_KB = 512 * 1024
+
+_FIRST = ["JAMES", "MARY", "JOHN", "PATRICIA", "ROBERT", "JENNIFER", "MICHAEL", "LINDA", "WILLIAM", "ELIZABETH",
+          "DAVID", "BARBARA", "RICHARD", "SUSAN", "JOSEPH", "JESSICA", "THOMAS", "SARAH", "CHARLES", "KAREN",
+          "CHRISTOPHER", "NANCY", "DANIEL", "LISA", "MATTHEW", "BETTY", "ANTHONY", "MARGARET", "MARK", "SANDRA",
+          "DONALD", "ASHLEY", "STEVEN", "KIMBERLY", "PAUL", "EMILY", "ANDREW", "DONNA", "JOSHUA", "MICHELLE"]
+_LAST = ["SMITH", "JOHNSON", "WILLIAMS", "BROWN", "JONES", "GARCIA", "MILLER", "DAVIS", "RODRIGUEZ", "MARTINEZ",
+         "HERNANDEZ", "LOPEZ", "GONZALEZ", "WILSON", "ANDERSON", "THOMAS", "TAYLOR", "MOORE", "JACKSON", "MARTIN",
+         "LEE", "PEREZ", "THOMPSON", "WHITE", "HARRIS", "SANCHEZ", "CLARK", "RAMIREZ", "LEWIS", "ROBINSON",
+         "WALKER", "YOUNG", "ALLEN", "KING", "WRIGHT", "SCOTT", "TORRES", "NGUYEN", "HILL", "FLORES", "O'BRIEN"]
+_ADJECTIVES = ["SILENT", "LAST", "DARK", "GOLDEN", "LOST", "HIDDEN", "BROKEN", "ENDLESS", "SECRET", "WILD",
+               "FROZEN", "BURNING", "DISTANT", "FINAL", "MIDNIGHT", "CRIMSON", "HOLLOW", "IRON", "SILVER", "FALLEN"]
+_NOUNS = ["RIVER", "CITY", "HEART", "SKY", "KINGDOM", "SHADOW", "ROAD", "STORM", "GARDEN", "EMPIRE",
+          "HARBOR", "MOUNTAIN", "LEGACY", "PROMISE", "FRONTIER", "MIRROR", "OCEAN", "CROWN", "WINTER", "DREAM"]
+_MPAA = ["G", "PG", "PG-13", "R", "n/a"]
+
+"""
+Number of different people in a library of the given size: about two for every movie.
+"""
+def peopleCount(movies):
+	return max(500, movies * 2)
+
+"""
+The name of person number person_id (counting from 1). Every number gives a different name.
+"""
+def personName(person_id):
+	i = person_id - 1
+	name = _FIRST[i % len(_FIRST)] + " " + _LAST[(i // len(_FIRST)) % len(_LAST)]
+	rest = i // (len(_FIRST) * len(_LAST))
+	if rest > 0:
+		name += " " + str(rest + 1)
+	return name
+
+"""
+Picks a person, with low numbers much more likely than high ones, so a few people are in many movies.
+"""
+def _pickPerson(rng, people):
+	return int(people * rng.random() ** 3) + 1
+
+"""
+Picks count different people.
+"""
+def _pickPeople(rng, people, count):
+	picked = []
+	seen = set()
+	while len(picked) < count:
+		person_id = _pickPerson(rng, people)
+		if person_id not in seen:
+			seen.add(person_id)
+			picked.append(person_id)
+	return picked
+
+"""
+Builds movie number index of a library.
+@params:
+	index:  int, which movie (from 0)
+	people: int, number of different people in the library, from peopleCount()
+	seed:   int
+@returns:
+	a dictionary with the MOVIES columns in lowercase ("title", "year", ...), and the person numbers
+	of its "director", "writer", and "cast" in billing order
+"""
+def makeMovie(index, people, seed=DEFAULT_SEED):
+	rng = random.Random(seed * 1000003 + index)
+	cast_size = min(max(int(rng.lognormvariate(2.7, 0.5)), 1), 80)
+	picked = _pickPeople(rng, people, cast_size + 5)
+	directors = 2 if rng.random() < 0.1 else 1
+	writers = rng.randint(1, 3)
+	rating = "n/a"
+	if rng.random() < 0.7:
+		rating = str(rng.randint(1, 10))
+	return {"title": rng.choice(_ADJECTIVES) + " " + rng.choice(_NOUNS) + " " + str(index + 1),
+	        "year": str(rng.randint(1920, 2019)), "runtime": str(rng.randint(70, 180)), "mpaa": rng.choice(_MPAA),
+	        "rating": rating, "watched": rng.random() < 0.6, "own": rng.random() < 0.2,
+	        "director": picked[:directors], "writer": picked[directors:directors + writers], "cast": picked[5:]}
+
+"""
+Turns a movie from makeMovie() into a tempMovie object, the way db_web.py would hand it to addMovieWithCredits().
+"""
+def toTempMovie(movie):
+	return tempMovie(movie["title"], [personName(p) for p in movie["director"]], [personName(p) for p in movie["writer"]],
+	                 [personName(p) for p in movie["cast"]], movie["year"], movie["runtime"], movie["mpaa"],
+	                 movie["rating"], movie["watched"], movie["own"])
+
+"""
+Escapes a value for PostgreSQL's COPY text format.
+"""
+def _copyValue(value):
+	return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+"""
+Writes rows to a table with COPY.
+"""
+def _copy(cur, table, columns, rows):
+	data = StringIO("".join(["\t".join([_copyValue(value) for value in row]) + "\n" for row in rows]))
+	cur.copy_from(data, table, columns=columns)
+
+"""
+Builds the rows of a library, batch movies at a time.
+@returns:
+	a generator of (array of PEOPLE rows, array of MOVIES rows, array of CREDITS rows, number of movies so far).
+	All the people come in the first batch, so the credits can point at them straight away.
+"""
+def _libraryRows(movies, seed, batch):
+	people = peopleCount(movies)
+	people_rows = [(p, personName(p)) for p in range(1, people + 1)]
+	for start in range(0, max(movies, 1), batch):
+		movie_rows = []
+		credit_rows = []
+		for index in range(start, min(start + batch, movies)):
+			movie = makeMovie(index, people, seed)
+			movie_id = index + 1
+			movie_rows.append((movie_id, movie["title"], movie["year"], movie["runtime"], movie["mpaa"], movie["rating"],
+			                   movie["watched"], movie["own"]))
+			for role in ("director", "writer", "cast"):
+				for person_id in movie[role]:
+					credit_rows.append((movie_id, person_id, "actor" if role == "cast" else role))
+		yield people_rows, movie_rows, credit_rows, min(start + batch, movies)
+		people_rows = []
+
+"""
+Fills an empty, fully migrated PostgreSQL database with a library. Rows go in with COPY, batch movies at a time,
+which is far quicker than adding them one by one through db_personal.py.
+The data is known to be good, so foreign key checks and the statistics triggers are switched off while it loads
+(this needs a superuser, like the postgres user the app logs in as), and the statistics are counted once at the end.
+@params:
+	conn:   psycopg2 connection to the benchmark db
+	movies: int, number of movies
+	seed:   int
+	batch:  int, movies per COPY
+	report: function called with the number of movies loaded so far after each batch, or None
+@returns:
+	a dictionary with the number of "movies", "people", and "credits" loaded
+"""
+def loadLibrary(conn, movies, seed=DEFAULT_SEED, batch=10000, report=None):
+	cur = conn.cursor()
+	cur.execute("SET session_replication_role = replica")
+	credits = 0
+	for people_rows, movie_rows, credit_rows, done in _libraryRows(movies, seed, batch):
+		_copy(cur, "PEOPLE", ("ID", "NAME"), people_rows)
+		_copy(cur, "MOVIES", ("ID", "TITLE", "YEAR", "RUNTIME", "MPAA", "RATING", "WATCHED", "OWN"), movie_rows)
+		_copy(cur, "CREDITS", ("M_ID", "P_ID", "ROLE"), credit_rows)
+		conn.commit()
+		credits += len(credit_rows)
+		if report is not None:
+			report(done)
+	#the ids were given explicitly, so the sequences have to be moved past them
+	cur.execute("SELECT setval('movies_id_seq', %s), setval('people_id_seq', %s)", (max(movies, 1), peopleCount(movies)))
+	cur.execute("SET session_replication_role = DEFAULT")
+	rebuildStats(cur)
+	cur.execute("ANALYZE")
+	conn.commit()
+	return {"movies": movies, "people": peopleCount(movies), "credits": credits}
+
+"""
+Fills an empty, fully migrated SQLite library file with a library (see loadLibrary()).
+Each batch is one transaction. The statistics triggers stay on, since SQLite runs them in-process anyway.
+@params:
+	conn: connection to the library file, from db_sqlite.connect()
+@returns:
+	a dictionary with the number of "movies", "people", and "credits" loaded
+"""
+def loadSqliteLibrary(conn, movies, seed=DEFAULT_SEED, batch=10000, report=None):
+	credits = 0
+	#the credits go into their indexes in no particular order, which is slow unless the indexes fit in memory
+	cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+	conn.execute("PRAGMA cache_size = -" + str(SQLITE_LOAD_CACHE_KB))
+	for people_rows, movie_rows, credit_rows, done in _libraryRows(movies, seed, batch):
+		conn.execute("BEGIN")
+		conn.executemany("INSERT INTO PEOPLE (ID, NAME) VALUES (?, ?)", people_rows)
+		conn.executemany("INSERT INTO MOVIES (ID,TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN) VALUES (?,?,?,?,?,?,?,?)", movie_rows)
+		conn.executemany("INSERT INTO CREDITS (M_ID, P_ID, ROLE) VALUES (?, ?, ?)", credit_rows)
+		conn.execute("COMMIT")
+		credits += len(credit_rows)
+		if report is not None:
+			report(done)
+	conn.execute("PRAGMA cache_size = " + str(cache_size))
+	conn.execute("ANALYZE")
+	return {"movies": movies, "people": peopleCount(movies), "credits": credits}
+
+"""
+Writes a library as the dataset files IMDb publishes (title.basics, title.ratings, title.crew, title.principals, and
+name.basics, gzipped), for db_mirror.py to import. Movie number i gets the IMDb id tt + (i + 1), like in fake_imdb.py.
+Every tenth movie also gets a TV episode after the movies, which the mirror leaves out unless asked not to.
+@params:
+	directory: string, the folder to write the files to
+	movies:    int, number of movies
+	seed:      int
+@returns:
+	an array of the paths written
+"""
+def writeDatasets(directory, movies, seed=DEFAULT_SEED):
+	people = peopleCount(movies)
+	episodes = range(movies + 1, movies + movies // 10 + 1)
+	files = {}
+	paths = []
+	headers = {"title.basics": "tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\truntimeMinutes\tgenres",
+	           "title.ratings": "tconst\taverageRating\tnumVotes",
+	           "title.crew": "tconst\tdirectors\twriters",
+	           "title.principals": "tconst\tordering\tnconst\tcategory\tjob\tcharacters",
+	           "name.basics": "nconst\tprimaryName\tbirthYear\tdeathYear\tprimaryProfession\tknownForTitles"}
+	for name in headers:
+		path = os.path.join(directory, name + ".tsv.gz")
+		files[name] = gzip.open(path, "wb", 1)
+		files[name].write(headers[name] + "\n")
+		paths.append(path)
+	nconst = lambda p: "nm%07d" % p
+	for index in range(movies):
+		movie = makeMovie(index, people, seed)
+		tconst = "tt%07d" % (index + 1)
+		files["title.basics"].write("\t".join([tconst, "movie", movie["title"], movie["title"], "0", movie["year"], "\\N",
+		                                       movie["runtime"], "Drama"]) + "\n")
+		files["title.ratings"].write(tconst + "\t" + str(random.Random(seed + index).randint(10, 99) / 10.0) + "\t" +
+		                             str(int(1000000 * random.Random(seed - index).random() ** 4)) + "\n")
+		files["title.crew"].write("\t".join([tconst, ",".join(map(nconst, movie["director"])),
+		                                     ",".join(map(nconst, movie["writer"]))]) + "\n")
+		billing = 1
+		for role in ("director", "cast"):
+			for person_id in movie[role][:10]:
+				category = "director" if role == "director" else ("actor" if person_id % 2 else "actress")
+				files["title.principals"].write("\t".join([tconst, str(billing), nconst(person_id), category, "\\N", "\\N"]) + "\n")
+				billing += 1
+	for number in episodes:
+		files["title.basics"].write("\t".join(["tt%07d" % number, "tvEpisode", "EPISODE #" + str(number), "EPISODE #" + str(number),
+		                                       "0", "2001", "\\N", "\\N", "\\N"]) + "\n")
+		files["title.principals"].write("\t".join(["tt%07d" % number, "1", nconst(1), "actor", "\\N", "\\N"]) + "\n")
+	for person_id in range(1, people + 1):
+		files["name.basics"].write("\t".join([nconst(person_id), personName(person_id), "\\N", "\\N", "actor", "\\N"]) + "\n")
+	for name in files:
+		files[name].close()
+	return paths
@@ -0,0 +1,108 @@
+"""
+mirror.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Times the local IMDb mirror (see db_mirror.py) against a made-up library.
+The library is written out as IMDb's dataset files by generator.py, which are then imported into a mirror of their own
+(MIRROR_BENCH, never the real one). This records how long the import took and how much memory it needed at most,
+then times searching and getting movies through db_web.py, first from the mirror and then from fake_imdb.py
+with the mirror turned off, the way it works without one. The results are written as JSON, like run.py's.
+
+Usage (from the project folder):
+	python -m benchmarks.mirror [--size 100k] [--seed 42] [--latency 0.1] [--runs 200] [--output FILE] [--compare OLD_FILE]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import db_mirror
+import db_web
+import db_webcache
+from benchmarks import generator
+from benchmarks.fake_imdb import FakeIMDb
+from benchmarks.run import compare, summarize, timeCalls
+
+MIRROR_BENCH = os.path.join(tempfile.gettempdir(), "mymdb_mirror_bench.sqlite")
+
+#calls made to the fake IMDb are far slower, so they are only made this many times
+IMDB_RUNS = 10
+
+"""
+The searches timed: whole titles, and the first two words of a title, which match many more.
+"""
+def searches(movies, people, seed, runs):
+	rng = random.Random(seed)
+	titles = [generator.makeMovie(rng.randrange(movies), people, seed)["title"] for i in range(runs + 1)]
+	return [title if i % 2 == 0 else " ".join(title.split()[:2]) for i, title in enumerate(titles)]
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the local IMDb mirror against a made-up library.")
+	parser.add_argument("--size", default="100k", help="library size: " + ", ".join(sorted(generator.SIZES)) + ", or a number of movies")
+	parser.add_argument("--seed", type=int, default=generator.DEFAULT_SEED, help="seed of the library and of the searches")
+	parser.add_argument("--latency", type=float, default=0.1, help="seconds each fake IMDb call takes")
+	parser.add_argument("--runs", type=int, default=200, help="number of searches and movies timed from the mirror")
+	parser.add_argument("--output", help="results file (default: mirror-SIZE-SEED.json)")
+	parser.add_argument("--compare", help="an earlier results file to compare with")
+	args = parser.parse_args()
+
+	movies = generator.SIZES.get(args.size.lower()) or int(args.size)
+	people = generator.peopleCount(movies)
+	directory = tempfile.mkdtemp(prefix="mymdb_datasets_")
+	try:
+		print "Writing the dataset files of " + str(movies) + " movies..."
+		paths = generator.writeDatasets(directory, movies, args.seed)
+		dataset_bytes = sum([os.path.getsize(path) for path in paths])
+		print "Importing them into " + MIRROR_BENCH + "..."
+		memory_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		start = time.time()
+		counts = db_mirror.importDatasets(directory, MIRROR_BENCH)
+		import_seconds = time.time() - start
+		memory_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	finally:
+		shutil.rmtree(directory)
+
+	db_mirror.MIRROR_PATH = MIRROR_BENCH
+	db_webcache.CACHE_ENABLED = False
+	db_web.IMDB_FACTORY = lambda: FakeIMDb(latency=args.latency, seed=args.seed, catalog=movies)
+	titles = searches(movies, people, args.seed, args.runs)
+	movie_ids = [result["id"] for result in [db_web.searchMovies(title)[0] for title in titles]]
+
+	print "Running scenarios..."
+	timings = {}
+	timings["searchMirror"] = timeCalls(db_web.searchMovies, [(title,) for title in titles])
+	timings["getMovieMirror"] = timeCalls(db_web.getMovie, [(movie_id,) for movie_id in movie_ids])
+	db_mirror.MIRROR_ENABLED = False
+	timings["searchImdb"] = timeCalls(db_web.searchMovies, [(title,) for title in titles[:IMDB_RUNS + 1]])
+	timings["getMovieImdb"] = timeCalls(db_web.getMovie, [(movie_id,) for movie_id in movie_ids[:IMDB_RUNS + 1]])
+
+	results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+	           "settings": {"movies": movies, "seed": args.seed, "latency": args.latency, "runs": args.runs},
+	           "environment": {"python": platform.python_version(), "platform": platform.platform()},
+	           "import": {"seconds": round(import_seconds, 3), "dataset_bytes": dataset_bytes,
+	                      "mirror_bytes": os.path.getsize(MIRROR_BENCH), "peak_memory_kb": memory_after,
+	                      "memory_growth_kb": memory_after - memory_before, "counts": counts},
+	           "scenarios": dict([(name, summarize(runs)) for name, runs in timings.items()])}
+	imported = results["import"]
+	print "  import: %.1f s, %.1f MB of dataset files -> %.1f MB mirror, memory grew by %.1f MB" % \
+	      (imported["seconds"], dataset_bytes / 1048576.0, imported["mirror_bytes"] / 1048576.0, imported["memory_growth_kb"] / 1024.0)
+	for name in sorted(results["scenarios"]):
+		summary = results["scenarios"][name]
+		print "  %-22s median %10.3f ms   p95 %10.3f ms   (%d runs)" % (name, summary["median_ms"], summary["p95_ms"], summary["runs"])
+
+	output = args.output or "mirror-" + args.size.lower() + "-" + str(args.seed) + ".json"
+	with open(output, "w") as f:
+		json.dump(results, f, indent=2, sort_keys=True)
+	print "Results written to " + output
+	if args.compare:
+		compare(results, args.compare)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,342 @@
+"""
+run.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Times the main myMDb entry points against a made-up library, and writes the results as JSON.
+The same scenarios run against either storage backend (--backend postgresql or sqlite, see db_backend.py),
+so the two can be compared. The benchmarks use their own database (BENCH_DB, or the BENCH_SQLITE file), never the
+real library, which is rebuilt from generator.py at the start of every run unless --reuse is given.
+IMDb is replaced by fake_imdb.py.
+Each scenario is run a number of times, and the mean, median, 95th percentile, min, and max are recorded in milliseconds.
+Give --compare an earlier results file to see how much each scenario got faster or slower.
+
+Usage (from the project folder):
+	python -m benchmarks.run [--backend postgresql|sqlite] [--size 1k|100k|1m|N] [--seed 42] [--latency 0.1]
+	                         [--cache] [--reuse] [--quick] [--output FILE] [--compare OLD_FILE]
+The PostgreSQL password is read from PGPASSWORD, or asked for (the SQLite backend doesn't need one).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from getpass import getpass
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import db_pool
+import db_sqlite
+
+BENCH_DB = "mymdb_bench"
+BENCH_SQLITE = os.path.join(tempfile.gettempdir(), "mymdb_bench.sqlite")
+
+#set before anything connects, so a benchmark can never touch the real library
+db_pool.DB_NAME = BENCH_DB
+db_sqlite.DB_PATH = BENCH_SQLITE
+
+try:
+	import imdb
+except ImportError:
+	#IMDbPY isn't needed here, since it is replaced by the fake anyway
+	from benchmarks import fake_imdb
+	sys.modules["imdb"] = fake_imdb
+
+import db_archive
+import db_async
+import db_backend
+import db_migrate
+import db_mirror
+import db_personal
+import db_setup
+import db_stats
+import db_web
+import db_webcache
+from benchmarks import generator
+from benchmarks.fake_imdb import FakeIMDb
+from temp_objects import tempMovie, tempPerson
+
+#how many times each scenario runs (--quick divides these by 10)
+RUNS = {"pullMovie": 20, "advancedSearch": 5, "addMovieWithCredits": 200, "addMovieTopBilled": 200, "concurrentAdds": 20,
+        "getMovies": 500, "portfolio": 500, "getMoviesToWatch": 5, "setRating": 500, "updateMovie": 500, "updateMovies": 50,
+        "exportLibrary": 5, "importLibrary": 5}
+
+#movies the concurrentAdds scenario adds at once (with db_async.py), per run
+CONCURRENT_ADDS = 16
+
+#seconds the advancedSearch scenario spends "reading" the first results before asking for the advanced search
+READING_SECONDS = 1.0
+
+"""
+A file-like object that throws away everything written to it, to keep the prints of pullMovie() out of the timings.
+"""
+class _Quiet(object):
+	def write(self, text):
+		pass
+
+	def flush(self):
+		pass
+
+"""
+Drops and recreates the benchmark database (or file), brings it up to the newest version, and loads a library into it.
+@returns:
+	a dictionary describing the library (see generator.loadLibrary()), with the "load_seconds" it took
+"""
+def buildLibrary(passw, movies, seed, backend):
+	report = lambda done: sys.stdout.write("\r  " + str(done) + "/" + str(movies) + " movies loaded")
+	if backend == "sqlite":
+		db_sqlite.closeDb()
+		for path in (BENCH_SQLITE, BENCH_SQLITE + "-wal", BENCH_SQLITE + "-shm"):
+			if os.path.exists(path):
+				os.remove(path)
+		db_sqlite.migrate()
+		start = time.time()
+		library = generator.loadSqliteLibrary(db_sqlite.connect(), movies, seed, report=report)
+	else:
+		conn = psycopg2.connect(database="postgres", user=db_pool.DB_USER, password=passw, host=db_pool.DB_HOST, port=db_pool.DB_PORT)
+		conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+		conn.cursor().execute("DROP DATABASE IF EXISTS " + BENCH_DB)
+		conn.close()
+		db_setup.createDb(passw)
+		db_migrate.migrate(passw)
+		conn = psycopg2.connect(database=BENCH_DB, user=db_pool.DB_USER, password=passw, host=db_pool.DB_HOST, port=db_pool.DB_PORT)
+		start = time.time()
+		library = generator.loadLibrary(conn, movies, seed, report=report)
+		conn.close()
+	print ""
+	library["load_seconds"] = round(time.time() - start, 3)
+	return library
+
+"""
+Deletes the movies past the end of the made-up library, i.e. the ones the addMovie* scenarios added.
+"""
+def _removeAdded(passw, movies):
+	if db_personal.BACKEND == "sqlite":
+		db_sqlite.connect().execute("DELETE FROM MOVIES WHERE ID > ?", (movies,))
+	else:
+		with db_pool.connection(passw) as conn:
+			conn.cursor().execute("DELETE FROM MOVIES WHERE ID > %s", (movies,))
+	db_personal.clearIdCaches()
+
+"""
+Stands in for db_web.chooseResult() in the pullMovie scenario: picks the first result instead of asking.
+"""
+def _pickFirst(s_title, movies, grab_all, results=None):
+	return movies[0] if movies else False
+
+"""
+Calls function once with each set of arguments, after one untimed warm-up call.
+@returns:
+	an array of how long each call took, in seconds
+"""
+def timeCalls(function, arg_list):
+	function(*arg_list[0])
+	timings = []
+	for args in arg_list:
+		start = time.time()
+		function(*args)
+		timings.append(time.time() - start)
+	return timings
+
+"""
+Runs a search the way a user who doesn't find their movie in the first results would: reads them for READING_SECONDS,
+asks for the (A)dvanced search, and picks the first of those.
+@returns:
+	an array of how long each advanced search took to show up after it was asked for, in seconds
+"""
+def timeAdvancedSearches(titles):
+	waits = []
+	asked = []
+	def choose(s_title, movies, grab_all, results=None):
+		if not grab_all:
+			time.sleep(READING_SECONDS)
+			asked.append(time.time())
+			return db_web.pullMovie(s_title, True, results)
+		waits.append(time.time() - asked[-1])
+		return movies[0] if movies else False
+	db_web.chooseResult = choose
+	for title in titles:
+		db_web.pullMovie(title, False)
+	return waits[1:]
+
+"""
+Turns the timings of a scenario into the numbers written to the results file.
+"""
+def summarize(timings):
+	ordered = sorted(timings)
+	ms = lambda seconds: round(seconds * 1000, 3)
+	return {"runs": len(ordered), "mean_ms": ms(sum(ordered) / len(ordered)), "median_ms": ms(ordered[len(ordered) // 2]),
+	        "p95_ms": ms(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]),
+	        "min_ms": ms(ordered[0]), "max_ms": ms(ordered[-1])}
+
+"""
+Runs every scenario.
+@params:
+	passw:   string, the password to access the db
+	library: dictionary describing the library, from buildLibrary()
+	seed:    int, used to pick which movies and people the scenarios ask for
+	runs:    dictionary of how many times to run each scenario, like RUNS
+@returns:
+	a dictionary of scenario name -> summary from summarize()
+"""
+def runScenarios(passw, library, seed, runs):
+	rng = random.Random(seed)
+	movies = library["movies"]
+	people = library["people"]
+	existing = [generator.makeMovie(rng.randrange(movies), people, seed) for i in range(max(runs.values()) + 1)]
+	results = {}
+
+	#pullMovie() searches and fetches from the (fake) IMDb, and the first result is picked instead of asking.
+	#The IMDb calls it makes, and how much data they bring back, are counted by db_stats.py
+	choose = db_web.chooseResult
+	db_web.chooseResult = _pickFirst
+	db_stats.MEASURE_SIZES = True
+	stdout = sys.stdout
+	sys.stdout = _Quiet()
+	try:
+		db_stats.setOperation("pullMovie")
+		results["pullMovie"] = timeCalls(db_web.pullMovie, [(movie["title"], False) for movie in existing[:runs["pullMovie"] + 1]])
+		imdb = db_stats.snapshot()["pullMovie"]
+		db_stats.setOperation(None)
+		#the first search is a warm-up, like timeCalls()
+		results["advancedSearch"] = timeAdvancedSearches([movie["title"] for movie in existing[:runs["advancedSearch"] + 1]])
+	finally:
+		sys.stdout = stdout
+		db_web.chooseResult = choose
+		db_stats.MEASURE_SIZES = False
+
+	#movies past the end of the library, so every one of them is new
+	new_movies = [generator.toTempMovie(generator.makeMovie(movies + i, people, seed)) for i in range(runs["addMovieWithCredits"] + 1)]
+	results["addMovieWithCredits"] = timeCalls(db_personal.addMovieWithCredits, [(movie, passw) for movie in new_movies])
+	#and then they are taken out again, so the library is the same for the next scenario (and a --reuse run)
+	_removeAdded(passw, movies)
+	#what the (A)dd menu does: the rest of each cast is queued for db_indexer.py, and goes again with its movie
+	results["addMovieTopBilled"] = timeCalls(db_personal.addMovieWithCredits, [(movie, passw, db_personal.TOP_BILLED)
+	                                                                           for movie in new_movies[:runs["addMovieTopBilled"] + 1]])
+	_removeAdded(passw, movies)
+	#several movies being added at the same time, like db_import.py does, to show how much they hold each other up
+	batches = [[generator.toTempMovie(generator.makeMovie(movies + i * CONCURRENT_ADDS + j, people, seed)) for j in range(CONCURRENT_ADDS)]
+	           for i in range(runs["concurrentAdds"] + 1)]
+	results["concurrentAdds"] = timeCalls(lambda batch: db_async.wait([db_async.addMovieWithCredits(movie, passw) for movie in batch]),
+	                                      [(batch,) for batch in batches])
+	_removeAdded(passw, movies)
+
+	results["getMovies"] = timeCalls(db_personal.getMovies, [(movie["title"], passw) for movie in existing[:runs["getMovies"] + 1]])
+
+	portfolio_people = [tempPerson(generator.personName(int(people * rng.random() ** 3) + 1), "actor")
+	                    for i in range(runs["portfolio"] + 1)]
+	results["portfolio"] = timeCalls(db_personal.portfolio, [(person, passw) for person in portfolio_people])
+
+	results["getMoviesToWatch"] = timeCalls(db_personal.getMoviesToWatch, [(passw,)] * runs["getMoviesToWatch"])
+
+	rated = [(tempMovie(movie["title"], None, None, None, movie["year"], None, None, None, None, None),
+	          str(rng.randint(1, 10)), passw) for movie in existing[:runs["setRating"] + 1]]
+	results["setRating"] = timeCalls(db_personal.setRating, rated)
+
+	#what the (U)pdate menu does: rating, watched, and own all at once, on a movie that came out of getMovies()
+	found = [db_personal.getMovies(movie["title"], passw)[0] for movie in existing[:runs["updateMovie"] + 1]]
+	results["updateMovie"] = timeCalls(db_personal.updateMovie, [(movie, passw, str(rng.randint(1, 10)), rng.random() < 0.5,
+	                                                               rng.random() < 0.5) for movie in found])
+
+	#every movie of a director marked as watched or not, alternating so there is always something to change
+	directors = [tempPerson(generator.personName(movie["director"][0]), "director") for movie in existing[:runs["updateMovies"] + 1]]
+	results["updateMovies"] = timeCalls(lambda person, watched: db_personal.updateMovies(passw, person=person, watched=watched),
+	                                    [(person, i % 2 == 0) for i, person in enumerate(directors)])
+
+	#a backup of the whole library with db_archive.py, and restoring it over the library it came from, so nothing changes
+	archive = os.path.join(tempfile.mkdtemp(prefix="mymdb-bench-"), "library.tar.gz")
+	try:
+		results["exportLibrary"] = timeCalls(db_archive.exportLibrary, [(archive, passw)] * runs["exportLibrary"])
+		results["importLibrary"] = timeCalls(db_archive.importLibrary, [(archive, passw, True)] * runs["importLibrary"])
+	finally:
+		if os.path.exists(archive):
+			os.remove(archive)
+		os.rmdir(os.path.dirname(archive))
+
+	summaries = dict([(name, summarize(timings)) for name, timings in results.items()])
+	#timeCalls() makes one more call than it times
+	searches = float(len(results["pullMovie"]) + 1)
+	summaries["pullMovie"]["imdb_calls"] = round(imdb["imdb"]["count"] / searches, 2)
+	summaries["pullMovie"]["imdb_kb"] = round(sum([calls["bytes"] for calls in imdb["imdb_bytes"].values()]) / 1024.0 / searches, 2)
+	return summaries
+
+"""
+Prints how the medians of this run compare with an earlier results file.
+"""
+def compare(results, old_path):
+	with open(old_path) as f:
+		old = json.load(f)
+	print "\nCompared with " + old_path + " (median, lower is better):"
+	for name in sorted(results["scenarios"]):
+		if name not in old.get("scenarios", {}):
+			continue
+		before = old["scenarios"][name]["median_ms"]
+		after = results["scenarios"][name]["median_ms"]
+		change = (after - before) / before * 100 if before else 0.0
+		print "  %-22s %10.3f ms -> %10.3f ms  (%+.1f%%)" % (name, before, after, change)
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark myMDb against a made-up library.")
+	parser.add_argument("--backend", choices=sorted(db_backend.BACKENDS), default=db_backend.BACKEND, help="storage backend")
+	parser.add_argument("--size", default="1k", help="library size: " + ", ".join(sorted(generator.SIZES)) + ", or a number of movies")
+	parser.add_argument("--seed", type=int, default=generator.DEFAULT_SEED, help="seed of the library and of the scenarios")
+	parser.add_argument("--latency", type=float, default=0.1, help="seconds each fake IMDb call takes")
+	parser.add_argument("--cache", action="store_true", help="let pullMovie() use the local IMDb cache")
+	parser.add_argument("--reuse", action="store_true", help="use the library left by the last run instead of rebuilding it")
+	parser.add_argument("--quick", action="store_true", help="run every scenario a tenth as many times")
+	parser.add_argument("--output", help="results file (default: bench-BACKEND-SIZE-SEED.json)")
+	parser.add_argument("--compare", help="an earlier results file to compare with")
+	args = parser.parse_args()
+
+	movies = generator.SIZES.get(args.size.lower()) or int(args.size)
+	db_personal.useBackend(args.backend)
+	passw = None
+	if args.backend != "sqlite":
+		passw = os.environ.get("PGPASSWORD") or getpass("Please enter your PostgreSQL password:")
+	runs = dict(RUNS)
+	if args.quick:
+		runs = dict([(name, max(count // 10, 1)) for name, count in runs.items()])
+
+	if args.reuse:
+		library = {"movies": movies, "people": generator.peopleCount(movies), "reused": True}
+	else:
+		print "Building a library of " + str(movies) + " movies in the " + (BENCH_SQLITE if args.backend == "sqlite" else BENCH_DB) + " database..."
+		library = buildLibrary(passw, movies, args.seed, args.backend)
+	library["seed"] = args.seed
+
+	db_web.IMDB_FACTORY = lambda: FakeIMDb(latency=args.latency, seed=args.seed, catalog=movies)
+	db_webcache.CACHE_ENABLED = args.cache
+	#the pullMovie scenario is about IMDb, so a local mirror (see db_mirror.py) mustn't answer for it
+	db_mirror.MIRROR_ENABLED = False
+	if args.backend == "sqlite":
+		server_version = "sqlite " + sqlite3.sqlite_version
+	else:
+		db_pool.initPool(passw)
+		conn = db_pool.getConn(passw)
+		server_version = conn.server_version
+		db_pool.putConn(conn)
+
+	print "Running scenarios..."
+	results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "library": library,
+	           "settings": {"backend": args.backend, "latency": args.latency, "cache": args.cache, "runs": runs},
+	           "environment": {"python": platform.python_version(), "postgres": server_version, "platform": platform.platform()},
+	           "scenarios": runScenarios(passw, library, args.seed, runs)}
+	for name in sorted(results["scenarios"]):
+		summary = results["scenarios"][name]
+		print "  %-22s median %10.3f ms   p95 %10.3f ms   (%d runs)" % (name, summary["median_ms"], summary["p95_ms"], summary["runs"])
+		if "imdb_calls" in summary:
+			print "  %-22s %.2f IMDb calls, %.2f KB per search" % ("", summary["imdb_calls"], summary["imdb_kb"])
+
+	output = args.output or "bench-" + args.backend + "-" + args.size.lower() + "-" + str(args.seed) + ".json"
+	with open(output, "w") as f:
+		json.dump(results, f, indent=2, sort_keys=True)
+	print "Results written to " + output
+	if args.compare:
+		compare(results, args.compare)
+
+if __name__ == "__main__":
+	main()
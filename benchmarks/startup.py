@@ -0,0 +1,151 @@
+"""
+startup.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Times how long myMDb takes to start: from a cold Python process to the first menu, with the password already entered.
+Every run is a brand new process, so nothing is left over from the run before it. For each one this records
+how long importing myMDb took, how long it took to get to the menu, how many connections were made to the
+PostgreSQL server on the way, how many of them were still open at the menu (the pool's own connections),
+and whether IMDbPY had been imported yet. The results are written as JSON, like run.py's.
+The runs use their own database (STARTUP_DB, or the STARTUP_SQLITE file), never the real library.
+The first run is not timed, since it creates the database.
+
+Usage (from the project folder):
+	python -m benchmarks.startup [--backend postgresql|sqlite] [--runs 20] [--output FILE] [--compare OLD_FILE]
+The PostgreSQL password is read from PGPASSWORD, or asked for (the SQLite backend doesn't need one).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+STARTUP_DB = "mymdb_startup"
+STARTUP_SQLITE = os.path.join(tempfile.gettempdir(), "mymdb_startup.sqlite")
+
+"""
+A file-like object that throws away everything written to it, to keep myMDb's prints out of the results.
+"""
+class _Quiet(object):
+	def write(self, text):
+		pass
+
+	def flush(self):
+		pass
+
+"""
+Starts myMDb in this process and stops it at the first menu, then prints what was measured as one line of JSON.
+This is what every run does, in a process of its own.
+@params:
+	backend: string, "postgresql" or "sqlite"
+"""
+def child(backend):
+	start = time.time()
+	connections = []
+	if backend != "sqlite":
+		#every connection the app makes, pooled or not, goes through psycopg2.connect()
+		import psycopg2
+		connect = psycopg2.connect
+		def countingConnect(*args, **kwargs):
+			conn = connect(*args, **kwargs)
+			connections.append(conn)
+			return conn
+		psycopg2.connect = countingConnect
+
+	import myMDb
+	imported = time.time()
+	at_menu = []
+	myMDb.getpass = lambda prompt: os.environ.get("PGPASSWORD", "")
+	myMDb.mainMenu = lambda passw: at_menu.append((time.time(), len([c for c in connections if not c.closed])))
+	stdout = sys.stdout
+	sys.stdout = _Quiet()
+	try:
+		myMDb.main()
+	except SystemExit:
+		pass
+	finally:
+		sys.stdout = stdout
+	menu_time, still_open = at_menu[0]
+	print json.dumps({"import_ms": round((imported - start) * 1000, 3), "to_menu_ms": round((menu_time - start) * 1000, 3),
+	                  "connections": len(connections), "open_at_menu": still_open, "imdb_imported": "imdb" in sys.modules})
+
+"""
+Runs myMDb up to the first menu in a new process.
+@returns:
+	the dictionary printed by child(), with the "wall_ms" the whole process took
+"""
+def runOnce(backend, env):
+	start = time.time()
+	process = subprocess.Popen([sys.executable, "-m", "benchmarks.startup", "--child", "--backend", backend],
+	                           stdout=subprocess.PIPE, env=env)
+	output = process.communicate()[0]
+	wall = time.time() - start
+	if process.returncode != 0:
+		raise RuntimeError("myMDb didn't start (exit code " + str(process.returncode) + ")")
+	result = json.loads(output.strip().splitlines()[-1])
+	result["wall_ms"] = round(wall * 1000, 3)
+	return result
+
+"""
+Prints how the medians of this run compare with an earlier results file.
+"""
+def compare(results, old_path):
+	with open(old_path) as f:
+		old = json.load(f)
+	print "\nCompared with " + old_path + " (median, lower is better):"
+	for name in sorted(results["timings"]):
+		if name not in old.get("timings", {}):
+			continue
+		before = old["timings"][name]["median_ms"]
+		after = results["timings"][name]["median_ms"]
+		change = (after - before) / before * 100 if before else 0.0
+		print "  %-12s %10.3f ms -> %10.3f ms  (%+.1f%%)" % (name, before, after, change)
+
+def main():
+	parser = argparse.ArgumentParser(description="Time how long myMDb takes to get to its first menu.")
+	parser.add_argument("--backend", choices=["postgresql", "sqlite"], default=os.environ.get("MYMDB_BACKEND", "postgresql"),
+	                    help="storage backend")
+	parser.add_argument("--runs", type=int, default=20, help="number of timed runs")
+	parser.add_argument("--output", help="results file (default: startup-BACKEND.json)")
+	parser.add_argument("--compare", help="an earlier results file to compare with")
+	parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+	if args.child:
+		child(args.backend)
+		return
+
+	from getpass import getpass
+	from benchmarks.run import summarize
+	env = dict(os.environ, MYMDB_BACKEND=args.backend, MYMDB_DB=STARTUP_DB, MYMDB_SQLITE=STARTUP_SQLITE)
+	if args.backend != "sqlite":
+		env["PGPASSWORD"] = os.environ.get("PGPASSWORD") or getpass("Please enter your PostgreSQL password:")
+
+	print "Starting myMDb " + str(args.runs) + " times..."
+	runOnce(args.backend, env)
+	runs = [runOnce(args.backend, env) for i in range(args.runs)]
+	results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+	           "settings": {"backend": args.backend, "runs": args.runs},
+	           "environment": {"python": platform.python_version(), "platform": platform.platform()},
+	           "timings": dict([(name, summarize([run[name] / 1000.0 for run in runs])) for name in ("import_ms", "to_menu_ms", "wall_ms")]),
+	           "connections": max([run["connections"] for run in runs]),
+	           "open_at_menu": max([run["open_at_menu"] for run in runs]),
+	           "imdb_imported": any([run["imdb_imported"] for run in runs])}
+	for name in ("import_ms", "to_menu_ms", "wall_ms"):
+		summary = results["timings"][name]
+		print "  %-12s median %10.3f ms   p95 %10.3f ms" % (name, summary["median_ms"], summary["p95_ms"])
+	print "  connections made: " + str(results["connections"]) + ", still open at the menu: " + str(results["open_at_menu"])
+	print "  IMDbPY imported before the menu: " + ("yes" if results["imdb_imported"] else "no")
+
+	output = args.output or "startup-" + args.backend + ".json"
+	with open(output, "w") as f:
+		json.dump(results, f, indent=2, sort_keys=True)
+	print "Results written to " + output
+	if args.compare:
+		compare(results, args.compare)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,583 @@
+"""
+db_aio.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+The asynchronous layer under the PostgreSQL backend (db_postgres.py), used for myMDb project.
+The db functions there are written once, as coroutines: generators that yield each statement they want run
+and are sent back its rows, like this:
+	@coroutine
+	def getMovieTitle(movie_id, passw):
+		rows = yield query("SELECT TITLE FROM MOVIES WHERE ID = %s", (movie_id,))
+		raise Return(rows[0][0])
+Python 2 has no asyncio, and trollius (its backport) isn't something the app depends on, so the coroutines follow
+trollius' conventions (yield to wait, raise Return(value) to return) but run on the small event loop in this module.
+A coroutine can be run two ways:
+	- by calling the function as usual. This is what db_personal.py hands out: the statements run one after another
+	  on a connection borrowed from db_pool.py, and the function returns the coroutine's value.
+	- with submit(), which returns a Future right away. Everything submitted runs on a single event-loop thread that
+	  drives up to AIO_CONNECTIONS of psycopg2's asynchronous connections (its own pool, apart from db_pool.py's)
+	  with select(), so hundreds of calls can be in flight at once without a thread for each. db_async.py uses this.
+A coroutine can call another one with yield, e.g. "movie_id = yield getMovieID.coroutine(g_movie, passw)",
+and the two share a connection and a transaction.
+Each call is one transaction, committed when the coroutine finishes (or yields COMMIT) and rolled back if anything fails.
+An error ends the whole call: it isn't handed back into the coroutine.
+"""
+import atexit
+import functools
+import inspect
+import select
+import socket
+import sys
+import threading
+import time
+import traceback
+import types
+from collections import deque
+from multiprocessing import TimeoutError
+import psycopg2
+from psycopg2.extensions import POLL_OK, POLL_READ, POLL_WRITE
+import db_pool
+import db_stats
+import db_statements as statements
+
+#most connections the event loop keeps open to the server. Calls past that many wait their turn, still on the one thread
+AIO_CONNECTIONS = 8
+
+#how long (in seconds) Future.get() waits for a call unless it's told otherwise.
+#Waiting with a timeout also keeps Ctrl-C working, which it doesn't in Python 2 with no timeout at all.
+RESULT_TIMEOUT = 600
+
+#seconds shutdown() waits for the event loop to stop
+STOP_TIMEOUT = 5
+
+#yielded by a coroutine to commit what it has done so far, e.g. before it caches the ids it has just inserted.
+#Anything it runs afterwards is in a new transaction.
+COMMIT = "COMMIT"
+
+"""
+Raised by a coroutine to finish with a value, since a Python 2 generator can't return one.
+"""
+class Return(Exception):
+	def __init__(self, value=None):
+		Exception.__init__(self)
+		self.value = value
+
+"""
+What a coroutine yields to run a statement.
+@params:
+	sql:    string, the statement, with %s (or %(name)s) placeholders
+	params: its parameters, or None
+"""
+def query(sql, params=None):
+	return ("query", sql, params)
+
+"""
+What a coroutine yields to run one of the prepared statements in db_statements.py.
+@params:
+	name:   string, a key of db_statements.STATEMENTS
+	params: tuple of the values for $1, $2, ...
+"""
+def prepared(name, params):
+	return ("prepared", name, params)
+
+"""
+The rows a statement returned (empty if it doesn't return any), which is what is sent back into the coroutine.
+rowcount is the number of rows it returned or changed, like a cursor's.
+"""
+class Rows(list):
+	def __init__(self, rows, rowcount):
+		list.__init__(self, rows)
+		self.rowcount = rowcount
+
+"""
+Steps through a coroutine and the coroutines it yields, each of which runs in its place until it finishes.
+"""
+class _Steps(object):
+	def __init__(self, coroutine):
+		self.stack = [coroutine]
+
+	"""
+	Sends a value into the coroutine, and runs it until it yields a statement or COMMIT, or finishes.
+	@returns:
+		(what it yielded, None), or (None, the value it finished with)
+	"""
+	def send(self, value):
+		while True:
+			try:
+				item = self.stack[-1].send(value)
+			except Return as done:
+				value = done.value
+			except StopIteration:
+				value = None
+			else:
+				if isinstance(item, types.GeneratorType):
+					self.stack.append(item)
+					value = None
+					continue
+				if item is None:
+					raise TypeError("a coroutine yielded None instead of a statement")
+				return item, None
+			self.stack.pop()
+			if self.stack == []:
+				return None, value
+
+"""
+Turns a coroutine function into a plain function that runs it and returns its value (see runSync()).
+The coroutine function itself is kept as .coroutine, for submit() and for other coroutines to yield.
+It has to take a passw argument, which is what the connection is opened with.
+"""
+def coroutine(function):
+	@functools.wraps(function)
+	def run(*args, **kwargs):
+		return runSync(function(*args, **kwargs), _passw(function, args, kwargs))
+	run.coroutine = function
+	return run
+
+"""
+Finds the passw argument of a call to a coroutine function.
+"""
+def _passw(function, args, kwargs):
+	if "passw" in kwargs:
+		return kwargs["passw"]
+	return args[inspect.getargspec(function).args.index("passw")]
+
+"""
+Runs a coroutine on the calling thread, on a connection borrowed from db_pool.py for as long as it takes.
+No connection is borrowed if the coroutine finishes without running anything, e.g. when its answer was cached.
+@params:
+	coroutine: a generator from a coroutine function
+	passw:     string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	the coroutine's value
+"""
+def runSync(coroutine, passw):
+	steps = _Steps(coroutine)
+	item, value = steps.send(None)
+	if item is None:
+		return value
+	with db_pool.connection(passw) as conn:
+		cur = conn.cursor()
+		while item is not None:
+			if item is COMMIT:
+				conn.commit()
+				item, value = steps.send(None)
+				continue
+			kind, sql, params = item
+			if kind == "prepared":
+				statements.execute(cur, sql, params)
+			else:
+				cur.execute(sql, params)
+			rows = []
+			if cur.description is not None:
+				rows = cur.fetchall()
+			item, value = steps.send(Rows(rows, cur.rowcount))
+	return value
+
+"""
+The result of a call started with submit(). Like multiprocessing's AsyncResult, get() gives the value
+or raises whatever the call raised.
+"""
+class Future(object):
+	def __init__(self):
+		self._done = threading.Event()
+		self._lock = threading.Lock()
+		self._value = None
+		self._error = None
+		self._callbacks = []
+
+	"""
+	Sets the value (or error) and runs the callbacks. Only the event loop (or submit()) calls this.
+	"""
+	def _finish(self, value, error=None):
+		with self._lock:
+			self._value = value
+			self._error = error
+			self._done.set()
+			callbacks = self._callbacks
+			self._callbacks = []
+		for callback in callbacks:
+			_callback(callback, self)
+
+	"""
+	Calls callback with this Future once the call is done: right away if it already is,
+	otherwise on the event-loop thread, so it should be quick.
+	"""
+	def addCallback(self, callback):
+		with self._lock:
+			if not self._done.is_set():
+				self._callbacks.append(callback)
+				return
+		_callback(callback, self)
+
+	def ready(self):
+		return self._done.is_set()
+
+	"""
+	@returns:
+		True if the call is done and didn't raise anything
+	"""
+	def successful(self):
+		return self._done.is_set() and self._error is None
+
+	def wait(self, timeout=RESULT_TIMEOUT):
+		self._done.wait(timeout)
+
+	"""
+	Waits for the call and returns its value, or raises what it raised.
+	@params:
+		timeout: seconds to wait before raising multiprocessing.TimeoutError
+	"""
+	def get(self, timeout=RESULT_TIMEOUT):
+		if not self._done.wait(timeout):
+			raise TimeoutError()
+		if self._error is not None:
+			raise self._error
+		return self._value
+
+"""
+Calls a Future's callback, printing anything it raises instead of letting it stop the event loop.
+"""
+def _callback(callback, future):
+	try:
+		callback(future)
+	except Exception:
+		traceback.print_exc(file=sys.stderr)
+
+"""
+A submitted call: its coroutine, the statement it is waiting to run, and its Future.
+"""
+class _Task(object):
+	def __init__(self, steps, item, future):
+		self.steps = steps
+		self.item = item
+		self.future = future
+		self.queued = time.time()
+
+"""
+One of the event loop's asynchronous connections, and the call it is running.
+"""
+class _Connection(object):
+	def __init__(self, passw):
+		self.conn = psycopg2.connect(database=db_pool.DB_NAME, user=db_pool.DB_USER, password=passw,
+		                             host=db_pool.DB_HOST, port=db_pool.DB_PORT, async_=1)
+		self.cursor = None
+		self.prepared = set()
+		self.task = None
+		self.connecting = True
+		self.in_transaction = False
+		self.rolling_back = False
+		#what poll() last asked to wait for: POLL_READ, POLL_WRITE, or None when nothing has been sent
+		self.waiting = POLL_WRITE
+		#called with this connection once what was sent has finished
+		self.done = None
+		#(statement, params, when it was sent), for db_stats.py
+		self.sent = None
+
+"""
+Makes the pair of connected sockets another thread uses to wake the event loop out of select().
+"""
+def _wakeSockets():
+	if hasattr(socket, "socketpair"):
+		reader, writer = socket.socketpair()
+	else:
+		#Windows has no socketpair() in Python 2
+		listener = socket.socket()
+		listener.bind(("127.0.0.1", 0))
+		listener.listen(1)
+		writer = socket.create_connection(listener.getsockname())
+		reader = listener.accept()[0]
+		listener.close()
+	reader.setblocking(0)
+	writer.setblocking(0)
+	return reader, writer
+
+"""
+The event loop: one thread, a queue of calls waiting for a connection, and the connections running the rest.
+"""
+class _Loop(object):
+	def __init__(self, passw):
+		self.passw = passw
+		self.lock = threading.Lock()
+		self.queue = deque()
+		self.connections = []
+		self.idle = []
+		self.stopping = False
+		self.wake_reader, self.wake_writer = _wakeSockets()
+		self.thread = threading.Thread(target=self._run, name="mymdb-aio")
+		self.thread.daemon = True
+		self.thread.start()
+
+	"""
+	Queues a call and wakes the loop. This is the only method other threads call, besides stop().
+	"""
+	def submit(self, task):
+		with self.lock:
+			if self.stopping:
+				task.future._finish(None, RuntimeError("the db event loop has been stopped"))
+				return
+			self.queue.append(task)
+		self._wake()
+
+	def _wake(self):
+		try:
+			self.wake_writer.send("x")
+		except socket.error:
+			#the socket's buffer is full, so the loop is going to wake up anyway
+			pass
+
+	"""
+	Stops the loop, failing the calls still queued, and closes its connections.
+	"""
+	def stop(self, timeout=STOP_TIMEOUT):
+		with self.lock:
+			self.stopping = True
+		self._wake()
+		self.thread.join(timeout)
+
+	def _run(self):
+		while True:
+			with self.lock:
+				if self.stopping:
+					break
+			self._assign()
+			readers = [self.wake_reader]
+			writers = []
+			for connection in self.connections:
+				if connection.waiting == POLL_READ:
+					readers.append(connection.conn)
+				elif connection.waiting == POLL_WRITE:
+					writers.append(connection.conn)
+			readable, writable = select.select(readers, writers, [])[:2]
+			if self.wake_reader in readable:
+				try:
+					self.wake_reader.recv(4096)
+				except socket.error:
+					pass
+			for connection in list(self.connections):
+				if connection.conn in readable or connection.conn in writable:
+					self._poll(connection)
+		error = RuntimeError("the db event loop has been stopped")
+		with self.lock:
+			queued = list(self.queue)
+			self.queue.clear()
+		for task in queued + [connection.task for connection in self.connections if connection.task is not None]:
+			task.future._finish(None, error)
+		for connection in self.connections:
+			connection.conn.close()
+		self.wake_reader.close()
+		self.wake_writer.close()
+
+	"""
+	Hands queued calls to idle connections, and opens more connections (up to AIO_CONNECTIONS) for the ones left over.
+	"""
+	def _assign(self):
+		while self.idle != []:
+			with self.lock:
+				if not self.queue:
+					return
+				task = self.queue.popleft()
+			connection = self.idle.pop()
+			db_stats.recordAcquire(time.time() - task.queued)
+			connection.task = task
+			self._runItem(connection, task.item)
+		with self.lock:
+			waiting = len(self.queue)
+		opening = len([connection for connection in self.connections if connection.connecting])
+		while opening < waiting and len(self.connections) < AIO_CONNECTIONS:
+			try:
+				connection = _Connection(self.passw)
+			except psycopg2.Error as e:
+				if self.connections == []:
+					self._failQueued(e)
+				return
+			connection.done = self._connected
+			self.connections.append(connection)
+			opening += 1
+
+	def _connected(self, connection):
+		connection.connecting = False
+		connection.cursor = connection.conn.cursor()
+		self.idle.append(connection)
+
+	"""
+	Fails every queued call, when there's no connection left to run them on.
+	"""
+	def _failQueued(self, error):
+		with self.lock:
+			queued = list(self.queue)
+			self.queue.clear()
+		for task in queued:
+			task.future._finish(None, error)
+
+	"""
+	Lets psycopg2 move a connection along, and calls its done function once what was sent has finished.
+	"""
+	def _poll(self, connection):
+		try:
+			state = connection.conn.poll()
+		except Exception as e:
+			self._fail(connection, e)
+			return
+		if state == POLL_OK:
+			connection.waiting = None
+			done = connection.done
+			connection.done = None
+			done(connection)
+		else:
+			connection.waiting = state
+
+	"""
+	Sends a statement on a connection without waiting for it. done is called with the connection once it has finished.
+	"""
+	def _send(self, connection, sql, params, done, recorded=None):
+		connection.done = done
+		connection.sent = (recorded, params, time.time())
+		try:
+			connection.cursor.execute(sql, params)
+		except Exception as e:
+			self._fail(connection, e)
+			return
+		self._poll(connection)
+
+	"""
+	Runs what a call yielded: a statement (preparing it first if need be) or COMMIT.
+	The first statement of each transaction is sent with its BEGIN, so that doesn't take a round trip of its own.
+	"""
+	def _runItem(self, connection, item):
+		if item is COMMIT:
+			if connection.in_transaction:
+				self._send(connection, "COMMIT", None, self._committed)
+			else:
+				self._step(connection, None)
+			return
+		kind, sql, params = item
+		if kind == "prepared":
+			if sql not in connection.prepared:
+				name = sql
+				def preparedDone(connection):
+					connection.prepared.add(name)
+					self._runItem(connection, item)
+				self._send(connection, statements.prepareSQL(name), None, preparedDone)
+				return
+			sql = statements.executeSQL(sql, params)
+		sent = sql
+		if not connection.in_transaction:
+			connection.in_transaction = True
+			sent = "BEGIN; " + sql
+		self._send(connection, sent, params, self._statementDone, sql)
+
+	def _statementDone(self, connection):
+		statement, params, sent = connection.sent
+		cur = connection.cursor
+		db_stats.recordQuery(statement, params, time.time() - sent, cur.rowcount)
+		rows = []
+		if cur.description is not None:
+			rows = cur.fetchall()
+		self._step(connection, Rows(rows, cur.rowcount))
+
+	def _committed(self, connection):
+		connection.in_transaction = False
+		self._step(connection, None)
+
+	"""
+	Sends a value into a connection's call and runs whatever it yields next, or commits and finishes it.
+	"""
+	def _step(self, connection, value):
+		try:
+			item, result = connection.task.steps.send(value)
+		except Exception as e:
+			self._fail(connection, e)
+			return
+		if item is not None:
+			self._runItem(connection, item)
+		elif connection.in_transaction:
+			self._send(connection, "COMMIT", None, lambda connection: self._finish(connection, result))
+		else:
+			self._finish(connection, result)
+
+	def _finish(self, connection, result):
+		task = connection.task
+		connection.task = None
+		connection.in_transaction = False
+		self.idle.append(connection)
+		task.future._finish(result)
+
+	"""
+	Fails a connection's call with error, then rolls the connection back and puts it back to work,
+	or throws it away if it's broken (or couldn't even connect).
+	"""
+	def _fail(self, connection, error):
+		task = connection.task
+		connection.task = None
+		connection.done = None
+		connection.waiting = None
+		if task is not None:
+			task.future._finish(None, error)
+		if connection.conn.closed or connection.connecting or connection.rolling_back:
+			self.connections.remove(connection)
+			try:
+				connection.conn.close()
+			except psycopg2.Error:
+				pass
+			if self.connections == []:
+				self._failQueued(error)
+		elif connection.in_transaction:
+			connection.in_transaction = False
+			connection.rolling_back = True
+			self._send(connection, "ROLLBACK", None, self._rolledBack)
+		else:
+			self.idle.append(connection)
+
+	def _rolledBack(self, connection):
+		connection.rolling_back = False
+		self.idle.append(connection)
+
+_loops = [None]
+_lock = threading.Lock()
+
+"""
+Returns the event loop, starting it the first time.
+"""
+def _loop(passw):
+	with _lock:
+		if _loops[0] is None:
+			_loops[0] = _Loop(passw)
+		return _loops[0]
+
+"""
+Stops the event loop. This is registered to run when the program exits.
+Calls that haven't finished yet fail with a RuntimeError.
+"""
+def shutdown():
+	with _lock:
+		loop = _loops[0]
+		_loops[0] = None
+	if loop is not None:
+		loop.stop()
+
+atexit.register(shutdown)
+
+"""
+Starts a call to a coroutine function on the event loop.
+The coroutine runs up to its first statement right away, on the calling thread, so a call whose answer is
+cached is done before this returns.
+@params:
+	function: a function made by coroutine()
+	args:     its arguments, which have to include passw
+@returns:
+	a Future; its get() gives the return value
+"""
+def submit(function, *args, **kwargs):
+	future = Future()
+	try:
+		steps = _Steps(function.coroutine(*args, **kwargs))
+		item, value = steps.send(None)
+	except Exception as e:
+		future._finish(None, e)
+		return future
+	if item is None:
+		future._finish(value)
+	else:
+		_loop(_passw(function.coroutine, args, kwargs)).submit(_Task(steps, item, future))
+	return future
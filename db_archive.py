@@ -0,0 +1,512 @@
+"""
+db_archive.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Backs up a whole myMDb library to a single file, and restores it, e.g. to move it to another machine.
+An archive is a gzipped tar file. Its first member is manifest.json, which records the ARCHIVE_VERSION, the format
+the tables are in, and each table's columns and number of rows. Then comes one member per table in TABLES, in that order.
+The tables can be in one of three formats:
+	copy:  PostgreSQL's COPY text format (the default). The quickest to write and read back.
+	csv:   CSV with a header row, for spreadsheets and other tools. Empty fields are NULL.
+	jsonl: one JSON object per row, keyed by column name.
+Archives from either storage backend (see db_backend.py) can be restored into either one.
+The statistics tables aren't archived, since they are counted again after a restore. Neither is PENDING_CREDITS:
+credits still waiting in it are stored (see db_indexer.py) before a library is exported.
+
+With PostgreSQL, tables go in and out through COPY. Nothing is ever held in memory whole: each table is streamed to a
+temporary file and then into the archive, and read back from the archive straight into the db.
+A restore happens in a single transaction, so if anything goes wrong the library is left as it was. The indexes and
+constraints of the tables are dropped first and rebuilt once all the data is in, which is far quicker than
+keeping them up to date row by row, and rebuilding them checks the restored data just the same.
+
+Usage:
+	python db_archive.py export library.tar.gz [--format copy|csv|jsonl]
+	python db_archive.py import library.tar.gz [--replace]
+"""
+import argparse
+import csv
+import json
+import re
+import tarfile
+import tempfile
+import time
+from getpass import getpass
+import db_indexer
+import db_migrate
+import db_personal
+import db_pool
+import db_sqlite
+
+#the layout of the archive itself. Archives made by a newer version of the app than this can't be restored
+ARCHIVE_VERSION = 1
+
+ARCHIVE_FORMATS = ("copy", "csv", "jsonl")
+
+#(table, columns) of everything a library is made of, in the order they are archived and restored
+TABLES = [("MOVIES", ["ID", "TITLE", "YEAR", "RUNTIME", "MPAA", "RATING", "WATCHED", "OWN"]),
+          ("PEOPLE", ["ID", "NAME"]),
+          ("CREDITS", ["ID", "M_ID", "P_ID", "ROLE"])]
+_BOOLEANS = set(["WATCHED", "OWN"])
+
+#gzip level of the archive. Anything above 1 makes export several times slower for a slightly smaller file
+COMPRESS_LEVEL = 1
+
+#bytes read from the archive at a time, and rows fetched per round trip when writing JSONL from PostgreSQL
+READ_SIZE = 1024 * 1024
+FETCH_SIZE = 5000
+
+#memory PostgreSQL may use for each index it rebuilds after a restore, and for counting the statistics again
+RESTORE_WORK_MEM = "256MB"
+
+#kilobytes of memory SQLite may use to cache the library file during a restore, so the whole load fits in one transaction
+RESTORE_CACHE_KB = 512 * 1024
+
+_COPY_OPTIONS = {"copy": "", "csv": " WITH (FORMAT csv, HEADER)"}
+_UNESCAPE = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r", "b": "\b", "f": "\f", "v": "\v"}
+
+"""
+The name of a table's member in an archive, e.g. "movies.copy".
+"""
+def memberName(table, archive_format):
+	return table.lower() + "." + archive_format
+
+"""
+Writes every table to an archive, once any credits still waiting in PENDING_CREDITS have been stored.
+@params:
+	path:           string, the archive to write
+	passw:          string, the password to access the db (ignored by the SQLite backend)
+	archive_format: string, one of ARCHIVE_FORMATS
+@returns:
+	the manifest written to the archive
+"""
+def exportLibrary(path, passw, archive_format="copy"):
+	if archive_format not in ARCHIVE_FORMATS:
+		raise ValueError("Unknown archive format '" + archive_format + "', expected one of: " + ", ".join(ARCHIVE_FORMATS))
+	db_indexer.drain(passw)
+	spooled = []
+	try:
+		if db_personal.BACKEND == "sqlite":
+			schema_version = _exportSqlite(archive_format, spooled)
+		else:
+			schema_version = _exportPostgres(passw, archive_format, spooled)
+		manifest = {"archive_version": ARCHIVE_VERSION, "format": archive_format, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		            "backend": db_personal.BACKEND, "schema_version": schema_version,
+		            "tables": [{"name": table, "columns": columns, "rows": rows, "member": memberName(table, archive_format)}
+		                       for table, columns, rows, data in spooled]}
+		with tarfile.open(path, "w:gz", compresslevel=COMPRESS_LEVEL) as tar:
+			data = tempfile.TemporaryFile()
+			data.write(json.dumps(manifest, indent=2, sort_keys=True))
+			spooled.insert(0, ("manifest", None, None, data))
+			for table, columns, rows, data in spooled:
+				info = tarfile.TarInfo(memberName(table, archive_format) if columns else "manifest.json")
+				info.size = data.tell()
+				info.mtime = time.time()
+				data.seek(0)
+				tar.addfile(info, data)
+	finally:
+		for table, columns, rows, data in spooled:
+			data.close()
+	return manifest
+
+"""
+Streams each table out of PostgreSQL into a temporary file. Every table is read from the same snapshot,
+so the archive is consistent even if movies are being added at the same time.
+@params:
+	spooled: array that (table, columns, number of rows, temporary file) is added to for each table
+@returns:
+	the database's version (see db_migrate.py)
+"""
+def _exportPostgres(passw, archive_format, spooled):
+	with db_pool.connection(passw) as conn:
+		cur = conn.cursor()
+		cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+		schema_version = db_migrate.currentVersion(cur)
+		for table, columns in TABLES:
+			data = tempfile.TemporaryFile()
+			spooled.append((table, columns, None, data))
+			if archive_format == "jsonl":
+				rows_cur = conn.cursor("archive_" + table.lower())
+				rows_cur.itersize = FETCH_SIZE
+				rows_cur.execute("SELECT " + ", ".join(columns) + " FROM " + table)
+				rows = _writeJsonl(data, columns, rows_cur)
+				rows_cur.close()
+			else:
+				cur.copy_expert("COPY " + table + " (" + ", ".join(columns) + ") TO STDOUT" + _COPY_OPTIONS[archive_format], data)
+				rows = cur.rowcount
+			spooled[-1] = (table, columns, rows, data)
+	return schema_version
+
+"""
+Streams each table out of the SQLite library file into a temporary file, all from the same snapshot (see _exportPostgres()).
+@returns:
+	the file's version (see db_sqlite.MIGRATIONS)
+"""
+def _exportSqlite(archive_format, spooled):
+	conn = db_sqlite.connect()
+	conn.execute("BEGIN")
+	try:
+		schema_version = conn.execute("PRAGMA user_version").fetchone()[0]
+		for table, columns in TABLES:
+			data = tempfile.TemporaryFile()
+			spooled.append((table, columns, None, data))
+			rows_cur = conn.execute("SELECT " + ", ".join(columns) + " FROM " + table)
+			if archive_format == "jsonl":
+				rows = _writeJsonl(data, columns, rows_cur)
+			else:
+				line = _copyLine if archive_format == "copy" else _csvLine
+				if archive_format == "csv":
+					data.write(",".join(columns).lower() + "\n")
+				rows = 0
+				for row in rows_cur:
+					data.write(line(row))
+					rows += 1
+			spooled[-1] = (table, columns, rows, data)
+	finally:
+		conn.execute("COMMIT")
+	return schema_version
+
+"""
+Writes rows as JSONL, one object per row.
+@returns:
+	the number of rows written
+"""
+def _writeJsonl(data, columns, rows_cur):
+	rows = 0
+	for row in rows_cur:
+		data.write(json.dumps(dict(zip(columns, row)), separators=(",", ":")) + "\n")
+		rows += 1
+	return rows
+
+"""
+Turns a row into a line of COPY's text format, the way PostgreSQL writes it.
+"""
+def _copyLine(row):
+	values = []
+	for value in row:
+		if value is None:
+			values.append("\\N")
+		elif value is True or value is False:
+			values.append("t" if value else "f")
+		else:
+			values.append(str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r"))
+	return "\t".join(values) + "\n"
+
+"""
+Turns a row into a line of CSV, the way PostgreSQL writes it.
+"""
+def _csvLine(row):
+	values = []
+	for value in row:
+		if value is None:
+			values.append("")
+		elif value is True or value is False:
+			values.append("t" if value else "f")
+		elif isinstance(value, (int, long)):
+			values.append(str(value))
+		else:
+			values.append('"' + str(value).replace('"', '""') + '"')
+	return ",".join(values) + "\n"
+
+"""
+Restores a library from an archive made by exportLibrary().
+@params:
+	path:    string, the archive to read
+	passw:   string, the password to access the db (ignored by the SQLite backend)
+	replace: boolean, whether to replace a library that already has movies in it. Without it,
+	         the library has to be empty
+@returns:
+	the manifest of the archive
+"""
+def importLibrary(path, passw, replace=False):
+	try:
+		tar = tarfile.open(path, "r|*")
+	except tarfile.ReadError:
+		raise ValueError(path + " isn't a myMDb archive")
+	with tar:
+		members = iter(tar)
+		first = next(members, None)
+		if first is None or first.name != "manifest.json":
+			raise ValueError(path + " isn't a myMDb archive")
+		manifest = json.load(tar.extractfile(first))
+		if manifest.get("archive_version", ARCHIVE_VERSION + 1) > ARCHIVE_VERSION:
+			raise ValueError(path + " was made by a newer version of myMDb (archive version " + str(manifest.get("archive_version")) + ")")
+		if manifest["format"] not in ARCHIVE_FORMATS:
+			raise ValueError(path + " is in an unknown format '" + str(manifest["format"]) + "'")
+		tables = dict([(table["member"], table) for table in manifest["tables"]])
+		#every member is handed over as it comes out of the archive, without being unpacked anywhere first
+		streams = ((tables[member.name], tar.extractfile(member)) for member in members if member.name in tables)
+		if db_personal.BACKEND == "sqlite":
+			_importSqlite(manifest["format"], streams, replace)
+		else:
+			_importPostgres(passw, manifest["format"], streams, replace)
+	db_personal.clearIdCaches()
+	return manifest
+
+"""
+Checks that a table came out of the archive whole.
+"""
+def _checkRows(table, rows):
+	if rows != table["rows"]:
+		raise ValueError("Expected " + str(table["rows"]) + " rows in " + table["name"] + " but the archive had " + str(rows))
+
+"""
+Loads the tables into PostgreSQL in one transaction: empties them, drops their indexes and constraints,
+COPYs the data in, rebuilds the indexes and constraints, and counts the statistics again.
+@params:
+	streams: iterator of (table from the manifest, file to read it from)
+@returns:
+	an array of the names of the tables that were loaded
+"""
+def _importPostgres(passw, archive_format, streams, replace):
+	names = [table.lower() for table, columns in TABLES]
+	loaded = []
+	with db_pool.connection(passw) as conn:
+		cur = conn.cursor()
+		_checkEmpty(cur, replace)
+		cur.execute("SET LOCAL maintenance_work_mem = '" + RESTORE_WORK_MEM + "'")
+		cur.execute("SET LOCAL work_mem = '" + RESTORE_WORK_MEM + "'")
+		cur.execute("TRUNCATE MOVIES, PEOPLE, CREDITS, PERSON_STATS, PENDING_CREDITS")
+		rebuild = _dropIndexes(cur, names + ["person_stats"])
+		for name in names:
+			cur.execute("ALTER TABLE " + name + " DISABLE TRIGGER USER")
+		for table, data in streams:
+			columns = ", ".join(table["columns"])
+			if archive_format == "jsonl":
+				data = _CopyReader(_copyLine(_jsonRow(line, table["columns"], False)) for line in _lines(data))
+			cur.copy_expert("COPY " + table["name"] + " (" + columns + ") FROM STDIN" + _COPY_OPTIONS.get(archive_format, ""), data)
+			_checkRows(table, cur.rowcount)
+			loaded.append(table["name"])
+		_checkComplete(loaded)
+		#the ids came from the archive, so the sequences have to be moved past them
+		for name in names:
+			cur.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(max(ID), 0) + 1, false) FROM " + name, (name,))
+		#PERSON_STATS is counted while its indexes and foreign key are still down too
+		db_migrate.rebuildStats(cur)
+		for statement in rebuild:
+			cur.execute(statement)
+		for name in names:
+			cur.execute("ALTER TABLE " + name + " ENABLE TRIGGER USER")
+		cur.execute("ANALYZE MOVIES, PEOPLE, CREDITS, PERSON_STATS")
+	return loaded
+
+"""
+Makes sure there is no library to overwrite, unless replace is True.
+"""
+def _checkEmpty(cur, replace):
+	cur.execute("SELECT EXISTS (SELECT 1 FROM MOVIES) OR EXISTS (SELECT 1 FROM PEOPLE)")
+	if cur.fetchone()[0] and not replace:
+		raise ValueError("The library isn't empty. Restoring an archive would replace everything in it (use --replace)")
+
+"""
+Makes sure every table was in the archive.
+"""
+def _checkComplete(loaded):
+	missing = [table for table, columns in TABLES if table not in loaded]
+	if missing != []:
+		raise ValueError("The archive is missing " + ", ".join(missing))
+
+"""
+Drops the indexes and constraints of some tables, along with the foreign keys of other tables that point at them.
+@params:
+	cur:    cursor with a transaction open
+	tables: array of (lowercase) table names
+@returns:
+	an array of the statements that build them all again, in an order that works
+"""
+def _dropIndexes(cur, tables):
+	cur.execute("SELECT conrelid::regclass::text, quote_ident(conname), pg_get_constraintdef(oid), contype FROM pg_constraint " +
+	            "WHERE contype IN ('p', 'u', 'f') AND (conrelid = ANY(%s::regclass[]) OR confrelid = ANY(%s::regclass[])) " +
+	            "ORDER BY contype = 'f' DESC", (tables, tables))
+	constraints = cur.fetchall()
+	cur.execute("SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = ANY(%s::regclass[]) " +
+	            "AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = indexrelid AND contype IN ('p', 'u', 'x'))", (tables,))
+	indexes = cur.fetchall()
+	for table, name, definition, kind in constraints:
+		cur.execute("ALTER TABLE " + table + " DROP CONSTRAINT " + name)
+	for name, definition in indexes:
+		cur.execute("DROP INDEX " + name)
+	#keys first, since the foreign keys need them
+	return ["ALTER TABLE " + table + " ADD CONSTRAINT " + name + " " + definition for table, name, definition, kind in reversed(constraints)] + \
+	       [definition for name, definition in indexes]
+
+"""
+Loads the tables into the SQLite library file in one transaction, the same way as _importPostgres().
+The indexes and statistics triggers are dropped while the rows go in, and foreign keys are checked once at the end.
+"""
+def _importSqlite(archive_format, streams, replace):
+	conn = db_sqlite.connect()
+	names = [table for table, columns in TABLES]
+	loaded = []
+	cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+	conn.execute("PRAGMA cache_size = -" + str(RESTORE_CACHE_KB))
+	conn.execute("PRAGMA foreign_keys=OFF")
+	conn.execute("BEGIN IMMEDIATE")
+	try:
+		_checkEmpty(conn.cursor(), replace)
+		rebuild = conn.execute("SELECT type, name, sql FROM sqlite_master WHERE type IN ('index', 'trigger') AND sql IS NOT NULL " +
+		                       "AND tbl_name IN (" + ", ".join(["?"] * len(names)) + ")", names).fetchall()
+		for kind, name, sql in rebuild:
+			conn.execute("DROP " + kind.upper() + " " + name)
+		for name in names + ["PERSON_STATS", "PENDING_CREDITS"]:
+			conn.execute("DELETE FROM " + name)
+		for table, data in streams:
+			columns = table["columns"]
+			rows = _sqliteRows(archive_format, data, columns)
+			cur = conn.executemany("INSERT INTO " + table["name"] + " (" + ", ".join(columns) + ") VALUES (" +
+			                       ", ".join(["?"] * len(columns)) + ")", rows)
+			_checkRows(table, cur.rowcount)
+			loaded.append(table["name"])
+		_checkComplete(loaded)
+		for kind, name, sql in rebuild:
+			conn.execute(sql)
+		if conn.execute("PRAGMA foreign_key_check").fetchone() is not None:
+			raise ValueError("The archive has credits for movies or people that aren't in it")
+		db_sqlite.rebuildStats(conn)
+		conn.execute("COMMIT")
+	except:
+		conn.execute("ROLLBACK")
+		raise
+	finally:
+		conn.execute("PRAGMA foreign_keys=ON")
+		conn.execute("PRAGMA cache_size = " + str(cache_size))
+	conn.execute("ANALYZE")
+	return loaded
+
+"""
+Reads the rows of a table out of the archive, ready to be inserted into SQLite.
+@returns:
+	a generator of tuples, in the order of columns
+"""
+def _sqliteRows(archive_format, data, columns):
+	lines = _lines(data)
+	if archive_format == "jsonl":
+		return (_jsonRow(line, columns, True) for line in lines)
+	booleans = [i for i, column in enumerate(columns) if column in _BOOLEANS]
+	if archive_format == "csv":
+		rows = csv.reader(lines)
+		next(rows, None)
+		return (_booleans([value if value != "" else None for value in row], booleans) for row in rows)
+	return (_booleans(_copyRow(line), booleans) for line in lines)
+
+"""
+Reads a line of COPY's text format.
+@returns:
+	an array of strings (or None)
+"""
+def _copyRow(line):
+	values = line[:-1].split("\t")
+	if "\\" in line:
+		return [_copyValue(value) for value in values]
+	return values
+
+"""
+Reads a value of COPY's text format.
+"""
+def _copyValue(value):
+	if value == "\\N":
+		return None
+	if "\\" in value:
+		return re.sub(r"\\(.)", lambda found: _UNESCAPE.get(found.group(1), found.group(1)), value)
+	return value
+
+"""
+Turns the booleans of a row, written as text, into the 1 and 0 SQLite stores them as. Everything else can stay text,
+since SQLite turns text into a number by itself when it goes in a column of numbers, like the ids.
+@params:
+	values:   array of strings (or None)
+	booleans: array of the positions of the boolean columns
+"""
+def _booleans(values, booleans):
+	for i in booleans:
+		if values[i] is not None:
+			values[i] = 1 if values[i] in ("t", "true", "1") else 0
+	return values
+
+"""
+Reads a row of JSONL.
+@params:
+	line:     string
+	columns:  array of column names, the order the values are given back in
+	integers: boolean, whether booleans are given back as 1 and 0 (for SQLite) instead of True and False
+"""
+def _jsonRow(line, columns, integers):
+	row = json.loads(line)
+	values = []
+	for column in columns:
+		value = row.get(column)
+		if isinstance(value, unicode):
+			value = value.encode("utf-8")
+		elif integers and isinstance(value, bool):
+			value = int(value)
+		values.append(value)
+	return tuple(values)
+
+"""
+Reads a file line by line, READ_SIZE bytes at a time. Each line keeps its newline.
+"""
+def _lines(data):
+	rest = ""
+	while True:
+		block = data.read(READ_SIZE)
+		if not block:
+			break
+		lines = (rest + block).split("\n")
+		rest = lines.pop()
+		for line in lines:
+			yield line + "\n"
+	if rest:
+		yield rest + "\n"
+
+"""
+A file-like object that COPY ... FROM STDIN can read from, made from a generator of lines.
+"""
+class _CopyReader(object):
+	def __init__(self, lines):
+		self.lines = lines
+		self.rest = ""
+
+	def read(self, size=READ_SIZE):
+		if size is None or size < 0:
+			size = READ_SIZE
+		chunks = [self.rest]
+		total = len(self.rest)
+		if total < size:
+			for line in self.lines:
+				chunks.append(line)
+				total += len(line)
+				if total >= size:
+					break
+		data = "".join(chunks)
+		self.rest = data[size:]
+		return data[:size]
+
+	def readline(self, size=-1):
+		return self.read(size)
+
+def main():
+	parser = argparse.ArgumentParser(description="Back up a myMDb library to a file, or restore it from one.")
+	parser.add_argument("action", choices=["export", "import"])
+	parser.add_argument("path", help="the archive, e.g. library.tar.gz")
+	parser.add_argument("--format", choices=ARCHIVE_FORMATS, default="copy", help="how tables are written (export only)")
+	parser.add_argument("--replace", action="store_true", help="replace a library that isn't empty (import only)")
+	args = parser.parse_args()
+
+	passw = None
+	if db_personal.BACKEND == "sqlite":
+		db_sqlite.migrate()
+	else:
+		passw = getpass("Please enter your PostgreSQL password:")
+		with db_pool.connection(passw) as conn:
+			db_migrate.migrate(passw, conn)
+	start = time.time()
+	if args.action == "export":
+		manifest = exportLibrary(args.path, passw, args.format)
+	else:
+		manifest = importLibrary(args.path, passw, args.replace)
+	print ("Exported " if args.action == "export" else "Restored ") + \
+	      ", ".join([str(table["rows"]) + " " + table["name"].lower() for table in manifest["tables"]]) + \
+	      " in " + ("%.1f" % (time.time() - start)) + " seconds."
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,182 @@
+"""
+db_async.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Non-blocking versions of the db_personal.py functions, used for myMDb project.
+Each function here takes the same arguments as the db_personal.py function of the same name, but starts the work
+in the background and returns right away with a handle to the result:
+	result = db_async.getMovies("JAWS", passw)
+	...do something else, like fetching from IMDb...
+	found_movies = result.get()
+result.get() gives back whatever the db_personal.py function returned, or raises whatever it raised.
+With the PostgreSQL backend the functions are coroutines, and they all run on db_aio.py's event loop: one thread
+and psycopg2's asynchronous connections, so hundreds of calls can be in flight at once while the calling thread
+carries on. The handle is then a db_aio.Future.
+Anything else (every function of the SQLite backend, which has no asynchronous driver) runs on a small pool of
+threads instead, borrowing connections like everything else does, and the handle is a multiprocessing AsyncResult.
+Both kinds have the same get(timeout) and ready().
+"""
+import atexit
+import threading
+from multiprocessing.pool import ThreadPool
+import db_personal
+
+#number of threads for the calls that can't run on the event loop. This is kept below db_pool.POOL_MAX
+#so the calling thread (or the streaming functions) can still get a connection while they run.
+ASYNC_WORKERS = 6
+
+#how long (in seconds) wait() waits on a single result before giving up.
+#Waiting with a timeout also keeps Ctrl-C working, which it doesn't in Python 2 with no timeout at all.
+RESULT_TIMEOUT = 600
+
+_workers = [None]
+_lock = threading.Lock()
+
+"""
+Returns the thread pool the calls run on, starting it the first time.
+"""
+def _threads():
+	with _lock:
+		if _workers[0] is None:
+			_workers[0] = ThreadPool(ASYNC_WORKERS)
+		return _workers[0]
+
+"""
+Stops the worker threads. This is registered to run when the program exits.
+Calls that are still waiting to start are dropped.
+"""
+def shutdown():
+	with _lock:
+		if _workers[0] is not None:
+			_workers[0].terminate()
+			_workers[0] = None
+
+atexit.register(shutdown)
+
+"""
+Starts any function in the background: on the event loop if it is a coroutine (see db_aio.py), on a worker thread if not.
+@params:
+	function: the function to call
+	args:     its arguments
+	callback: optional function that is called (on the loop or a worker thread) with the return value once it is done.
+	          It isn't called if the function raised.
+@returns:
+	a db_aio.Future or an AsyncResult; either one's get() gives the return value
+"""
+def submit(function, *args, **kwargs):
+	callback = kwargs.get("callback")
+	if not hasattr(function, "coroutine"):
+		return _threads().apply_async(function, args, callback=callback)
+	#only PostgreSQL functions are coroutines, so db_aio.py (and psycopg2) is already loaded by now
+	import db_aio
+	result = db_aio.submit(function, *args)
+	if callback is not None:
+		result.addCallback(lambda done: done.successful() and callback(done.get(0)))
+	return result
+
+"""
+Waits for several results and returns their values, in the same order.
+If one of the calls raised an exception, it is raised here.
+@params:
+	results: array of results from this module
+	timeout: how many seconds to wait on each result
+"""
+def wait(results, timeout=RESULT_TIMEOUT):
+	return [result.get(timeout) for result in results]
+
+"""
+Adds a movie to MOVIES (see db_personal.addMovie()).
+"""
+def addMovie(new_movie, passw):
+	return submit(db_personal.addMovie, new_movie, passw)
+
+"""
+Adds a movie with all of its people and credits (see db_personal.addMovieWithCredits()).
+"""
+def addMovieWithCredits(new_movie, passw, top_billed=None):
+	return submit(db_personal.addMovieWithCredits, new_movie, passw, top_billed)
+
+"""
+Adds a person to PEOPLE (see db_personal.addPerson()).
+"""
+def addPerson(new_person, passw):
+	return submit(db_personal.addPerson, new_person, passw)
+
+"""
+Adds a credit for a person and movie (see db_personal.addRole()).
+"""
+def addRole(amovie, aperson, passw):
+	return submit(db_personal.addRole, amovie, aperson, passw)
+
+"""
+Searches for movies with a matching title (see db_personal.getMovies()).
+"""
+def getMovies(title, passw):
+	return submit(db_personal.getMovies, title, passw)
+
+"""
+Gets several movies by their ids (see db_personal.getMoviesByIds()).
+"""
+def getMoviesByIds(movie_ids, passw):
+	return submit(db_personal.getMoviesByIds, movie_ids, passw)
+
+"""
+Gets the movies a person worked on in their role (see db_personal.portfolio()).
+"""
+def portfolio(person, passw):
+	return submit(db_personal.portfolio, person, passw)
+
+"""
+Gets every movie a person worked on, in any role (see db_personal.filmography()).
+"""
+def filmography(name, passw):
+	return submit(db_personal.filmography, name, passw)
+
+"""
+Gets all movies the user hasn't watched (see db_personal.getMoviesToWatch()).
+"""
+def getMoviesToWatch(passw):
+	return submit(db_personal.getMoviesToWatch, passw)
+
+"""
+Checks whether a movie is in the db (see db_personal.hasMovie()).
+"""
+def hasMovie(h_movie, passw):
+	return submit(db_personal.hasMovie, h_movie, passw)
+
+"""
+Checks whether a person is in the db in their role (see db_personal.hasPerson()).
+"""
+def hasPerson(h_person, passw):
+	return submit(db_personal.hasPerson, h_person, passw)
+
+"""
+Changes a movie's rating, watched, and/or own flags (see db_personal.updateMovie()).
+"""
+def updateMovie(u_movie, passw, rating=None, watched=None, own=None):
+	return submit(db_personal.updateMovie, u_movie, passw, rating, watched, own)
+
+"""
+Changes the flags of a whole set of movies (see db_personal.updateMovies()).
+"""
+def updateMovies(passw, movie_ids=None, person=None, rating=None, watched=None, own=None):
+	return submit(db_personal.updateMovies, passw, movie_ids, person, rating, watched, own)
+
+"""
+Changes a movie's rating, or clears it when rating is None (see db_personal.setRating()).
+"""
+def setRating(r_movie, rating, passw):
+	return submit(db_personal.setRating, r_movie, rating, passw)
+
+"""
+Marks a movie as owned or not (see db_personal.setOwn()).
+"""
+def setOwn(o_movie, own, passw):
+	return submit(db_personal.setOwn, o_movie, own, passw)
+
+"""
+Marks a movie as watched or not (see db_personal.setWatched()).
+"""
+def setWatched(w_movie, watched, passw):
+	return submit(db_personal.setWatched, w_movie, watched, passw)
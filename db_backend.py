@@ -0,0 +1,177 @@
+"""
+db_backend.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+What the storage backends of the myMDb project have in common.
+db_personal.py hands every call on to one backend: db_postgres.py (a PostgreSQL server, the default)
+or db_sqlite.py (a single file, no server needed). Each backend provides every function in FUNCTIONS,
+with the same arguments and return values, so the rest of the app doesn't know or care which one it is using.
+The settings and helpers both backends use live here.
+"""
+import os
+import threading
+from collections import OrderedDict
+from temp_objects import *
+
+#which backend db_personal.py uses, "postgresql" or "sqlite". MYMDB_BACKEND picks it
+BACKEND = os.environ.get("MYMDB_BACKEND", "postgresql")
+
+#backend name -> the module that implements it
+BACKENDS = {"postgresql": "db_postgres", "sqlite": "db_sqlite"}
+
+#every function a backend has to provide
+FUNCTIONS = ["addPerson", "addMovie", "addRole", "addMovieWithCredits",
+             "getMovies", "getMoviesByIds", "portfolio", "iterPortfolio", "portfolioPage", "filmography",
+             "getMoviesToWatch", "iterMoviesToWatch", "getMoviesToWatchPage", "getLibraryStats",
+             "fuzzyMovies", "fuzzyPeople", "hasMovie", "hasPerson", "getMovieID", "getPersonID",
+             "updateMovie", "updateMovies", "setRating", "setOwn", "setWatched", "idCacheStats", "clearIdCaches",
+             "indexPendingCredits", "creditQueueStatus", "isFullyIndexed"]
+
+#most entries each of the id caches will hold before the least recently used ones are dropped
+ID_CACHE_SIZE = 10000
+
+#rows fetched per round trip by the iter* functions, and movies per page for the *Page functions
+STREAM_BATCH_SIZE = 500
+PAGE_SIZE = 20
+
+#the rating to pass to updateMovie() or updateMovies() to take a movie's rating away (None leaves it as it is).
+#setRating(movie, None) does the same
+CLEAR_RATING = ""
+
+#most matches fuzzyMovies() and fuzzyPeople() hand back
+FUZZY_LIMIT = 10
+
+#number of people getLibraryStats() lists for each role
+STATS_TOP = 5
+
+#rows of LIBRARY_STATS_DELTA getLibraryStats() lets pile up before it folds them into LIBRARY_STATS
+STATS_COMPACT_ROWS = 1000
+
+#cast members stored right away when a movie is added with a top_billed limit, MYMDB_TOP_BILLED changes it.
+#the rest of the cast waits in PENDING_CREDITS for db_indexer.py
+TOP_BILLED = int(os.environ.get("MYMDB_TOP_BILLED", "15"))
+
+#most movies, and roughly the most credits, indexPendingCredits() stores in one transaction
+QUEUE_BATCH = 50
+QUEUE_BATCH_CREDITS = 2000
+
+"""
+A small, thread safe LRU cache used to remember the ids of movies and people so the same lookup
+doesn't have to go to the server over and over again (addRole, for example, looks up every credit).
+Only ids that have been committed to the db are ever stored, and counts of hits and misses are kept
+so the size can be tuned.
+@params:
+	size: int, most entries the cache will hold
+"""
+class IdCache:
+	def __init__(self, size):
+		self.size = size
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.lock = threading.Lock()
+
+	"""
+	Returns the id stored for key, or None if it isn't cached.
+	"""
+	def get(self, key):
+		with self.lock:
+			value = self.entries.pop(key, None)
+			if value is None:
+				self.misses += 1
+				return None
+			self.entries[key] = value
+			self.hits += 1
+			return value
+
+	"""
+	Stores an id, dropping the least recently used entry if the cache is full.
+	"""
+	def put(self, key, value):
+		with self.lock:
+			self.entries.pop(key, None)
+			self.entries[key] = value
+			if len(self.entries) > self.size:
+				self.entries.popitem(last=False)
+
+	"""
+	Forgets the id stored for key, if there is one.
+	"""
+	def invalidate(self, key):
+		with self.lock:
+			self.entries.pop(key, None)
+
+	"""
+	Forgets everything and resets the counters.
+	"""
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+			self.hits = 0
+			self.misses = 0
+
+	"""
+	Returns a dictionary with the number of entries, hits, and misses.
+	"""
+	def stats(self):
+		with self.lock:
+			return {"entries": len(self.entries), "size": self.size, "hits": self.hits, "misses": self.misses}
+
+"""
+Gives the ROLE a person's credits are stored under in CREDITS.
+Anything that isn't an actor or director is treated as a writer.
+@params:
+	person: tempPerson object
+@returns:
+	"actor", "director", or "writer"
+"""
+def personType(person):
+	if person.p_type == "actor" or person.p_type == "director":
+		return person.p_type
+	return "writer"
+
+"""
+Turns a movie's directors, writers, and cast into the parallel arrays of (uppercased) names and roles
+that addMovieWithCredits() stores, in billing order.
+@params:
+	new_movie: tempMovie object
+@returns:
+	(array of names, array of roles)
+"""
+def creditLists(new_movie):
+	names = []
+	roles = []
+	for p_type, people in (("director", new_movie.director), ("writer", new_movie.writer), ("actor", new_movie.cast)):
+		for name in people or []:
+			names.append(name.upper())
+			roles.append(p_type)
+	return names, roles
+
+"""
+Splits the names and roles from creditLists() into what is stored when a movie is added and what is queued
+for later: every director and writer, and the first top_billed cast members, are stored right away.
+@params:
+	names:      array of names, in billing order
+	roles:      array of roles, in the same order
+	top_billed: int, cast members stored right away, or None to store everyone right away
+@returns:
+	(names now, roles now, names later, roles later)
+"""
+def splitCredits(names, roles, top_billed):
+	if top_billed is None:
+		return names, roles, [], []
+	cut = len(roles) - roles.count("actor") + max(top_billed, 0)
+	return names[:cut], roles[:cut], names[cut:], roles[cut:]
+
+"""
+Turns a (TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN) row into a tempMovie object with no people.
+"""
+def simpleMovie(row):
+	return tempMovie(row[0], None, None, None, row[1], str(row[2]), row[3], str(row[4]), str(row[5]), str(row[6]))
+
+"""
+Escapes what the user typed so it is matched literally by LIKE ... ESCAPE '\\', and adds the % that makes it a prefix.
+"""
+def likePrefix(text):
+	return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
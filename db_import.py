@@ -0,0 +1,280 @@
+"""
+db_import.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Adds a whole list of movies to the myMDb database at once, without going through the menus in myMDb.py.
+The list is a CSV file (with a header row) or a JSONL file (one JSON object per line). Each entry needs a 'title',
+and can also have a 'year', 'rating', 'watched', and 'own'. Instead of asking the user to pick from the search results,
+a match policy picks the movie automatically:
+	first: the top search result
+	year:  the top search result from the entry's year (the top result if the entry has no year)
+	exact: the only search result with exactly the entry's title (and year, if given)
+
+Searching IMDb is by far the slowest part, so several worker threads fetch movies at the same time while the
+main thread hands whatever they have finished to db_async.py, which writes several movies to the db at once. Every title that is done is written to a checkpoint file,
+so an import that gets interrupted can simply be run again and will pick up where it left off.
+Titles that couldn't be matched or fetched are listed in a report file at the end.
+
+Usage:
+	python db_import.py my_movies.csv [--policy year] [--workers 8] [--checkpoint FILE] [--report FILE] [--stats]
+"""
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from Queue import Queue
+from getpass import getpass
+import db_async
+import db_personal
+import db_sqlite
+import db_stats
+from db_web import getMovie, searchMovies
+
+MATCH_POLICIES = ("first", "year", "exact")
+
+#number of threads fetching from IMDb at the same time
+FETCH_WORKERS = 8
+
+#a progress line is printed every time this many titles have been handled
+PROGRESS_EVERY = 25
+
+"""
+Reads the entries to import.
+@params:
+	path: string, path to a .csv or .jsonl file
+@returns:
+	an array of dictionaries with lowercase keys, one per entry that has a title
+"""
+def readTitles(path):
+	rows = []
+	with open(path, "rb") as f:
+		if path.lower().endswith(".jsonl") or path.lower().endswith(".json"):
+			entries = (json.loads(line) for line in f if line.strip())
+		else:
+			entries = csv.DictReader(f)
+		for entry in entries:
+			row = {}
+			for key, value in entry.items():
+				if isinstance(value, unicode):
+					value = value.encode("utf-8")
+				if key is not None:
+					row[key.strip().lower()] = value
+			if row.get("title"):
+				rows.append(row)
+	return rows
+
+"""
+The key an entry is stored under in the checkpoint file.
+"""
+def rowKey(row):
+	return row["title"].strip() + "\t" + str(row.get("year") or "").strip()
+
+"""
+Interprets a yes/no column. Blank or missing counts as no.
+"""
+def _yes(value):
+	return str(value).strip().upper() in ("Y", "YES", "TRUE", "T", "1")
+
+"""
+Picks which search result an entry refers to, following the match policy.
+@params:
+	row:     dictionary, the entry being imported
+	results: array of search results from db_web.searchMovies(), in IMDb's ranking order
+	policy:  string, one of MATCH_POLICIES
+@returns:
+	(the chosen result, None) if a result was picked
+	(None, string describing the problem) if not
+"""
+def chooseMatch(row, results, policy):
+	if not results:
+		return None, "not found"
+	year = str(row.get("year") or "").strip()
+	if policy == "first":
+		return results[0], None
+	if policy == "year":
+		if not year:
+			return results[0], None
+		for result in results:
+			if str(result.get('year')) == year:
+				return result, None
+		return None, "ambiguous: no result from " + year
+	title = row["title"].strip().decode("utf-8", "replace").upper()
+	matches = [result for result in results if (result.get('title') or "").upper() == title and
+	           (not year or str(result.get('year')) == year)]
+	if len(matches) == 1:
+		return matches[0], None
+	if matches == []:
+		return None, "ambiguous: no exact match"
+	return None, "ambiguous: " + str(len(matches)) + " exact matches"
+
+"""
+Body of each fetch thread: takes entries off the jobs queue, resolves and fetches them from IMDb,
+and puts (row, tempMovie or None, problem or None) on the done queue. A None job means stop.
+"""
+def _fetchWorker(jobs, done, policy):
+	while True:
+		row = jobs.get()
+		if row is None:
+			break
+		try:
+			match, problem = chooseMatch(row, searchMovies(row["title"]), policy)
+			if match is None:
+				done.put((row, None, problem))
+			else:
+				done.put((row, getMovie(match["id"]), None))
+		except Exception as e:
+			done.put((row, None, "failed: " + str(e)))
+
+"""
+Puts every entry on the jobs queue, then one stop signal per worker.
+The queue is bounded, so this only runs a little ahead of the workers.
+"""
+def _feed(jobs, rows, workers):
+	for row in rows:
+		jobs.put(row)
+	for i in range(workers):
+		jobs.put(None)
+
+"""
+Reads the keys of entries that a previous run already finished.
+"""
+def _readCheckpoint(path):
+	finished = set()
+	try:
+		with open(path, "rb") as f:
+			for line in f:
+				if line.strip():
+					finished.add(line.rstrip("\r\n"))
+	except IOError:
+		pass
+	return finished
+
+"""
+Records how an entry turned out: counts it, lists it in the report if there was a problem,
+and checkpoints it unless it failed because of an error.
+@params:
+	row:     dictionary, the entry
+	result:  AsyncResult of the db write for the entry, or None if there was nothing to write
+	problem: string describing why there was nothing to write, or None
+"""
+def _record(row, result, problem, counts, checkpoint, report, report_file):
+	if result is not None:
+		try:
+			if result.get(db_async.RESULT_TIMEOUT):
+				counts["added"] += 1
+			else:
+				counts["already in db"] += 1
+		except Exception as e:
+			problem = "failed: " + str(e)
+	if problem is not None:
+		counts[problem.split(":")[0]] += 1
+		report.writerow([row["title"], row.get("year") or "", problem])
+		report_file.flush()
+	if problem is None or not problem.startswith("failed"):
+		checkpoint.write(rowKey(row) + "\n")
+		checkpoint.flush()
+
+"""
+Prints a progress line.
+"""
+def _progress(handled, total, counts, start):
+	elapsed = max(time.time() - start, 0.001)
+	print "  " + str(handled) + "/" + str(total) + " titles, %.1f titles/sec, " % (handled / elapsed) + \
+	      str(handled - counts["added"] - counts["already in db"]) + " problem(s)"
+
+"""
+Imports every entry in a file that isn't in the checkpoint yet.
+Entries that couldn't be matched (not found or ambiguous) are checkpointed too, since running them again won't help.
+Entries that failed because of an error (e.g. a network problem) are not, so the next run tries them again.
+@params:
+	path:            string, the .csv or .jsonl file to import
+	passw:           string, the password to access the db
+	policy:          string, one of MATCH_POLICIES
+	workers:         int, number of fetch threads
+	checkpoint_path: string, file that finished entries are recorded in
+	report_path:     string, file that problem entries are listed in (as CSV)
+@returns:
+	a dictionary counting the entries that were "added", "already in db", "ambiguous", "not found", and "failed"
+"""
+def importTitles(path, passw, policy, workers, checkpoint_path, report_path):
+	finished = _readCheckpoint(checkpoint_path)
+	rows = [row for row in readTitles(path) if rowKey(row) not in finished]
+	counts = {"added": 0, "already in db": 0, "ambiguous": 0, "not found": 0, "failed": 0}
+	print str(len(finished)) + " titles were already done in an earlier run, " + str(len(rows)) + " to go."
+	if rows == []:
+		return counts
+
+	jobs = Queue(workers * 4)
+	done = Queue(workers * 4)
+	threads = [threading.Thread(target=_feed, args=(jobs, rows, workers))]
+	for i in range(workers):
+		threads.append(threading.Thread(target=_fetchWorker, args=(jobs, done, policy)))
+	for thread in threads:
+		thread.daemon = True
+		thread.start()
+
+	start = time.time()
+	new_report = not os.path.exists(report_path)
+	with open(checkpoint_path, "ab") as checkpoint, open(report_path, "ab") as report_file:
+		report = csv.writer(report_file)
+		if new_report:
+			report.writerow(["title", "year", "problem"])
+		#writes that have been started but not recorded yet: (row, AsyncResult), oldest first
+		writing = []
+		handled = 0
+		for count in range(len(rows)):
+			row, movie, problem = done.get()
+			outcomes = []
+			if movie is None:
+				outcomes.append((row, None, problem))
+			else:
+				movie.rating = str(row.get("rating") or "n/a")
+				movie.watched = _yes(row.get("watched"))
+				movie.own = _yes(row.get("own"))
+				writing.append((row, db_async.addMovieWithCredits(movie, passw)))
+			#pick up every write that is done, waiting on the oldest once too many are in flight (or at the end)
+			while writing != [] and (writing[0][1].ready() or len(writing) >= db_async.ASYNC_WORKERS or count == len(rows) - 1):
+				row, result = writing.pop(0)
+				outcomes.append((row, result, None))
+			for row, result, problem in outcomes:
+				_record(row, result, problem, counts, checkpoint, report, report_file)
+				handled += 1
+				if handled % PROGRESS_EVERY == 0 or handled == len(rows):
+					_progress(handled, len(rows), counts, start)
+	return counts
+
+def main():
+	parser = argparse.ArgumentParser(description="Add a list of movies to the myMDb database.")
+	parser.add_argument("path", help="a .csv (with a header row) or .jsonl file of titles")
+	parser.add_argument("--policy", choices=MATCH_POLICIES, default="year", help="how to pick between search results")
+	parser.add_argument("--workers", type=int, default=FETCH_WORKERS, help="number of IMDb fetches to run at once")
+	parser.add_argument("--checkpoint", help="file recording finished titles (default: PATH.done)")
+	parser.add_argument("--report", help="file listing titles that need attention (default: PATH.report.csv)")
+	parser.add_argument("--stats", action="store_true", help="list the queries and IMDb calls made at the end (see db_stats.py)")
+	args = parser.parse_args()
+
+	passw = None
+	if db_personal.BACKEND == "sqlite":
+		db_sqlite.migrate()
+	else:
+		#psycopg2 is only needed (and maybe only installed) for PostgreSQL
+		import db_migrate
+		import db_pool
+		passw = getpass("Please enter your PostgreSQL password:")
+		#the same migrations myMDb.py runs, so a new (or older) database has the tables the import writes to
+		with db_pool.connection(passw) as conn:
+			db_migrate.migrate(passw, conn)
+	db_stats.setOperation("import")
+	counts = importTitles(args.path, passw, args.policy, max(args.workers, 1),
+	                      args.checkpoint or args.path + ".done", args.report or args.path + ".report.csv")
+	print "\nDone. " + ", ".join([str(counts[key]) + " " + key for key in sorted(counts)])
+	if counts["ambiguous"] + counts["not found"] + counts["failed"] > 0:
+		print "Titles that need attention are listed in " + (args.report or args.path + ".report.csv")
+	if args.stats:
+		db_stats.report()
+
+if __name__ == "__main__":
+	main()
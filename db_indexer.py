@@ -0,0 +1,169 @@
+"""
+db_indexer.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Stores the rest of the cast of movies that were added with only their top billed people, used for myMDb project.
+addStuff() in myMDb.py adds a movie with addMovieWithCredits(..., top_billed=TOP_BILLED): the directors, writers,
+and leading cast are stored right away, and the rest of the cast goes in the PENDING_CREDITS table in the same
+transaction (see db_postgres.py). A worker thread started here takes those out again a batch at a time with
+indexPendingCredits(), so a big ensemble cast no longer keeps the user waiting.
+Since the queue is a table in the library itself, nothing is lost if the app stops or crashes: whatever wasn't stored
+yet is still there, and the worker picks it up the next time it starts. isFullyIndexed() tells whether a movie
+still has credits waiting, and status() how far behind the worker is.
+The worker's queries are counted under an operation of their own, INDEXER_OPERATION, instead of under whatever menu
+action is running at the time (see db_stats.py).
+
+Usage (stores everything in the queue, or shows how much is in it):
+	python db_indexer.py run
+	python db_indexer.py status
+"""
+import atexit
+import sys
+import threading
+from getpass import getpass
+import db_personal
+import db_stats
+
+#seconds the worker waits between looks at the queue when nothing wakes it, in case another copy of the app queued something
+IDLE_SECONDS = 60
+
+#seconds the worker waits before trying again after a batch failed, e.g. because the server went away
+RETRY_SECONDS = 30
+
+#seconds stop() waits for the batch in progress to finish
+STOP_TIMEOUT = 10
+
+#the operation the worker's queries are counted under by db_stats.py
+INDEXER_OPERATION = "indexer"
+
+_lock = threading.Lock()
+_wake = threading.Event()
+_stopping = threading.Event()
+_state = {"thread": None, "indexed": 0, "error": None, "registered": False}
+
+"""
+Stores one batch from the queue and counts it.
+@returns:
+	int number of movies whose credits were stored, 0 once the queue is empty
+"""
+def _indexBatch(passw):
+	count = db_personal.indexPendingCredits(passw)
+	with _lock:
+		_state["indexed"] += count
+		_state["error"] = None
+	return count
+
+"""
+What the worker thread runs: empties the queue, then waits until wake() is called (or IDLE_SECONDS go by) and does it again.
+A batch that fails stays in the queue and is tried again after RETRY_SECONDS.
+"""
+def _work(passw):
+	db_stats.setThreadOperation(INDEXER_OPERATION)
+	while not _stopping.is_set():
+		_wake.clear()
+		wait = IDLE_SECONDS
+		try:
+			while not _stopping.is_set() and _indexBatch(passw) > 0:
+				pass
+		except Exception as e:
+			with _lock:
+				_state["error"] = str(e)
+			wait = RETRY_SECONDS
+		_wake.wait(wait)
+
+"""
+Starts the worker thread, if it isn't running already. It starts with whatever was left in the queue
+the last time the app ran. stop() is registered to run when the program exits.
+Call this once the db is open, so stop() runs before the connection pool is closed (see db_pool.closePool()).
+@params:
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+"""
+def start(passw):
+	with _lock:
+		if _state["thread"] is not None and _state["thread"].is_alive():
+			return
+		_stopping.clear()
+		thread = threading.Thread(target=_work, args=(passw,), name="mymdb-indexer")
+		thread.daemon = True
+		_state["thread"] = thread
+		if not _state["registered"]:
+			atexit.register(stop)
+			_state["registered"] = True
+	thread.start()
+
+"""
+Tells the worker there is something new in the queue, so it doesn't wait for IDLE_SECONDS to go by.
+Does nothing if the worker isn't running.
+"""
+def wake():
+	_wake.set()
+
+"""
+Stops the worker thread, letting the batch in progress finish. Anything not stored yet stays in the queue for next time.
+@params:
+	timeout: seconds to wait for the batch in progress
+"""
+def stop(timeout=STOP_TIMEOUT):
+	with _lock:
+		thread = _state["thread"]
+		_state["thread"] = None
+	if thread is None:
+		return
+	_stopping.set()
+	_wake.set()
+	thread.join(timeout)
+
+"""
+Empties the queue on the calling thread, e.g. before a backup (see db_archive.py), whether or not the worker is running.
+@params:
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	int number of movies whose credits were stored
+"""
+def drain(passw):
+	done = 0
+	count = _indexBatch(passw)
+	while count > 0:
+		done += count
+		count = _indexBatch(passw)
+	return done
+
+"""
+Tells how far behind the worker is.
+@params:
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	the dictionary from creditQueueStatus() in db_personal.py, plus whether the worker is "running",
+	the number of movies it has "indexed" since the app started, and the last "error" it ran into (None if the last batch worked)
+"""
+def status(passw):
+	queue = db_personal.creditQueueStatus(passw)
+	with _lock:
+		queue["running"] = _state["thread"] is not None and _state["thread"].is_alive()
+		queue["indexed"] = _state["indexed"]
+		queue["error"] = _state["error"]
+	return queue
+
+def main():
+	if len(sys.argv) != 2 or sys.argv[1] not in ("run", "status"):
+		sys.exit("Usage: python db_indexer.py run|status")
+	passw = None
+	if db_personal.BACKEND == "sqlite":
+		import db_sqlite
+		db_sqlite.migrate()
+	else:
+		import db_migrate
+		import db_pool
+		passw = getpass("Please enter your PostgreSQL password:")
+		with db_pool.connection(passw) as conn:
+			db_migrate.migrate(passw, conn)
+	if sys.argv[1] == "run":
+		print "Stored the rest of the credits of " + str(drain(passw)) + " movie(s)."
+	queue = db_personal.creditQueueStatus(passw)
+	print str(queue["movies"]) + " movie(s) with " + str(queue["credits"]) + " credit(s) waiting to be stored."
+	for title, year, credits in queue["waiting"]:
+		print "  " + title + " (" + str(year) + "): " + str(credits) + " credit(s)"
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,411 @@
+"""
+db_migrate.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Keeps the tables of the myMDb database up to date, used for myMDb project.
+Every change to the tables is a numbered migration in MIGRATIONS below. The SCHEMA_VERSION table records which
+ones a database has had, and migrate() (which myMDb.py runs every time it starts) applies whatever is missing, in order,
+each in its own transaction. A brand new database starts at version 0, with no tables at all.
+To change the tables, add a new migration to the end of the list. Never edit one that has already been released.
+
+Usage:
+	python db_migrate.py
+"""
+import psycopg2
+from getpass import getpass
+import db_pool
+
+#Indexes of the original tables (version 1).
+#The unique ones are what let db_personal.py add things with a single "INSERT ... ON CONFLICT DO NOTHING",
+#and the ones on the association tables keep getMovies() and portfolio() from scanning whole tables.
+LEGACY_INDEXES = ["CREATE UNIQUE INDEX IF NOT EXISTS MOVIES_TITLE_YEAR_KEY ON MOVIES (TITLE, YEAR)",
+                  "CREATE UNIQUE INDEX IF NOT EXISTS ACTORS_NAME_KEY ON ACTORS (NAME)",
+                  "CREATE UNIQUE INDEX IF NOT EXISTS DIRECTORS_NAME_KEY ON DIRECTORS (NAME)",
+                  "CREATE UNIQUE INDEX IF NOT EXISTS WRITERS_NAME_KEY ON WRITERS (NAME)",
+                  "CREATE UNIQUE INDEX IF NOT EXISTS ACTING_M_ID_A_ID_KEY ON ACTING (M_ID, A_ID)",
+                  "CREATE UNIQUE INDEX IF NOT EXISTS DIRECTING_M_ID_D_ID_KEY ON DIRECTING (M_ID, D_ID)",
+                  "CREATE UNIQUE INDEX IF NOT EXISTS WRITING_M_ID_W_ID_KEY ON WRITING (M_ID, W_ID)",
+                  "CREATE INDEX IF NOT EXISTS ACTING_A_ID_M_ID_IDX ON ACTING (A_ID, M_ID)",
+                  "CREATE INDEX IF NOT EXISTS DIRECTING_D_ID_M_ID_IDX ON DIRECTING (D_ID, M_ID)",
+                  "CREATE INDEX IF NOT EXISTS WRITING_W_ID_M_ID_IDX ON WRITING (W_ID, M_ID)",
+                  "CREATE INDEX IF NOT EXISTS MOVIES_UNWATCHED_IDX ON MOVIES (ID) WHERE WATCHED = FALSE"]
+
+#(association table, person column, person table, role) for each kind of credit in the original tables
+LEGACY_CREDIT_TABLES = [("ACTING", "A_ID", "ACTORS", "actor"),
+                        ("DIRECTING", "D_ID", "DIRECTORS", "director"),
+                        ("WRITING", "W_ID", "WRITERS", "writer")]
+
+#Trigram indexes behind the fuzzy searches in db_personal.py (fuzzyMovies() and fuzzyPeople()).
+#They answer both "similar to" and "starts with" searches without scanning the table.
+#These need the pg_trgm extension, so they aren't a migration: addSearchIndexes() builds them whenever it can.
+SEARCH_INDEXES = ["CREATE INDEX IF NOT EXISTS MOVIES_TITLE_TRGM_IDX ON MOVIES USING GIN (TITLE gin_trgm_ops)",
+                  "CREATE INDEX IF NOT EXISTS PEOPLE_NAME_TRGM_IDX ON PEOPLE USING GIN (NAME gin_trgm_ops)"]
+
+"""
+Version 1: the tables as the first release of myMDb built them, with the indexes and foreign keys added later.
+Databases made before there were migrations already have these tables. For those, duplicate movies and people that the
+old check-then-insert code let through are merged (their credits are moved over to the copy with the lowest id),
+since the unique indexes can't be built otherwise.
+"""
+def _originalTables(cur):
+	cur.execute('''CREATE TABLE IF NOT EXISTS MOVIES
+	    (ID        SERIAL             PRIMARY KEY,
+	    TITLE      TEXT               NOT NULL   ,
+	    YEAR       TEXT                          ,
+	    RUNTIME    TEXT                          ,
+	    MPAA       TEXT                          ,
+	    RATING     TEXT                          ,
+	    WATCHED    BOOLEAN                       ,
+	    OWN        BOOLEAN                  );''')
+	for table, id_type, person_table, role in LEGACY_CREDIT_TABLES:
+		cur.execute("CREATE TABLE IF NOT EXISTS " + person_table +
+		            " (ID SERIAL PRIMARY KEY, NAME TEXT NOT NULL)")
+		cur.execute("CREATE TABLE IF NOT EXISTS " + table +
+		            " (ID SERIAL PRIMARY KEY, M_ID INT NOT NULL, " + id_type + " INT NOT NULL)")
+
+	#point every credit at the lowest id of each duplicated movie or person, then drop the other copies
+	for table, id_type, person_table, role in LEGACY_CREDIT_TABLES:
+		cur.execute("UPDATE " + table + " SET M_ID = keep.id FROM " +
+		            "(SELECT MOVIES.id AS old_id, min(MOVIES.id) OVER (PARTITION BY title, year) AS id FROM MOVIES) keep " +
+		            "WHERE " + table + ".M_ID = keep.old_id AND keep.old_id <> keep.id")
+		cur.execute("UPDATE " + table + " SET " + id_type + " = keep.id FROM " +
+		            "(SELECT id AS old_id, min(id) OVER (PARTITION BY name) AS id FROM " + person_table + ") keep " +
+		            "WHERE " + table + "." + id_type + " = keep.old_id AND keep.old_id <> keep.id")
+	cur.execute("DELETE FROM MOVIES a USING MOVIES b WHERE a.title = b.title AND a.year IS NOT DISTINCT FROM b.year AND a.id > b.id")
+	for table, id_type, person_table, role in LEGACY_CREDIT_TABLES:
+		cur.execute("DELETE FROM " + person_table + " a USING " + person_table + " b WHERE a.name = b.name AND a.id > b.id")
+		#credits that were entered twice, or that point at something that no longer exists
+		cur.execute("DELETE FROM " + table + " a USING " + table + " b " +
+		            "WHERE a.M_ID = b.M_ID AND a." + id_type + " = b." + id_type + " AND a.id > b.id")
+		cur.execute("DELETE FROM " + table + " WHERE M_ID NOT IN (SELECT id FROM MOVIES) " +
+		            "OR " + id_type + " NOT IN (SELECT id FROM " + person_table + ")")
+
+	for index in LEGACY_INDEXES:
+		cur.execute(index)
+	for table, id_type, person_table, role in LEGACY_CREDIT_TABLES:
+		for column, parent in (("M_ID", "MOVIES"), (id_type, person_table)):
+			constraint = (table + "_" + column + "_fkey").lower()
+			cur.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (constraint,))
+			if cur.fetchone() is None:
+				cur.execute("ALTER TABLE " + table + " ADD CONSTRAINT " + constraint +
+				            " FOREIGN KEY (" + column + ") REFERENCES " + parent + "(ID) ON DELETE CASCADE")
+
+"""
+Version 2: replaces ACTORS, DIRECTORS, and WRITERS with a single PEOPLE table, and ACTING, DIRECTING, and WRITING
+with a single CREDITS table that has a ROLE column. Someone who both acted in and directed movies is now one person.
+Everything is copied over in bulk, with credits keeping their billing order, before the old tables are dropped.
+The indexes are built after the copy, which is quicker than keeping them up to date row by row.
+"""
+def _peopleAndCredits(cur):
+	cur.execute('''CREATE TABLE PEOPLE
+		(ID        SERIAL             PRIMARY KEY,
+		NAME       TEXT               NOT NULL);''')
+	cur.execute('''CREATE TABLE CREDITS
+		(ID        SERIAL             PRIMARY KEY,
+		M_ID       INT                NOT NULL   REFERENCES MOVIES(ID) ON DELETE CASCADE,
+		P_ID       INT                NOT NULL   REFERENCES PEOPLE(ID) ON DELETE CASCADE,
+		ROLE       TEXT               NOT NULL   CHECK (ROLE IN ('actor', 'director', 'writer')));''')
+
+	cur.execute("INSERT INTO PEOPLE (NAME) SELECT NAME FROM ACTORS UNION SELECT NAME FROM DIRECTORS " +
+	            "UNION SELECT NAME FROM WRITERS ORDER BY 1")
+	for table, id_type, person_table, role in LEGACY_CREDIT_TABLES:
+		cur.execute("INSERT INTO CREDITS (M_ID, P_ID, ROLE) SELECT " + table + ".M_ID, PEOPLE.ID, %s " +
+		            "FROM " + table + " JOIN " + person_table + " ON " + person_table + ".ID = " + table + "." + id_type +
+		            " JOIN PEOPLE ON PEOPLE.NAME = " + person_table + ".NAME ORDER BY " + table + ".ID", (role,))
+
+	#one person per name, each credit once. (P_ID, ROLE, M_ID) is what a person's portfolio or filmography is read from
+	cur.execute("CREATE UNIQUE INDEX PEOPLE_NAME_KEY ON PEOPLE (NAME)")
+	cur.execute("CREATE UNIQUE INDEX CREDITS_M_ID_ROLE_P_ID_KEY ON CREDITS (M_ID, ROLE, P_ID)")
+	cur.execute("CREATE INDEX CREDITS_P_ID_ROLE_M_ID_IDX ON CREDITS (P_ID, ROLE, M_ID)")
+	cur.execute("DROP TABLE ACTING, DIRECTING, WRITING, ACTORS, DIRECTORS, WRITERS")
+
+#The totals kept in LIBRARY_STATS, and how each one is added up from a set of MOVIES rows
+_LIBRARY_SUMS = [("MOVIES", "count(*)"),
+                 ("WATCHED", "count(*) FILTER (WHERE WATCHED)"),
+                 ("UNWATCHED", "count(*) FILTER (WHERE WATCHED = FALSE)"),
+                 ("OWNED", "count(*) FILTER (WHERE OWN)"),
+                 ("RATED", "count(RATING_VALUE(RATING))"),
+                 ("RATING_SUM", "COALESCE(sum(RATING_VALUE(RATING)), 0)"),
+                 ("UNWATCHED_RUNTIME", "COALESCE(sum(RUNTIME_MINUTES(RUNTIME)) FILTER (WHERE WATCHED = FALSE), 0)")]
+
+"""
+Builds the SQL that adds up _LIBRARY_SUMS over a table, e.g. MOVIES or one of the trigger transition tables below.
+"""
+def _librarySums(table):
+	return "SELECT " + ", ".join([total + " AS " + column for column, total in _LIBRARY_SUMS]) + " FROM " + table
+
+"""
+Builds the SQL that adds the totals of a transition table to LIBRARY_STATS (sign "+") or takes them out (sign "-").
+"""
+def _applyLibrarySums(table, sign):
+	return "UPDATE LIBRARY_STATS SET " + ", ".join([column + " = LIBRARY_STATS." + column + " " + sign + " sums." + column
+	                                               for column, total in _LIBRARY_SUMS]) + \
+	       " FROM (" + _librarySums(table) + ") sums; "
+
+"""
+Version 3: summary tables for the (S)tatistics screen, kept up to date by triggers as movies and credits change,
+so reading them takes the same time however big the library is.
+LIBRARY_STATS is a single row of totals, and PERSON_STATS counts the movies each person has in each role.
+The triggers run once per statement, not once per row, and add up everything the statement changed first.
+PERSON_STATS rows are always updated in the same order, so two movies being added at once can't deadlock on them.
+RATING and RUNTIME are text, so they are only counted when they hold a number.
+"""
+def _libraryStats(cur):
+	cur.execute("CREATE FUNCTION RATING_VALUE(RATING TEXT) RETURNS NUMERIC AS $$ " +
+	            "SELECT CASE WHEN trim($1) ~ '^[0-9]+([.][0-9]+)?$' THEN trim($1)::numeric END $$ LANGUAGE sql IMMUTABLE")
+	cur.execute("CREATE FUNCTION RUNTIME_MINUTES(RUNTIME TEXT) RETURNS INT AS $$ " +
+	            "SELECT COALESCE(substring($1 from '([0-9]+)')::int, 0) $$ LANGUAGE sql IMMUTABLE")
+	cur.execute('''CREATE TABLE LIBRARY_STATS
+		(ID                 INT                PRIMARY KEY   CHECK (ID = 1),
+		MOVIES              INT                NOT NULL,
+		WATCHED             INT                NOT NULL,
+		UNWATCHED           INT                NOT NULL,
+		OWNED               INT                NOT NULL,
+		RATED               INT                NOT NULL,
+		RATING_SUM          NUMERIC            NOT NULL,
+		UNWATCHED_RUNTIME   BIGINT             NOT NULL);''')
+	cur.execute('''CREATE TABLE PERSON_STATS
+		(P_ID      INT                NOT NULL   REFERENCES PEOPLE(ID) ON DELETE CASCADE,
+		ROLE       TEXT               NOT NULL,
+		MOVIES     INT                NOT NULL,
+		PRIMARY KEY (P_ID, ROLE));''')
+	#the top people in a role are read straight off this index
+	cur.execute("CREATE INDEX PERSON_STATS_ROLE_MOVIES_IDX ON PERSON_STATS (ROLE, MOVIES DESC)")
+
+	_countStats(cur)
+
+	#an UPDATE takes its old rows out of the totals and puts its new ones in
+	cur.execute("CREATE FUNCTION REFRESH_LIBRARY_STATS() RETURNS trigger AS $$ BEGIN " +
+	            "IF TG_OP IN ('UPDATE', 'DELETE') THEN " + _applyLibrarySums("OLD_ROWS", "-") + "END IF; " +
+	            "IF TG_OP IN ('UPDATE', 'INSERT') THEN " + _applyLibrarySums("NEW_ROWS", "+") + "END IF; " +
+	            "RETURN NULL; END $$ LANGUAGE plpgsql")
+	cur.execute("CREATE FUNCTION REFRESH_PERSON_STATS() RETURNS trigger AS $$ BEGIN " +
+	            "IF TG_OP = 'INSERT' THEN " +
+	            "INSERT INTO PERSON_STATS (P_ID, ROLE, MOVIES) SELECT P_ID, ROLE, count(*) FROM NEW_ROWS " +
+	            "GROUP BY P_ID, ROLE ORDER BY P_ID, ROLE " +
+	            "ON CONFLICT (P_ID, ROLE) DO UPDATE SET MOVIES = PERSON_STATS.MOVIES + EXCLUDED.MOVIES; " +
+	            "ELSE " +
+	            "UPDATE PERSON_STATS SET MOVIES = PERSON_STATS.MOVIES - gone.MOVIES " +
+	            "FROM (SELECT P_ID, ROLE, count(*) AS MOVIES FROM OLD_ROWS GROUP BY P_ID, ROLE ORDER BY P_ID, ROLE) gone " +
+	            "WHERE PERSON_STATS.P_ID = gone.P_ID AND PERSON_STATS.ROLE = gone.ROLE; " +
+	            "END IF; " +
+	            "RETURN NULL; END $$ LANGUAGE plpgsql")
+	for event, tables in (("INSERT", "NEW TABLE AS NEW_ROWS"), ("DELETE", "OLD TABLE AS OLD_ROWS"),
+	                      ("UPDATE", "OLD TABLE AS OLD_ROWS NEW TABLE AS NEW_ROWS")):
+		cur.execute("CREATE TRIGGER MOVIES_" + event + "_STATS AFTER " + event + " ON MOVIES REFERENCING " + tables +
+		            " FOR EACH STATEMENT EXECUTE PROCEDURE REFRESH_LIBRARY_STATS()")
+		if event != "UPDATE":
+			cur.execute("CREATE TRIGGER CREDITS_" + event + "_STATS AFTER " + event + " ON CREDITS REFERENCING " + tables +
+			            " FOR EACH STATEMENT EXECUTE PROCEDURE REFRESH_PERSON_STATS()")
+
+"""
+Recounts LIBRARY_STATS and PERSON_STATS from scratch. The triggers keep them right after that,
+so this is only needed after loading data with the triggers turned off (see benchmarks/generator.py).
+Whatever was waiting in LIBRARY_STATS_DELTA is counted again too, so it is thrown away.
+@params:
+	cur: cursor of a connection to the app's db
+"""
+def rebuildStats(cur):
+	cur.execute("DELETE FROM LIBRARY_STATS_DELTA")
+	_countStats(cur)
+
+"""
+Counts LIBRARY_STATS and PERSON_STATS from the MOVIES and CREDITS tables.
+"""
+def _countStats(cur):
+	cur.execute("DELETE FROM LIBRARY_STATS")
+	cur.execute("INSERT INTO LIBRARY_STATS SELECT 1, sums.* FROM (" + _librarySums("MOVIES") + ") sums")
+	cur.execute("DELETE FROM PERSON_STATS")
+	cur.execute("INSERT INTO PERSON_STATS (P_ID, ROLE, MOVIES) SELECT P_ID, ROLE, count(*) FROM CREDITS GROUP BY P_ID, ROLE")
+
+"""
+Version 4: PENDING_CREDITS, the credits of movies added with only their top billed people (see db_indexer.py).
+Each row holds the rest of one movie's credits, in billing order, until they have been stored in CREDITS.
+"""
+def _creditQueue(cur):
+	cur.execute('''CREATE TABLE PENDING_CREDITS
+		(M_ID      INT                PRIMARY KEY   REFERENCES MOVIES(ID) ON DELETE CASCADE,
+		NAMES      TEXT[]             NOT NULL,
+		ROLES      TEXT[]             NOT NULL,
+		CREDITS    INT                NOT NULL);''')
+
+"""
+Builds the SQL that records what a statement did to the library totals as a new row of LIBRARY_STATS_DELTA:
+the totals of the rows it added (a trigger transition table, or None) less those of the rows it removed (or None).
+Nothing is recorded for a statement that didn't touch any rows.
+"""
+def _recordLibraryDelta(added, removed):
+	tables = []
+	if added is not None:
+		tables.append("(" + _librarySums(added) + ") added")
+	if removed is not None:
+		tables.append("(" + _librarySums(removed) + ") removed")
+	changes = []
+	for column, total in _LIBRARY_SUMS:
+		if added is None:
+			changes.append("-removed." + column)
+		elif removed is None:
+			changes.append("added." + column)
+		else:
+			changes.append("added." + column + " - removed." + column)
+	return "INSERT INTO LIBRARY_STATS_DELTA (" + ", ".join([column for column, total in _LIBRARY_SUMS]) + ") " + \
+	       "SELECT " + ", ".join(changes) + " FROM " + ", ".join(tables) + \
+	       " WHERE EXISTS (SELECT 1 FROM " + (added or removed) + "); "
+
+"""
+Version 5: LIBRARY_STATS_DELTA. Every statement that changed MOVIES used to update the one LIBRARY_STATS row, so
+movies being added at the same time (see db_async.py) each waited for the one before to commit. Now the trigger only
+adds a row of changes to LIBRARY_STATS_DELTA, which nothing has to wait for. LIBRARY_STATS keeps the totals as of the
+last time the deltas were folded into it, and getLibraryStats() adds up the rest (and folds them in once there are enough).
+The top people in a role are now read off an index that ends in P_ID, the tie-breaker getLibraryStats() sorts by.
+"""
+def _libraryStatsDelta(cur):
+	cur.execute('''CREATE TABLE LIBRARY_STATS_DELTA
+		(ID                 BIGSERIAL          PRIMARY KEY,
+		MOVIES              INT                NOT NULL,
+		WATCHED             INT                NOT NULL,
+		UNWATCHED           INT                NOT NULL,
+		OWNED               INT                NOT NULL,
+		RATED               INT                NOT NULL,
+		RATING_SUM          NUMERIC            NOT NULL,
+		UNWATCHED_RUNTIME   BIGINT             NOT NULL);''')
+	#an UPDATE records its new rows less its old ones
+	cur.execute("CREATE OR REPLACE FUNCTION REFRESH_LIBRARY_STATS() RETURNS trigger AS $$ BEGIN " +
+	            "IF TG_OP = 'INSERT' THEN " + _recordLibraryDelta("NEW_ROWS", None) +
+	            "ELSIF TG_OP = 'DELETE' THEN " + _recordLibraryDelta(None, "OLD_ROWS") +
+	            "ELSE " + _recordLibraryDelta("NEW_ROWS", "OLD_ROWS") + "END IF; " +
+	            "RETURN NULL; END $$ LANGUAGE plpgsql")
+	cur.execute("DROP INDEX PERSON_STATS_ROLE_MOVIES_IDX")
+	cur.execute("CREATE INDEX PERSON_STATS_ROLE_MOVIES_IDX ON PERSON_STATS (ROLE, MOVIES DESC, P_ID)")
+
+"""
+Version 6: movies with no year. The unique index on (TITLE, YEAR) let any number of them through, since NULLs are never
+equal to each other, so adding a movie IMDb has no year for never found the copy already there. The index is now on
+(TITLE, COALESCE(YEAR, '')), and the copies that got in are merged into the one with the lowest id: their credits and
+queued credits move over to it, and then they are deleted.
+"""
+def _moviesWithoutYear(cur):
+	cur.execute("CREATE TEMPORARY TABLE MOVIE_COPIES ON COMMIT DROP AS SELECT OLD_ID, ID FROM " +
+	            "(SELECT ID AS OLD_ID, min(ID) OVER (PARTITION BY TITLE, COALESCE(YEAR, '')) AS ID FROM MOVIES) keep " +
+	            "WHERE OLD_ID <> ID")
+	cur.execute("INSERT INTO CREDITS (M_ID, P_ID, ROLE) SELECT MOVIE_COPIES.ID, CREDITS.P_ID, CREDITS.ROLE " +
+	            "FROM CREDITS JOIN MOVIE_COPIES ON MOVIE_COPIES.OLD_ID = CREDITS.M_ID ORDER BY CREDITS.ID ON CONFLICT DO NOTHING")
+	cur.execute("INSERT INTO PENDING_CREDITS (M_ID, NAMES, ROLES, CREDITS) SELECT MOVIE_COPIES.ID, NAMES, ROLES, CREDITS " +
+	            "FROM PENDING_CREDITS JOIN MOVIE_COPIES ON MOVIE_COPIES.OLD_ID = PENDING_CREDITS.M_ID ON CONFLICT DO NOTHING")
+	cur.execute("DELETE FROM MOVIES WHERE ID IN (SELECT OLD_ID FROM MOVIE_COPIES)")
+	cur.execute("DROP INDEX MOVIES_TITLE_YEAR_KEY")
+	cur.execute("CREATE UNIQUE INDEX MOVIES_TITLE_YEAR_KEY ON MOVIES (TITLE, COALESCE(YEAR, ''))")
+
+"""
+Every migration, in order: (version, description, function that makes the change given a cursor).
+"""
+MIGRATIONS = [(1, "original movie and people tables", _originalTables),
+              (2, "single PEOPLE and CREDITS tables", _peopleAndCredits),
+              (3, "library statistics", _libraryStats),
+              (4, "credit queue", _creditQueue),
+              (5, "library statistics deltas", _libraryStatsDelta),
+              (6, "movies with no year", _moviesWithoutYear)]
+
+"""
+Brings the database up to the newest version in MIGRATIONS.
+Each migration runs in its own transaction along with the row recording it in SCHEMA_VERSION, so a migration that fails
+leaves the database at the last version that worked. SCHEMA_VERSION is locked while a migration runs,
+so two copies of the app starting at the same time won't both try to apply it.
+This is safe to run every time the app starts: it does nothing once the database is up to date.
+@params:
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+	conn:  an open connection to the app's db to do it on (e.g. one from db_pool.py), or None to open (and close) a new one
+@returns:
+	an array of the version numbers that were applied (empty if the database was already up to date)
+"""
+def migrate(passw, conn=None):
+	own_conn = conn is None
+	if own_conn:
+		conn = psycopg2.connect(database=db_pool.DB_NAME, user=db_pool.DB_USER, password=passw, host=db_pool.DB_HOST, port=db_pool.DB_PORT)
+	cur = conn.cursor()
+	cur.execute('''CREATE TABLE IF NOT EXISTS SCHEMA_VERSION
+		(VERSION     INT                PRIMARY KEY,
+		DESCRIPTION  TEXT               NOT NULL,
+		APPLIED      TIMESTAMP          NOT NULL   DEFAULT now());''')
+	conn.commit()
+	applied = []
+	try:
+		for version, description, steps in MIGRATIONS:
+			cur.execute("LOCK TABLE SCHEMA_VERSION IN EXCLUSIVE MODE")
+			cur.execute("SELECT 1 FROM SCHEMA_VERSION WHERE VERSION = %s", (version,))
+			if cur.fetchone() != None:
+				conn.rollback()
+				continue
+			print "Updating database to version " + str(version) + " (" + description + ")..."
+			steps(cur)
+			cur.execute("INSERT INTO SCHEMA_VERSION (VERSION, DESCRIPTION) VALUES (%s, %s)", (version, description))
+			conn.commit()
+			applied.append(version)
+		if _countIndexes(cur, SEARCH_INDEXES) != len(SEARCH_INDEXES):
+			addSearchIndexes(cur)
+			conn.commit()
+	except psycopg2.Error:
+		conn.rollback()
+		print "The database could not be updated. It has been left at version " + str(currentVersion(cur)) + "."
+		raise
+	finally:
+		if own_conn:
+			conn.close()
+	if applied != []:
+		print "Database is up to date (version " + str(applied[-1]) + ")."
+	return applied
+
+"""
+Returns the newest version recorded in SCHEMA_VERSION, or 0 for a database that hasn't had any migrations.
+@params:
+	cur: cursor of a connection to the app's db
+"""
+def currentVersion(cur):
+	cur.execute("SELECT COALESCE(max(VERSION), 0) FROM SCHEMA_VERSION")
+	return cur.fetchone()[0]
+
+"""
+Counts how many of the given indexes already exist in the db.
+@params:
+	cur:     cursor of a connection to the app's db
+	indexes: array of CREATE INDEX statements, like SEARCH_INDEXES
+"""
+def _countIndexes(cur, indexes):
+	cur.execute("SELECT count(*) FROM pg_indexes WHERE schemaname = 'public' AND indexname = ANY(%s)",
+	            ([index.split(" ON ")[0].split()[-1].lower() for index in indexes],))
+	return cur.fetchone()[0]
+
+"""
+Turns on the pg_trgm extension and builds SEARCH_INDEXES.
+pg_trgm ships with PostgreSQL's contrib package, which not every install has. If it can't be turned on,
+nothing else is rolled back: the app still works, and the fuzzy searches fall back to matching the start of titles and names.
+@params:
+	cur: cursor of a connection to the app's db, with a transaction open
+@returns:
+	True if the indexes were built
+	False if pg_trgm isn't available
+"""
+def addSearchIndexes(cur):
+	cur.execute("SAVEPOINT search_indexes")
+	try:
+		cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+		for index in SEARCH_INDEXES:
+			cur.execute(index)
+	except psycopg2.Error:
+		cur.execute("ROLLBACK TO SAVEPOINT search_indexes")
+		print "Note: the pg_trgm extension isn't available, so searches will only match the start of titles and names."
+		return False
+	cur.execute("RELEASE SAVEPOINT search_indexes")
+	print "Search indexes created successfully."
+	return True
+
+def main():
+	passw = getpass("Please enter your PostgreSQL password:")
+	migrate(passw)
+	conn = psycopg2.connect(database=db_pool.DB_NAME, user=db_pool.DB_USER, password=passw, host=db_pool.DB_HOST, port=db_pool.DB_PORT)
+	print "The database is at version " + str(currentVersion(conn.cursor())) + "."
+	conn.close()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,390 @@
+"""
+db_mirror.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+A local copy of IMDb, used for myMDb project, built from the dataset files IMDb publishes (https://datasets.imdbws.com/).
+When there is a mirror, db_web.py looks movies up in it first, and only goes to IMDb (through IMDbPY) for what it
+doesn't have. Searching then takes milliseconds instead of seconds, and works without a connection to the internet.
+The mirror is a SQLite file at MIRROR_PATH, built from these files (plain .tsv, or .tsv.gz as they are downloaded):
+	title.basics:     every title, with its kind, year, and runtime
+	title.crew:       the directors and writers of every title
+	title.principals: the top-billed people of every title, of which the actors are kept as its cast
+	name.basics:      every person's name
+	title.ratings:    the number of votes of every title, used to rank search results. This one is optional
+The files are several gigabytes, so they are read a few lines at a time and never held in memory whole.
+Only the people of titles in the mirror are kept, and TV episodes are left out unless asked for.
+The mirror is built in a new file, which only replaces the old one once it is complete, so an import that fails
+or is interrupted leaves the old mirror as it was.
+
+The datasets have no MPAA ratings, and only list the top-billed cast, so the movies from the mirror have no MPAA rating
+and a shorter cast than the ones from IMDb.
+
+Usage:
+	python db_mirror.py import DIRECTORY [--episodes]
+	python db_mirror.py stats
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+MIRROR_ENABLED = True
+
+#where the mirror is kept. MYMDB_MIRROR changes it
+MIRROR_PATH = os.environ.get("MYMDB_MIRROR", os.path.join(os.path.expanduser("~"), ".mymdb", "imdb_mirror.sqlite"))
+
+#the layout of the mirror file. A mirror built by another version of the app is ignored until it is imported again
+MIRROR_VERSION = 1
+
+#the dataset files, in the order they are imported, and whether each one has to be there
+DATASETS = [("title.basics", True), ("title.ratings", False), ("title.crew", True), ("title.principals", True),
+            ("name.basics", True)]
+
+#IMDb's titleType -> the kind IMDbPY would give
+KINDS = {"movie": "movie", "short": "short", "tvMovie": "tv movie", "tvSeries": "tv series",
+         "tvMiniSeries": "tv mini series", "tvSpecial": "tv special", "tvShort": "tv short", "video": "video movie",
+         "videoGame": "video game", "tvEpisode": "episode", "tvPilot": "tv pilot"}
+
+#the title.principals categories that count as cast
+CAST_CATEGORIES = set(["actor", "actress", "self"])
+
+#most results a search gives back
+SEARCH_RESULTS = 20
+
+#bytes read from a dataset file at a time
+READ_SIZE = 1024 * 1024
+
+#kilobytes of memory SQLite may use to cache the mirror file while it is built. Building an index can take as much
+#again, so an import needs about twice this at most, however big the dataset files are
+IMPORT_CACHE_KB = 256 * 1024
+
+#a progress line is printed every time this many lines of a file have been read
+PROGRESS_EVERY = 1000000
+
+_local = threading.local()
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+"""
+Returns True if there is a mirror to use.
+"""
+def available():
+	return MIRROR_ENABLED and os.path.isfile(MIRROR_PATH)
+
+"""
+Returns this thread's connection to the mirror, or None if there is no mirror (or it is from another MIRROR_VERSION).
+SQLite connections can't be shared between threads, so every thread gets its own.
+"""
+def _conn():
+	if not available():
+		return None
+	conn = getattr(_local, "conn", None)
+	if conn is None or getattr(_local, "path", None) != MIRROR_PATH:
+		conn = sqlite3.connect(MIRROR_PATH, timeout=30)
+		if conn.execute("PRAGMA user_version").fetchone()[0] != MIRROR_VERSION:
+			conn.close()
+			return None
+		_local.conn = conn
+		_local.path = MIRROR_PATH
+	return conn
+
+"""
+Searches the mirror for titles. Every word searched for has to be in the title (or its original title), and the last
+one can be the start of a word, so "the matr" finds THE MATRIX. Titles that match exactly come first, then the most voted.
+@params:
+	s_title: string, the title that the user is searching for.
+	limit:   int, most results to give back
+@returns:
+	an array of dictionaries with the "id", "title", "year", "kind", and "runtime" of every result, like
+	db_web.searchMovies(). Empty if nothing matched, or there is no mirror
+"""
+def searchMovies(s_title, limit=SEARCH_RESULTS):
+	conn = _conn()
+	if conn is None:
+		return []
+	if isinstance(s_title, str):
+		s_title = s_title.decode("utf-8", "replace")
+	words = _WORDS.findall(s_title.lower())
+	if words == []:
+		return []
+	query = " ".join(words) + "*"
+	results = []
+	for movie_id, title, year, kind, runtime in conn.execute(
+			"SELECT ID, TITLE, YEAR, KIND, RUNTIME FROM TITLES WHERE ID IN " +
+			"(SELECT rowid FROM TITLE_SEARCH WHERE TITLE_SEARCH MATCH ?) " +
+			"ORDER BY lower(TITLE) = ? DESC, VOTES DESC, ID LIMIT ?", (query, " ".join(s_title.lower().split()), limit)):
+		results.append({"id": "%07d" % movie_id, "title": title, "year": year, "kind": kind,
+		                "runtime": str(runtime) if runtime is not None else None})
+	return results
+
+"""
+Gets the full details of one movie from the mirror.
+@params:
+	movie_id: string, IMDb movie id (the "id" of a searchMovies() result)
+@returns:
+	a dictionary like db_web.extractFields() gives, or None if the movie isn't in the mirror (or there is no mirror)
+"""
+def getMovie(movie_id):
+	conn = _conn()
+	if conn is None:
+		return None
+	row = conn.execute("SELECT TITLE, YEAR, RUNTIME FROM TITLES WHERE ID = ?", (int(movie_id),)).fetchone()
+	if row is None:
+		return None
+	fields = {"title": row[0], "year": row[1], "runtimes": [str(row[2])] if row[2] is not None else None,
+	          "certificates": None, "director": [], "writer": [], "cast": []}
+	for role, name in conn.execute("SELECT C.ROLE, N.NAME FROM CREW C JOIN NAMES N ON N.ID = C.PERSON_ID " +
+	                               "WHERE C.TITLE_ID = ? ORDER BY C.ROLE, C.BILLING", (int(movie_id),)):
+		fields[role].append(name)
+	for role in ("director", "writer", "cast"):
+		fields[role] = fields[role] or None
+	return fields
+
+"""
+Finds a dataset file in a directory, gzipped or not.
+@returns:
+	the path of the file, or None if it isn't there
+"""
+def datasetPath(directory, name):
+	for path in (os.path.join(directory, name + ".tsv.gz"), os.path.join(directory, name + ".tsv")):
+		if os.path.isfile(path):
+			return path
+	return None
+
+"""
+Reads a file line by line, READ_SIZE bytes at a time, unzipping it on the way if it ends in .gz.
+"""
+def _lines(path):
+	with open(path, "rb") as f:
+		unzip = None
+		if path.endswith(".gz"):
+			unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		rest = ""
+		while True:
+			block = f.read(READ_SIZE)
+			if not block:
+				break
+			if unzip is not None:
+				data = unzip.decompress(block)
+				#a file can be several gzip streams one after the other
+				while unzip.unused_data:
+					left = unzip.unused_data
+					unzip = zlib.decompressobj(16 + zlib.MAX_WBITS)
+					data += unzip.decompress(left)
+				block = data
+			lines = (rest + block).split("\n")
+			rest = lines.pop()
+			for line in lines:
+				yield line
+		if rest:
+			yield rest
+
+"""
+Reads a dataset file.
+Most of an import is spent here, so the fields are left as they are in the file: UTF-8 byte strings, with IMDb's "\N"
+where there is no value. The functions below that turn them into rows decode only the text they keep.
+@params:
+	path:    string, path of the file
+	columns: int, number of fields wanted from the start of each line. The rest of the line isn't split up
+	report:  function called with the name of the file and the number of lines read so far, every PROGRESS_EVERY lines,
+	         or None
+@returns:
+	a generator of arrays of (at least) columns fields, one per line, without the header line
+"""
+def readDataset(path, columns, report=None):
+	count = 0
+	lines = _lines(path)
+	next(lines, None)
+	for line in lines:
+		count += 1
+		if report is not None and count % PROGRESS_EVERY == 0:
+			report(os.path.basename(path), count)
+		fields = line.rstrip("\r").split("\t", columns)
+		if len(fields) >= columns:
+			yield fields
+
+"""
+Turns an IMDb id like tt0133093 or nm0000206 into its number.
+"""
+def _number(imdb_id):
+	return int(imdb_id[2:])
+
+"""
+Turns a field into an int, or None if it isn't a number (or is "\N").
+"""
+def _integer(value):
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		return None
+
+"""
+Rows of the TITLES table, from title.basics.
+"""
+def _titleRows(rows, episodes):
+	for row in rows:
+		if row[1] == "tvEpisode" and not episodes:
+			continue
+		yield (_number(row[0]), KINDS.get(row[1], row[1]), row[2].decode("utf-8"), row[3].decode("utf-8"),
+		       _integer(row[5]), _integer(row[6]), _integer(row[7]))
+
+"""
+Rows of the CREW table from title.crew: every director and writer, in the order they are listed.
+The title's number comes twice, since the row is only kept if the title is in the mirror.
+"""
+def _crewRows(rows):
+	for row in rows:
+		title_id = _number(row[0])
+		for role, people in (("director", row[1]), ("writer", row[2])):
+			if people == "\\N":
+				continue
+			for billing, person in enumerate(people.split(",")):
+				yield (title_id, _number(person), role, billing + 1, title_id)
+
+"""
+Rows of the CREW table from title.principals: the cast, in billing order. See _crewRows().
+"""
+def _castRows(rows):
+	for row in rows:
+		if row[3] in CAST_CATEGORIES:
+			title_id = _number(row[0])
+			yield (title_id, _number(row[2]), "cast", int(row[1]), title_id)
+
+"""
+Builds the search index. FTS5 is used if this SQLite has it, and FTS4 if not.
+"""
+def _buildSearch(conn):
+	try:
+		conn.execute("CREATE VIRTUAL TABLE TITLE_SEARCH USING fts5(TITLE, ORIGINAL_TITLE, content='TITLES', content_rowid='ID')")
+	except sqlite3.OperationalError:
+		conn.execute("CREATE VIRTUAL TABLE TITLE_SEARCH USING fts4(content='TITLES', TITLE, ORIGINAL_TITLE)")
+	conn.execute("INSERT INTO TITLE_SEARCH (TITLE_SEARCH) VALUES ('rebuild')")
+
+"""
+Builds a new mirror from IMDb's dataset files, and puts it in place of the old one.
+@params:
+	directory: string, the folder the dataset files are in
+	path:      string, where the mirror goes (MIRROR_PATH by default)
+	episodes:  boolean, True to keep TV episodes too. There are far more of them than of everything else
+	report:    function called with a file name and number of lines every PROGRESS_EVERY lines, or None
+@returns:
+	a dictionary with the number of "titles", "people", and "credits" in the new mirror
+"""
+def importDatasets(directory, path=None, episodes=False, report=None):
+	path = path or MIRROR_PATH
+	files = {}
+	for name, required in DATASETS:
+		files[name] = datasetPath(directory, name)
+		if files[name] is None and required:
+			raise ValueError("There is no " + name + ".tsv.gz or " + name + ".tsv in " + directory)
+	folder = os.path.dirname(path)
+	if folder and not os.path.isdir(folder):
+		os.makedirs(folder)
+	building = path + ".building"
+	if os.path.exists(building):
+		os.remove(building)
+
+	conn = sqlite3.connect(building, isolation_level=None)
+	try:
+		conn.execute("PRAGMA journal_mode = OFF")
+		conn.execute("PRAGMA synchronous = OFF")
+		conn.execute("PRAGMA cache_size = -" + str(IMPORT_CACHE_KB))
+		conn.execute("CREATE TABLE TITLES (ID INTEGER PRIMARY KEY, KIND TEXT, TITLE TEXT NOT NULL, ORIGINAL_TITLE TEXT, " +
+		             "YEAR INTEGER, END_YEAR INTEGER, RUNTIME INTEGER, VOTES INTEGER NOT NULL DEFAULT 0)")
+		conn.execute("CREATE TABLE NAMES (ID INTEGER PRIMARY KEY, NAME TEXT NOT NULL)")
+		conn.execute("CREATE TABLE CREW (TITLE_ID INTEGER NOT NULL, PERSON_ID INTEGER NOT NULL, ROLE TEXT NOT NULL, " +
+		             "BILLING INTEGER NOT NULL)")
+		conn.execute("CREATE TABLE INFO (KEY TEXT PRIMARY KEY, VALUE TEXT)")
+		conn.execute("BEGIN")
+		conn.executemany("INSERT INTO TITLES (ID, KIND, TITLE, ORIGINAL_TITLE, YEAR, END_YEAR, RUNTIME) VALUES (?, ?, ?, ?, ?, ?, ?)",
+		                 _titleRows(readDataset(files["title.basics"], 8, report), episodes))
+		if files["title.ratings"] is not None:
+			conn.executemany("UPDATE TITLES SET VOTES = ? WHERE ID = ?",
+			                 ((_integer(row[2]) or 0, _number(row[0])) for row in readDataset(files["title.ratings"], 3, report)))
+		keep_crew = "INSERT INTO CREW (TITLE_ID, PERSON_ID, ROLE, BILLING) SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM TITLES WHERE ID = ?)"
+		conn.executemany(keep_crew, _crewRows(readDataset(files["title.crew"], 3, report)))
+		conn.executemany(keep_crew, _castRows(readDataset(files["title.principals"], 4, report)))
+		#only the names of people who are in the mirror are kept, which the index makes quick to check
+		conn.execute("CREATE INDEX CREW_PERSON_IDX ON CREW (PERSON_ID)")
+		conn.executemany("INSERT INTO NAMES (ID, NAME) SELECT ?, ? WHERE EXISTS (SELECT 1 FROM CREW WHERE PERSON_ID = ?)",
+		                 ((_number(row[0]), row[1].decode("utf-8"), _number(row[0])) for row in readDataset(files["name.basics"], 2, report)))
+		conn.execute("CREATE INDEX CREW_TITLE_IDX ON CREW (TITLE_ID, ROLE, BILLING)")
+		_buildSearch(conn)
+		counts = {"titles": conn.execute("SELECT COUNT(*) FROM TITLES").fetchone()[0],
+		          "people": conn.execute("SELECT COUNT(*) FROM NAMES").fetchone()[0],
+		          "credits": conn.execute("SELECT COUNT(*) FROM CREW").fetchone()[0]}
+		info = dict([(key, str(value)) for key, value in counts.items()])
+		info["built"] = time.strftime("%Y-%m-%d %H:%M:%S")
+		info["source"] = os.path.abspath(directory)
+		info["episodes"] = str(episodes)
+		conn.executemany("INSERT INTO INFO (KEY, VALUE) VALUES (?, ?)", info.items())
+		conn.execute("COMMIT")
+		conn.execute("ANALYZE")
+		conn.execute("PRAGMA user_version = " + str(MIRROR_VERSION))
+	except:
+		conn.close()
+		os.remove(building)
+		raise
+	conn.close()
+	try:
+		os.rename(building, path)
+	except OSError:
+		#Windows won't rename over a file that is already there
+		os.remove(path)
+		os.rename(building, path)
+	return counts
+
+"""
+Returns a dictionary describing the mirror: where it lives, how big it is, and what was recorded when it was built
+("titles", "people", "credits", "built", "source", "episodes"). Empty if there is no mirror.
+"""
+def stats():
+	conn = _conn()
+	if conn is None:
+		return {}
+	result = dict(conn.execute("SELECT KEY, VALUE FROM INFO").fetchall())
+	result["path"] = MIRROR_PATH
+	result["bytes"] = os.path.getsize(MIRROR_PATH)
+	return result
+
+"""
+Prints how far an import has got.
+"""
+def _progress(name, lines):
+	sys.stdout.write("\r  " + name + ": " + str(lines) + " lines read")
+	sys.stdout.flush()
+
+def main():
+	parser = argparse.ArgumentParser(description="Build a local mirror of IMDb from its dataset files, or describe it.")
+	parser.add_argument("action", choices=["import", "stats"])
+	parser.add_argument("directory", nargs="?", help="the folder with the dataset files (import only)")
+	parser.add_argument("--episodes", action="store_true", help="keep TV episodes too (import only)")
+	args = parser.parse_args()
+
+	if args.action == "import":
+		if not args.directory:
+			parser.error("import needs the folder the dataset files are in")
+		start = time.time()
+		print "Building the IMDb mirror at " + MIRROR_PATH + "..."
+		try:
+			counts = importDatasets(args.directory, episodes=args.episodes, report=_progress)
+		except ValueError as e:
+			print e
+			sys.exit(1)
+		print "\nDone. " + str(counts["titles"]) + " titles, " + str(counts["people"]) + " people, and " + \
+		      str(counts["credits"]) + " credits in " + ("%.1f" % (time.time() - start)) + " seconds."
+	else:
+		info = stats()
+		if info == {}:
+			print "There is no IMDb mirror at " + MIRROR_PATH + ". Build one with: python db_mirror.py import DIRECTORY"
+			return
+		print "IMDb mirror at " + info["path"] + ", %.1f MB" % (info["bytes"] / 1048576.0)
+		print info["titles"] + " titles, " + info["people"] + " people, " + info["credits"] + " credits"
+		print "Built " + info["built"] + " from " + info["source"] + (" (with TV episodes)" if info["episodes"] == "True" else "")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,181 @@
+"""
+db_pool.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+A process-wide pool of connections to the local PostgreSQL database used by the myMDb project.
+myMDb.py builds the pool once, right after the password check, and every function in db_personal.py
+borrows a connection from it and gives it back when it is done, instead of opening a brand new one.
+"""
+import atexit
+import os
+import time
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import pool
+from psycopg2.extensions import connection as _connection
+from psycopg2.extensions import cursor as _cursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+import db_stats
+
+#the database the app uses. MYMDB_DB can point it somewhere else, e.g. the benchmarks use their own
+DB_NAME = os.environ.get("MYMDB_DB", "test")
+DB_USER = "postgres"
+DB_HOST = "127.0.0.1"
+DB_PORT = "5432"
+
+#smallest and largest number of connections the pool will hold open
+POOL_MIN = 1
+POOL_MAX = 10
+
+#a connection that has been sitting in the pool longer than this (in seconds) is pinged before it is handed out
+HEALTH_CHECK_INTERVAL = 30
+
+_pool = None
+_last_used = {}
+
+"""
+The kind of cursor the pool's connections make. It runs statements like any other cursor,
+and records each one (time taken and rows) with db_stats.recordQuery().
+"""
+class TimedCursor(_cursor):
+	def execute(self, statement, params=None):
+		start = time.time()
+		try:
+			return _cursor.execute(self, statement, params)
+		finally:
+			db_stats.recordQuery(statement, params, time.time() - start, self.rowcount)
+
+	def executemany(self, statement, param_list):
+		start = time.time()
+		try:
+			return _cursor.executemany(self, statement, param_list)
+		finally:
+			db_stats.recordQuery(statement, None, time.time() - start, self.rowcount)
+
+"""
+The kind of connection the pool hands out. It remembers which statements from db_statements.py
+have already been prepared on it, since prepared statements only live as long as the connection does,
+and its cursors are TimedCursors.
+"""
+class PreparingConnection(_connection):
+	def __init__(self, *args, **kwargs):
+		_connection.__init__(self, *args, **kwargs)
+		self.prepared = set()
+		self.cursor_factory = TimedCursor
+
+"""
+Builds the connection pool. Calling this again after the pool exists does nothing.
+@params:
+	passw:   string, the password to access the db
+	minconn: int, number of connections opened right away and kept open
+	maxconn: int, most connections that can be checked out at the same time
+@returns:
+	the pool object
+"""
+def initPool(passw, minconn=POOL_MIN, maxconn=POOL_MAX):
+	global _pool
+	if _pool is None:
+		_pool = pool.ThreadedConnectionPool(minconn, maxconn, database=DB_NAME, user=DB_USER, password=passw,
+		                                    host=DB_HOST, port=DB_PORT, connection_factory=PreparingConnection)
+	return _pool
+
+"""
+Closes every connection in the pool. This is registered to run when the program exits.
+"""
+def closePool():
+	global _pool
+	if _pool is not None:
+		_pool.closeall()
+		_pool = None
+		_last_used.clear()
+
+atexit.register(closePool)
+
+"""
+Checks that a connection from the pool can still be used.
+Connections that were used recently are trusted; anything older gets a quick 'SELECT 1'.
+@params:
+	conn: psycopg2 connection
+@returns:
+	True if the connection is usable
+	False if it should be thrown away
+"""
+def _isHealthy(conn):
+	if conn.closed or conn.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN:
+		return False
+	if time.time() - _last_used.get(id(conn), 0) < HEALTH_CHECK_INTERVAL:
+		return True
+	try:
+		cur = conn.cursor()
+		cur.execute("SELECT 1")
+		cur.close()
+		conn.rollback()
+		return True
+	except psycopg2.Error:
+		return False
+
+"""
+Borrows a connection from the pool, building the pool first if myMDb.main hasn't done it yet.
+Broken connections are discarded and replaced.
+@params:
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	a psycopg2 connection, which must be handed back with putConn()
+"""
+def getConn(passw):
+	start = time.time()
+	initPool(passw)
+	conn = _pool.getconn()
+	while not _isHealthy(conn):
+		_last_used.pop(id(conn), None)
+		_pool.putconn(conn, close=True)
+		conn = _pool.getconn()
+	db_stats.recordAcquire(time.time() - start)
+	return conn
+
+"""
+Hands a connection back to the pool. Anything left uncommitted is rolled back.
+@params:
+	conn: psycopg2 connection that came from getConn()
+"""
+def putConn(conn):
+	if _pool is None:
+		conn.close()
+		return
+	broken = conn.closed != 0
+	if not broken and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+		try:
+			conn.rollback()
+		except psycopg2.Error:
+			broken = True
+	if broken:
+		_last_used.pop(id(conn), None)
+	else:
+		_last_used[id(conn)] = time.time()
+	_pool.putconn(conn, close=broken)
+
+"""
+Borrows a connection for the length of a 'with' block.
+The work done in the block is committed if it finishes, and rolled back if an exception is raised.
+Usage:
+	with connection(passw) as conn:
+		cur = conn.cursor()
+		...
+@params:
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+"""
+@contextmanager
+def connection(passw):
+	conn = getConn(passw)
+	try:
+		yield conn
+		conn.commit()
+	except:
+		try:
+			conn.rollback()
+		except psycopg2.Error:
+			pass
+		raise
+	finally:
+		putConn(conn)
@@ -0,0 +1,762 @@
+"""
+db_postgres.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+A series of functions used for myMDb project.
+These functions focus specifically on updating and querying the local PostgreSQL database.
+This is the PostgreSQL backend behind db_personal.py, and the one used unless another is configured (see db_backend.py).
+The functions that take a few statements and return an answer are coroutines (see db_aio.py): called as usual they run
+on a pooled connection, and db_async.py runs them on db_aio.py's event loop instead. The streaming, paging, search,
+and statistics functions use a pooled connection directly.
+"""
+from db_aio import coroutine, query, prepared, Return, COMMIT
+from db_backend import *
+from db_pool import connection
+
+#(title, year) -> id in MOVIES
+_movie_ids = IdCache(ID_CACHE_SIZE)
+#name -> id in PEOPLE
+_person_ids = IdCache(ID_CACHE_SIZE)
+
+#whether the pg_trgm extension is turned on in the db, checked the first time a fuzzy search runs
+_trigram = []
+
+#the columns of LIBRARY_STATS and LIBRARY_STATS_DELTA
+_LIBRARY_COLUMNS = ["MOVIES", "WATCHED", "UNWATCHED", "OWNED", "RATED", "RATING_SUM", "UNWATCHED_RUNTIME"]
+
+#key of the advisory lock held while LIBRARY_STATS_DELTA is folded into LIBRARY_STATS, so only one copy of the app does it
+_COMPACT_LOCK = 725061
+
+"""
+Returns the hit and miss counts of the movie and person id caches, e.g. to decide on ID_CACHE_SIZE.
+@returns:
+	a dictionary like {"movies": {"entries": .., "size": .., "hits": .., "misses": ..}, "people": {...}}
+"""
+def idCacheStats():
+	return {"movies": _movie_ids.stats(), "people": _person_ids.stats()}
+
+"""
+Empties both id caches. Anything that rewrites ids in bulk (merging duplicates, restoring a library)
+needs to call this so stale ids aren't handed out afterwards.
+"""
+def clearIdCaches():
+	_movie_ids.clear()
+	_person_ids.clear()
+
+"""
+Adds a person to PEOPLE
+Everyone is stored once, whatever they did: Clint Eastwood the actor and Clint Eastwood the director
+are the same row in PEOPLE, with 'actor' and 'director' credits in CREDITS (see addRole()).
+@params:
+	new_person: tempPerson object, the person to add to the db
+	passw:      string, the password to access the db carried over so the user doesn't have to enter it again
+@return:
+	True if the person is added
+	False if the person already existed
+"""
+@coroutine
+def addPerson(new_person, passw):
+	inserted = yield query("INSERT INTO PEOPLE (NAME) VALUES (%s) ON CONFLICT (NAME) DO NOTHING RETURNING ID", (new_person.name,))
+	if inserted == []:
+		raise Return(False)
+	yield COMMIT
+	_person_ids.put(new_person.name, inserted[0][0])
+	raise Return(True)
+
+"""
+Adds a movie to MOVIES
+Only title, year, runtime, mpaa, and rating are stored in the MOVIES table
+Movies are connected to people with the CREDITS table
+@params:
+	new_movie: tempMovie object, the movie to add to the db
+	passw:     string, the password to access the db carried over so the user doesn't have to enter it again
+@return:
+	True if the movie was added
+	False if the movie already existed
+"""
+@coroutine
+def addMovie(new_movie, passw):
+	inserted = yield query("INSERT INTO MOVIES (TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN) VALUES (%s,%s,%s,%s,%s,%s,%s) " +
+	                       "ON CONFLICT (TITLE, COALESCE(YEAR, '')) DO NOTHING RETURNING ID",
+	                       (new_movie.title, new_movie.year, new_movie.runtime, new_movie.mpaa, new_movie.rating, new_movie.watched, new_movie.own))
+	if inserted == []:
+		raise Return(False)
+	yield COMMIT
+	_movie_ids.put((new_movie.title, new_movie.year), inserted[0][0])
+	raise Return(True)
+
+"""
+Adds a credit for a person and movie to CREDITS, with the person's p_type as its ROLE
+@params:
+	amovie:  tempMovie object
+	aperson: tempPerson object
+	passw:   string, the password to access the db carried over so the user doesn't have to enter it again
+@return:
+	False if one of the two objects does not exist or the role was already recorded, entry is unsuccessful
+	True if the entry is successful
+"""
+@coroutine
+def addRole(amovie, aperson, passw):
+	added = yield query("INSERT INTO CREDITS (M_ID, P_ID, ROLE) SELECT MOVIES.ID, PEOPLE.ID, %s FROM MOVIES, PEOPLE " +
+	                    "WHERE MOVIES.TITLE = %s AND COALESCE(MOVIES.YEAR, '') = COALESCE(%s, '') AND PEOPLE.NAME = %s ON CONFLICT DO NOTHING",
+	                    (personType(aperson), amovie.title, amovie.year, aperson.name))
+	raise Return(added.rowcount == 1)
+
+"""
+A helper coroutine for addMovieWithCredits() and indexPendingCredits(). Stores credits, given as parallel arrays,
+in CREDITS, inserting the names that aren't in PEOPLE yet first, in the caller's transaction.
+Names that aren't in PEOPLE yet are inserted with one statement, then the CREDITS rows are built in billing order
+with a second one. Keeping them apart makes it safe to add movies from several threads at once (see db_async.py):
+the second statement always sees people that another thread added while the first one waited on them.
+Names are inserted in sorted order, so two such inserts can't deadlock each other.
+@params:
+	movie_ids: array of ids in MOVIES, one per credit
+	names:     array of uppercased names
+	roles:     array of roles
+@returns:
+	an array of (name, id in PEOPLE) to be cached once the transaction commits
+"""
+def _addCredits(movie_ids, names, roles):
+	if names == []:
+		raise Return([])
+	yield query("INSERT INTO PEOPLE (NAME) SELECT DISTINCT n FROM unnest(%s) AS n ORDER BY n " +
+	            "ON CONFLICT (NAME) DO NOTHING", (names,))
+	people = yield query("WITH PERSON_IDS AS (SELECT ID, NAME FROM PEOPLE WHERE NAME = ANY(%(names)s)), " +
+	                     "NEW_CREDITS AS (INSERT INTO CREDITS (M_ID, P_ID, ROLE) " +
+	                     "SELECT credit.m_id, PERSON_IDS.ID, credit.role " +
+	                     "FROM unnest(%(movie_ids)s::int[], %(names)s::text[], %(roles)s::text[]) WITH ORDINALITY AS credit(m_id, name, role, billing) " +
+	                     "JOIN PERSON_IDS ON PERSON_IDS.NAME = credit.name ORDER BY credit.billing ON CONFLICT DO NOTHING) " +
+	                     "SELECT ID, NAME FROM PERSON_IDS",
+	                     {"names": names, "roles": roles, "movie_ids": movie_ids})
+	raise Return([(name, person_id) for person_id, name in people])
+
+"""
+Adds a movie along with all of its directors, writers, and cast in a single transaction.
+This is what addStuff() uses instead of calling addPerson() and addRole() once per person.
+With top_billed, only the directors, writers, and first top_billed cast members are stored now. The rest of the cast
+is put in PENDING_CREDITS in the same transaction, for indexPendingCredits() to store later (see db_indexer.py),
+so a big ensemble cast doesn't keep the user waiting.
+If anything fails part way through, the whole movie is rolled back.
+Names are uppercased before they are stored, the same way addStuff() always did it.
+@params:
+	new_movie:  tempMovie object, the movie to add to the db, with its director, writer, and cast arrays filled in
+	passw:      string, the password to access the db carried over so the user doesn't have to enter it again
+	top_billed: int, cast members to store right away, or None to store every credit right away
+@return:
+	True if the movie and its credits were added (or queued)
+	False if the movie already existed
+"""
+@coroutine
+def addMovieWithCredits(new_movie, passw, top_billed=None):
+	inserted = yield query("INSERT INTO MOVIES (TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN) VALUES (%s,%s,%s,%s,%s,%s,%s) " +
+	                       "ON CONFLICT (TITLE, COALESCE(YEAR, '')) DO NOTHING RETURNING ID",
+	                       (new_movie.title, new_movie.year, new_movie.runtime, new_movie.mpaa, new_movie.rating, new_movie.watched, new_movie.own))
+	if inserted == []:
+		raise Return(False)
+	movie_id = inserted[0][0]
+	names, roles = creditLists(new_movie)
+	names, roles, later_names, later_roles = splitCredits(names, roles, top_billed)
+	person_ids = yield _addCredits([movie_id] * len(names), names, roles)
+	if later_names != []:
+		yield query("INSERT INTO PENDING_CREDITS (M_ID, NAMES, ROLES, CREDITS) VALUES (%s, %s, %s, %s)",
+		            (movie_id, later_names, later_roles, len(later_names)))
+	#only once everything is committed can the new ids be cached
+	yield COMMIT
+	_movie_ids.put((new_movie.title, new_movie.year), movie_id)
+	for name, person_id in person_ids:
+		_person_ids.put(name, person_id)
+	raise Return(True)
+
+"""
+Stores the queued credits of the movies that have waited longest in PENDING_CREDITS (see addMovieWithCredits()),
+as one batch: at most limit movies, and no more movies once credit_limit credits have been gathered (but always one).
+The credits are stored and their rows taken out of the queue in the same transaction, so if the app stops part way
+through, the batch is simply still in the queue the next time. Rows another copy of the app is storing are skipped.
+@params:
+	passw:        string, the password to access the db carried over so the user doesn't have to enter it again
+	limit:        int, most movies to do
+	credit_limit: int, credits after which no more movies are added to the batch
+@returns:
+	int number of movies whose credits were stored, 0 once the queue is empty
+"""
+@coroutine
+def indexPendingCredits(passw, limit=QUEUE_BATCH, credit_limit=QUEUE_BATCH_CREDITS):
+	queued = yield query("SELECT M_ID, NAMES, ROLES FROM PENDING_CREDITS ORDER BY M_ID LIMIT %s FOR UPDATE SKIP LOCKED", (limit,))
+	movie_ids = []
+	credit_ids = []
+	names = []
+	roles = []
+	for movie_id, movie_names, movie_roles in queued:
+		if names != [] and len(names) + len(movie_names) > credit_limit:
+			break
+		movie_ids.append(movie_id)
+		credit_ids.extend([movie_id] * len(movie_names))
+		names.extend(movie_names)
+		roles.extend(movie_roles)
+	if movie_ids == []:
+		raise Return(0)
+	person_ids = yield _addCredits(credit_ids, names, roles)
+	yield query("DELETE FROM PENDING_CREDITS WHERE M_ID = ANY(%s)", (movie_ids,))
+	yield COMMIT
+	for name, person_id in person_ids:
+		_person_ids.put(name, person_id)
+	raise Return(len(movie_ids))
+
+"""
+Tells how far behind indexPendingCredits() is.
+@params:
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+	limit: int, most waiting movies to list
+@returns:
+	a dictionary with the number of "movies" and "credits" waiting, and under "waiting",
+	the first limit of those movies, oldest first, as [(title, year, credits waiting), ...]
+"""
+def creditQueueStatus(passw, limit=PAGE_SIZE):
+	with connection(passw) as conn:
+		cur = conn.cursor()
+		cur.execute("SELECT count(*), COALESCE(sum(CREDITS), 0) FROM PENDING_CREDITS")
+		movies, credits = cur.fetchone()
+		cur.execute("SELECT MOVIES.TITLE, MOVIES.YEAR, PENDING_CREDITS.CREDITS FROM PENDING_CREDITS " +
+		            "JOIN MOVIES ON MOVIES.ID = PENDING_CREDITS.M_ID ORDER BY PENDING_CREDITS.M_ID LIMIT %s", (limit,))
+		waiting = cur.fetchall()
+	return {"movies": int(movies), "credits": int(credits), "waiting": waiting}
+
+"""
+Checks whether all of a movie's credits are stored, or some are still waiting in PENDING_CREDITS.
+@params:
+	g_movie: tempMovie object
+	passw:   string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	True if the movie is in the db and none of its credits are waiting, False otherwise
+"""
+@coroutine
+def isFullyIndexed(g_movie, passw):
+	movie_id = g_movie.movie_id or (yield getMovieID.coroutine(g_movie, passw))
+	if movie_id is None:
+		raise Return(False)
+	pending = yield query("SELECT 1 FROM PENDING_CREDITS WHERE M_ID = %s", (movie_id,))
+	raise Return(pending == [])
+
+#def manualAddMovie():
+"""
+Searches for movies with a matching title.
+@params:
+	title: string, the title of the movie being searched for
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	an array of tempMovie objects that match the title
+	None if no movies are found
+"""
+@coroutine
+def getMovies(title, passw):
+	rows = yield query("SELECT * from MOVIES WHERE title = %s", (title,))
+	found_movies = yield _buildMovies(rows)
+	if found_movies != []:
+		raise Return(found_movies)
+
+"""
+Gets several movies, with their directors, writers, and cast, by their ids in the MOVIES table.
+Like getMovies(), this takes the same two queries whether 1 or 500 ids are asked for.
+@params:
+	movie_ids: array of ints, ids from the MOVIES table
+	passw:     string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	an array of tempMovie objects, in the same order as movie_ids. Ids that don't exist are skipped.
+"""
+@coroutine
+def getMoviesByIds(movie_ids, passw):
+	if not movie_ids:
+		raise Return([])
+	rows = {}
+	for row in (yield query("SELECT * from MOVIES WHERE ID = ANY(%s)", (list(movie_ids),))):
+		rows[row[0]] = row
+	found_movies = yield _buildMovies([rows[m_id] for m_id in movie_ids if m_id in rows])
+	raise Return(found_movies)
+
+"""
+A helper coroutine for getMovies() and getMoviesByIds(). Turns full rows from the MOVIES table into tempMovie objects.
+The directors, writers, and cast of every movie are fetched together in one query,
+with the names already gathered into an array per movie (in billing order) by the server.
+@params:
+	rows: array of full MOVIES rows (ID,TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN)
+@returns:
+	an array of tempMovie objects, in the same order as rows
+"""
+def _buildMovies(rows):
+	if rows == []:
+		raise Return([])
+	credits = {}
+	for row in rows:
+		credits[row[0]] = {"actor": [], "director": [], "writer": []}
+	credit_rows = yield query("SELECT CREDITS.M_ID, CREDITS.ROLE, array_agg(PEOPLE.NAME ORDER BY CREDITS.ID) FROM CREDITS, PEOPLE " +
+	                          "WHERE CREDITS.M_ID = ANY(%s) AND PEOPLE.ID = CREDITS.P_ID GROUP BY CREDITS.M_ID, CREDITS.ROLE",
+	                          (list(credits.keys()),))
+	for m_id, p_type, names in credit_rows:
+		credits[m_id][p_type] = names
+	found_movies = []
+	for row in rows:
+		people = credits[row[0]]
+		found_movies.append(tempMovie(row[1], people["director"], people["writer"], people["actor"], row[2], row[3], row[4], row[5], row[6], row[7],
+		                              movie_id=row[0]))
+	raise Return(found_movies)
+
+"""
+Given a person, returns info from the Movies table for all the films they've worked on.
+@params:
+	person: tempPerson object
+	passw:  string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	an array of tempMovie objects where the people categories are 'None'
+	None if the person has no credits of their p_type in the database
+"""
+@coroutine
+def portfolio(person, passw):
+	person_id = yield _creditedID.coroutine(person, passw)
+	if person_id == None:
+		raise Return(None)
+	rows = yield prepared("portfolio", (person_id, personType(person)))
+	found_movies = []
+	for row in rows:
+		found_movies.append(simpleMovie(row))
+	raise Return(found_movies)
+
+"""
+Like portfolio(), but hands the movies back one at a time as they arrive instead of building the whole array first.
+The rows come from a server-side cursor, batch_size rows per round trip, so memory use stays the same however
+many movies the person worked on. The pooled connection is held until the generator is finished or thrown away.
+@params:
+	person:     tempPerson object
+	passw:      string, the password to access the db carried over so the user doesn't have to enter it again
+	batch_size: int, number of rows fetched from the server at a time
+@returns:
+	a generator of tempMovie objects where the people categories are 'None' (empty if the person isn't in the database)
+"""
+def iterPortfolio(person, passw, batch_size=STREAM_BATCH_SIZE):
+	person_id = getPersonID(person, passw)
+	if person_id == None:
+		return
+	for movie in _streamMovies("SELECT TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES, CREDITS " +
+	                           "WHERE CREDITS.P_ID = %s AND CREDITS.ROLE = %s AND MOVIES.ID = CREDITS.M_ID",
+	                           (person_id, personType(person)), passw, batch_size):
+		yield movie
+
+"""
+Gets one page of a person's portfolio, for showing a long list a screen at a time.
+Pages are found by the last MOVIES id of the previous page (keyset pagination), so every page is
+equally quick to get, however far into the list it is.
+@params:
+	person:   tempPerson object
+	passw:    string, the password to access the db carried over so the user doesn't have to enter it again
+	after_id: the key returned with the previous page, or None for the first page
+	limit:    int, most movies on a page
+@returns:
+	(array of tempMovie objects, key for the next page or None if this is the last page)
+	None if the person has no credits of their p_type in the database
+"""
+def portfolioPage(person, passw, after_id=None, limit=PAGE_SIZE):
+	person_id = _creditedID(person, passw)
+	if person_id == None:
+		return None
+	return _moviePage("SELECT MOVIES.ID,TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES, CREDITS " +
+	                  "WHERE CREDITS.P_ID = %s AND CREDITS.ROLE = %s AND MOVIES.ID = CREDITS.M_ID" +
+	                  " AND MOVIES.ID > %s ORDER BY MOVIES.ID LIMIT %s", (person_id, personType(person)), passw, after_id, limit)
+
+"""
+Returns every movie in the database a person worked on, in any role, along with what they did on each.
+This is a single query on the (P_ID, ROLE, M_ID) index of CREDITS.
+@params:
+	name:  string, the person's name
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	an array of (tempMovie object where the people categories are 'None', array of roles like ["actor", "director"])
+	None if the person does not exist in the database
+"""
+@coroutine
+def filmography(name, passw):
+	person_id = yield getPersonID.coroutine(tempPerson(name, None), passw)
+	if person_id == None:
+		raise Return(None)
+	rows = yield prepared("filmography", (person_id,))
+	raise Return([(simpleMovie(row[:-1]), row[-1]) for row in rows])
+
+"""
+Returns all movies that the user hasn't watched.
+@params:
+	passw:  string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	an array of tempMovie objects 
+"""
+@coroutine
+def getMoviesToWatch(passw):
+	rows = yield query("SELECT TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN from MOVIES WHERE MOVIES.watched = FALSE")
+	found_movies = []
+	for row in rows:
+		found_movies.append(simpleMovie(row))
+	raise Return(found_movies)
+
+"""
+Like getMoviesToWatch(), but hands the movies back one at a time from a server-side cursor (see iterPortfolio()).
+@params:
+	passw:      string, the password to access the db carried over so the user doesn't have to enter it again
+	batch_size: int, number of rows fetched from the server at a time
+@returns:
+	a generator of tempMovie objects
+"""
+def iterMoviesToWatch(passw, batch_size=STREAM_BATCH_SIZE):
+	for movie in _streamMovies("SELECT TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES WHERE WATCHED = FALSE",
+	                           (), passw, batch_size):
+		yield movie
+
+"""
+Gets one page of the movies the user hasn't watched (see portfolioPage()).
+@params:
+	passw:    string, the password to access the db carried over so the user doesn't have to enter it again
+	after_id: the key returned with the previous page, or None for the first page
+	limit:    int, most movies on a page
+@returns:
+	(array of tempMovie objects, key for the next page or None if this is the last page)
+"""
+def getMoviesToWatchPage(passw, after_id=None, limit=PAGE_SIZE):
+	return _moviePage("SELECT ID,TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES WHERE WATCHED = FALSE" +
+	                  " AND ID > %s ORDER BY ID LIMIT %s", (), passw, after_id, limit)
+
+"""
+Gets the numbers shown on the (S)tatistics screen.
+They are read from LIBRARY_STATS and PERSON_STATS, which triggers keep up to date as movies and credits change
+(see versions 3 and 5 in db_migrate.py), so this takes the same time however big the library is.
+The movie totals are LIBRARY_STATS plus the changes waiting in LIBRARY_STATS_DELTA, which are folded into it
+once there are STATS_COMPACT_ROWS of them. People with the same number of movies are picked in P_ID order.
+@params:
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+	top:   int, number of people to list for each role
+@returns:
+	a dictionary with the number of "movies", "watched", "unwatched", and "owned" movies, the "average_rating" of the
+	movies that have one (None if none do), the "unwatched_runtime" in minutes, and under "top", the people with the most
+	movies in the library for each role, like {"director": [(name, number of movies), ...], "writer": [...], "actor": [...]}
+"""
+def getLibraryStats(passw, top=STATS_TOP):
+	with connection(passw) as conn:
+		cur = conn.cursor()
+		columns = ", ".join(_LIBRARY_COLUMNS)
+		cur.execute("SELECT sum(MOVIES)::int, sum(WATCHED)::int, sum(UNWATCHED)::int, sum(OWNED)::int, sum(RATED)::int, " +
+		            "sum(RATING_SUM), sum(UNWATCHED_RUNTIME)::bigint, count(*) - 1 FROM (SELECT " + columns + " FROM LIBRARY_STATS " +
+		            "UNION ALL SELECT " + columns + " FROM LIBRARY_STATS_DELTA) totals")
+		movies, watched, unwatched, owned, rated, rating_sum, unwatched_runtime, deltas = cur.fetchone()
+		stats = {"movies": movies, "watched": watched, "unwatched": unwatched, "owned": owned, "average_rating": None,
+		         "unwatched_runtime": unwatched_runtime, "top": {"director": [], "writer": [], "actor": []}}
+		if rated > 0:
+			stats["average_rating"] = float(rating_sum) / rated
+		cur.execute("SELECT wanted.role, PEOPLE.NAME, best.MOVIES FROM unnest(%s) AS wanted(role), " +
+		            "LATERAL (SELECT P_ID, MOVIES FROM PERSON_STATS WHERE PERSON_STATS.ROLE = wanted.role AND MOVIES > 0 " +
+		            "ORDER BY MOVIES DESC, P_ID LIMIT %s) best, PEOPLE WHERE PEOPLE.ID = best.P_ID " +
+		            "ORDER BY wanted.role, best.MOVIES DESC, PEOPLE.NAME", (list(stats["top"].keys()), top))
+		for role, name, count in cur.fetchall():
+			stats["top"][role].append((name, count))
+		if deltas >= STATS_COMPACT_ROWS:
+			_compactLibraryStats(cur)
+	return stats
+
+"""
+A helper function for getLibraryStats(). Adds the rows of LIBRARY_STATS_DELTA to LIBRARY_STATS and deletes them,
+in the caller's transaction. If another copy of the app is already doing it, this does nothing.
+"""
+def _compactLibraryStats(cur):
+	cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (_COMPACT_LOCK,))
+	if not cur.fetchone()[0]:
+		return
+	cur.execute("WITH folded AS (DELETE FROM LIBRARY_STATS_DELTA RETURNING *) UPDATE LIBRARY_STATS SET " +
+	            ", ".join([column + " = LIBRARY_STATS." + column + " + sums." + column for column in _LIBRARY_COLUMNS]) +
+	            " FROM (SELECT " + ", ".join(["COALESCE(sum(" + column + "), 0) AS " + column for column in _LIBRARY_COLUMNS]) +
+	            " FROM folded) sums")
+
+"""
+A helper function for iterPortfolio() and iterMoviesToWatch(). Runs a query on a server-side (named) cursor
+and yields a tempMovie for each row, fetching batch_size rows at a time.
+"""
+def _streamMovies(query, params, passw, batch_size):
+	with connection(passw) as conn:
+		cur = conn.cursor("mymdb_stream")
+		cur.itersize = batch_size
+		cur.execute(query, params)
+		for row in cur:
+			yield simpleMovie(row)
+		cur.close()
+
+"""
+A helper function for portfolioPage() and getMoviesToWatchPage(). The query has to select the MOVIES id first,
+then the usual (TITLE,...,OWN) columns, and end with "ID > %s ORDER BY ID LIMIT %s".
+One extra row is asked for, just to find out whether there is another page after this one.
+"""
+def _moviePage(query, params, passw, after_id, limit):
+	with connection(passw) as conn:
+		cur = conn.cursor()
+		cur.execute(query, params + (after_id or 0, limit + 1))
+		rows = cur.fetchall()
+	found_movies = [simpleMovie(row[1:]) for row in rows[:limit]]
+	if len(rows) > limit:
+		return found_movies, rows[limit - 1][0]
+	return found_movies, None
+
+"""
+Finds the movies whose titles come closest to what the user typed, for when getMovies() finds no exact match.
+Titles are ranked by how much of the text they contain (pg_trgm's word similarity), so typos, missing words,
+and partial titles still turn something up, and titles starting with the text always count as matches.
+Both kinds of match are answered from the trigram index built by db_migrate.addSearchIndexes(), not a table scan.
+If pg_trgm isn't available, only titles starting with the text are found.
+@params:
+	text:  string, (part of) the title being searched for
+	passw: string, the password to access the db carried over so the user doesn't have to enter it again
+	limit: int, most matches to return
+@returns:
+	an array of (tempMovie object where the people categories are 'None', score from 0 to 1), best match first
+"""
+def fuzzyMovies(text, passw, limit=FUZZY_LIMIT):
+	return _fuzzySearch("SELECT TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN, %s FROM MOVIES", "TITLE", text, passw, limit,
+	                    simpleMovie)
+
+"""
+Finds the actors, directors, or writers whose names come closest to the one typed (see fuzzyMovies()).
+Only people with credits of the person's p_type are matched.
+@params:
+	person: tempPerson object, with the (partial or misspelled) name and the type of person to look for
+	passw:  string, the password to access the db carried over so the user doesn't have to enter it again
+	limit:  int, most matches to return
+@returns:
+	an array of (tempPerson object, score from 0 to 1), best match first
+"""
+def fuzzyPeople(person, passw, limit=FUZZY_LIMIT):
+	p_type = personType(person)
+	return _fuzzySearch("SELECT NAME, %s FROM PEOPLE", "NAME", person.name, passw, limit,
+	                    lambda row: tempPerson(row[0], p_type),
+	                    "EXISTS (SELECT 1 FROM CREDITS WHERE P_ID = PEOPLE.ID AND ROLE = %(role)s)", {"role": p_type})
+
+"""
+A helper function for fuzzyMovies() and fuzzyPeople().
+@params:
+	select: string, the start of the query, with a %s where the score column goes
+	column: string, the column being searched
+	text:   string, what the user typed
+	make:   function that turns a row (without its score) into the object handed back
+	where:  string, an extra condition every match has to meet, or None
+	extra:  dictionary of the parameters used in where
+@returns:
+	an array of (object, score), best match first
+"""
+def _fuzzySearch(select, column, text, passw, limit, make, where=None, extra={}):
+	text = text.strip().upper()
+	if text == "":
+		return []
+	#the text is matched literally, so LIKE's wildcards in it have to be escaped
+	params = {"text": text, "prefix": likePrefix(text), "limit": limit}
+	params.update(extra)
+	condition = ""
+	if where != None:
+		condition = " AND " + where
+	with connection(passw) as conn:
+		cur = conn.cursor()
+		if _trigram == []:
+			cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+			_trigram.append(cur.fetchone() != None)
+		if _trigram[0]:
+			cur.execute(select % ("word_similarity(%(text)s, " + column + ") AS SCORE") +
+			            " WHERE (%(text)s <%% " + column + " OR " + column + " LIKE %(prefix)s)" + condition +
+			            " ORDER BY SCORE DESC, " + column + " LIMIT %(limit)s", params)
+		else:
+			cur.execute(select % "1.0" + " WHERE " + column + " LIKE %(prefix)s" + condition + " ORDER BY " + column + " LIMIT %(limit)s", params)
+		rows = cur.fetchall()
+	return [(make(row[:-1]), float(row[-1])) for row in rows]
+
+"""
+Checks for a duplicate of the movie object entered.
+As of version 1.0, 2 movies with the same year and title cannot exist in the db.
+@params:
+	h_movie: tempMovie object, movie we are checking the db for.
+	passw:   string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	False if no movie in the db matches h_movie
+	True if match is found
+"""
+@coroutine
+def hasMovie(h_movie, passw):
+	movie_id = yield getMovieID.coroutine(h_movie, passw)
+	raise Return(movie_id != None)
+
+"""
+Checks whether the person entered has worked on a movie in the db as their p_type,
+e.g. whether tempPerson("CLINT EASTWOOD", "director") has directed anything in the db.
+@params:
+	h_person: tempPerson object, person we are checking the db for.
+	passw:    string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	False if no person in the db matches h_person in that role
+	True if match is found
+"""
+@coroutine
+def hasPerson(h_person, passw):
+	person_id = yield _creditedID.coroutine(h_person, passw)
+	raise Return(person_id != None)
+
+"""
+A helper function for hasPerson() and the portfolio functions.
+Returns the person's id in PEOPLE if they have at least one credit of their p_type, None otherwise.
+"""
+@coroutine
+def _creditedID(person, passw):
+	person_id = yield getPersonID.coroutine(person, passw)
+	if person_id == None:
+		raise Return(None)
+	credited = yield prepared("has_role", (person_id, personType(person)))
+	if credited != []:
+		raise Return(person_id)
+
+"""
+Finds the id of the desired movie in the MOVIES table.
+@params:
+	g_movie: tempMovie object
+	passw:   string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	int id of the movie if it exists
+	None if the movie is not in the db
+"""
+@coroutine
+def getMovieID(g_movie, passw):
+	key = (g_movie.title, g_movie.year)
+	movie_id = _movie_ids.get(key)
+	if movie_id != None:
+		raise Return(movie_id)
+	result = yield prepared("movie_id", key)
+	if result != []:
+		_movie_ids.put(key, result[0][0])
+		raise Return(result[0][0])
+
+"""
+Finds the id of the desired person in the PEOPLE table. The person's p_type doesn't matter here.
+@params:
+	g_person: tempPerson object
+	passw:    string, the password to access the db carried over so the user doesn't have to enter it again
+@returns:
+	int id of the person if it exists
+	None if the person is not in the db
+"""
+@coroutine
+def getPersonID(g_person, passw):
+	person_id = _person_ids.get(g_person.name)
+	if person_id != None:
+		raise Return(person_id)
+	result = yield prepared("person_id", (g_person.name,))
+	if result != []:
+		_person_ids.put(g_person.name, result[0][0])
+		raise Return(result[0][0])
+
+"""
+Changes any combination of a movie's rating, watched, and own flags with a single UPDATE.
+The movie is found by its id: the one it came out of the db with (see tempMovie.movie_id), or the one in the id cache.
+If neither is known it is found by title and year in the same statement, so it never takes more than one round trip.
+@params:
+	u_movie: tempMovie object representing the movie to be updated
+	passw:   string, the password to access the db carried over so the user doesn't have to enter it again
+	rating:  string, the rating to give the movie, CLEAR_RATING to take it away, or None to leave it as it is
+	watched: boolean, whether it has been seen, or None to leave it as it is
+	own:     boolean, whether it is owned, or None to leave it as it is
+@returns:
+	True if the movie was updated
+	False if it isn't in the db (or there was nothing to change)
+"""
+@coroutine
+def updateMovie(u_movie, passw, rating=None, watched=None, own=None):
+	if rating is None and watched is None and own is None:
+		raise Return(False)
+	changes = (rating, _flag(watched), _flag(own))
+	movie_id = u_movie.movie_id or _movie_ids.get((u_movie.title, u_movie.year))
+	if movie_id != None:
+		updated = yield prepared("update_movie", changes + (movie_id,))
+	else:
+		updated = yield prepared("update_movie_by_title", changes + (u_movie.title, u_movie.year))
+	yield COMMIT
+	if updated == []:
+		#the movie isn't there (anymore), so the id it was found by can't be trusted either
+		_movie_ids.invalidate((u_movie.title, u_movie.year))
+		raise Return(False)
+	_movie_ids.put((u_movie.title, u_movie.year), updated[0][0])
+	raise Return(True)
+
+"""
+Turns a yes/no value into a boolean, leaving None (no change) as it is.
+"""
+def _flag(value):
+	if value is None:
+		return None
+	return bool(value)
+
+"""
+Changes the rating, watched, and/or own flags of a whole set of movies with a single UPDATE, e.g. to mark every movie
+by a director as watched, or a few hundred movies as owned. Movies that already have those values aren't touched.
+At least one of movie_ids and person has to be given. If both are, only movies that match both are changed.
+@params:
+	passw:     string, the password to access the db carried over so the user doesn't have to enter it again
+	movie_ids: array of ids in the MOVIES table (see tempMovie.movie_id), or None
+	person:    tempPerson object, to change every movie they have a credit of their p_type in, or None
+	rating:    string, the rating to give the movies, CLEAR_RATING to take it away, or None to leave it as it is
+	watched:   boolean, or None to leave it as it is
+	own:       boolean, or None to leave it as it is
+@returns:
+	int, the number of movies that were changed
+"""
+@coroutine
+def updateMovies(passw, movie_ids=None, person=None, rating=None, watched=None, own=None):
+	if movie_ids is None and person is None:
+		raise ValueError("updateMovies() needs movie_ids and/or a person to pick the movies to change")
+	changes = [(column, value) for column, value in (("RATING", rating), ("WATCHED", _flag(watched)), ("OWN", _flag(own)))
+	           if value is not None]
+	#CLEAR_RATING takes the rating away, which is stored as NULL
+	changes = [(column, None if value == CLEAR_RATING else value) for column, value in changes]
+	if changes == [] or movie_ids == []:
+		raise Return(0)
+	statement = "UPDATE MOVIES SET " + ", ".join([column + " = %s" for column, value in changes]) + " WHERE (" + \
+	        " OR ".join([column + " IS DISTINCT FROM %s" for column, value in changes]) + ")"
+	params = [value for column, value in changes] * 2
+	if movie_ids is not None:
+		statement += " AND ID = ANY(%s)"
+		params.append(list(movie_ids))
+	if person is not None:
+		statement += " AND ID IN (SELECT CREDITS.M_ID FROM CREDITS, PEOPLE WHERE PEOPLE.NAME = %s AND CREDITS.P_ID = PEOPLE.ID " + \
+		         "AND CREDITS.ROLE = %s)"
+		params += [person.name, personType(person)]
+	updated = yield query(statement, params)
+	raise Return(updated.rowcount)
+
+"""
+Change/Add a rating to an existing movie in the database, or take it away (see updateMovie()).
+@params:
+	r_movie: tempMovie object representing the movie to be updated
+	rating:  float, the rating to give to the movie, or None to clear it
+	passw:   string, the password to access the db carried over so the user doesn't have to enter it again
+"""
+@coroutine
+def setRating(r_movie, rating, passw):
+	updated = yield updateMovie.coroutine(r_movie, passw, rating=CLEAR_RATING if rating is None else rating)
+	raise Return(updated)
+
+"""
+Mark an existing movie as "Owned" (see updateMovie())
+@params:
+	o_movie: tempMovie object representing the movie to be updated
+	own:     boolean, what to set the value of 'own' to
+	passw:   string, the password to access the db carried over so the user doesn't have to enter it again
+"""
+@coroutine
+def setOwn(o_movie, own, passw):
+	updated = yield updateMovie.coroutine(o_movie, passw, own=bool(own))
+	raise Return(updated)
+
+"""
+Mark an existing movie as "Watched" (see updateMovie())
+@params:
+	w_movie: tempMovie object representing the movie to be updated
+	passw:   string, the password to access the db carried over so the user doesn't have to enter it again
+"""
+@coroutine
+def setWatched(w_movie, watched, passw):
+	updated = yield updateMovie.coroutine(w_movie, passw, watched=bool(watched))
+	raise Return(updated)
@@ -0,0 +1,923 @@
+"""
+db_sqlite.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+A series of functions used for myMDb project.
+This is the SQLite backend behind db_personal.py: the whole library is one file (DB_PATH), read and written
+in-process, so there is no server to install or start, no password, and no network round trip on every query.
+It is picked with MYMDB_BACKEND=sqlite (see db_backend.py), and has the same functions, arguments, and results
+as db_postgres.py. The passw arguments are only there to keep it that way, and are ignored.
+The tables, indexes, and statistics are the same as the PostgreSQL ones (see db_migrate.py). The file is kept in WAL mode,
+so reads never wait for a write, and writes from several threads (see db_async.py) take turns.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import db_stats
+from db_backend import *
+
+DB_PATH = os.environ.get("MYMDB_SQLITE", os.path.join(os.path.expanduser("~"), ".mymdb", "library.sqlite"))
+
+#how long (in seconds) a write waits for another thread's write to finish before giving up
+BUSY_TIMEOUT = 30
+
+#most values put in one "IN (?, ?, ...)" list, to stay under SQLite's limit on the number of parameters
+IN_LIST_SIZE = 500
+
+#BOOLEAN columns are stored as 0 and 1, and come back as False and True like they do from PostgreSQL
+sqlite3.register_converter("BOOLEAN", lambda value: value == "1")
+
+_local = threading.local()
+
+#(title, year) -> id in MOVIES
+_movie_ids = IdCache(ID_CACHE_SIZE)
+#name -> id in PEOPLE
+_person_ids = IdCache(ID_CACHE_SIZE)
+
+"""
+The SQL behind RATING_VALUE(): the rating as a number, or None if it isn't one (like "n/a").
+"""
+def _ratingValue(rating):
+	if rating is not None and re.match(r"^[0-9]+([.][0-9]+)?$", rating.strip()):
+		return float(rating.strip())
+
+"""
+The SQL behind RUNTIME_MINUTES(): the first number in the runtime, or 0 if there isn't one.
+"""
+def _runtimeMinutes(runtime):
+	found = re.search(r"[0-9]+", runtime or "")
+	if found:
+		return int(found.group(0))
+	return 0
+
+#The totals kept in LIBRARY_STATS, and how much one MOVIES row ({row} is NEW or OLD) adds to each
+_LIBRARY_SUMS = [("MOVIES", "1"),
+                 ("WATCHED", "({row}.WATCHED IS 1)"),
+                 ("UNWATCHED", "({row}.WATCHED IS 0)"),
+                 ("OWNED", "({row}.OWN IS 1)"),
+                 ("RATED", "(RATING_VALUE({row}.RATING) IS NOT NULL)"),
+                 ("RATING_SUM", "COALESCE(RATING_VALUE({row}.RATING), 0)"),
+                 ("UNWATCHED_RUNTIME", "(CASE WHEN {row}.WATCHED IS 0 THEN RUNTIME_MINUTES({row}.RUNTIME) ELSE 0 END)")]
+
+"""
+Builds the SET list that adds a row to LIBRARY_STATS and/or takes one out.
+@params:
+	added:   "NEW", or None
+	removed: "OLD", or None
+"""
+def _applyLibrarySums(added, removed):
+	changes = []
+	for column, amount in _LIBRARY_SUMS:
+		change = column
+		if removed is not None:
+			change += " - " + amount.format(row=removed)
+		if added is not None:
+			change += " + " + amount.format(row=added)
+		changes.append(column + " = " + change)
+	return ", ".join(changes)
+
+"""
+Version 1: everything db_migrate.py builds for PostgreSQL, as of its version 3. SQLite's triggers run once per row,
+so each one just adds or takes out the row it was fired for.
+"""
+def _libraryTables(conn):
+	conn.execute('''CREATE TABLE MOVIES
+		(ID        INTEGER            PRIMARY KEY,
+		TITLE      TEXT               NOT NULL,
+		YEAR       TEXT,
+		RUNTIME    TEXT,
+		MPAA       TEXT,
+		RATING     TEXT,
+		WATCHED    BOOLEAN,
+		OWN        BOOLEAN);''')
+	conn.execute('''CREATE TABLE PEOPLE
+		(ID        INTEGER            PRIMARY KEY,
+		NAME       TEXT               NOT NULL);''')
+	conn.execute('''CREATE TABLE CREDITS
+		(ID        INTEGER            PRIMARY KEY,
+		M_ID       INTEGER            NOT NULL   REFERENCES MOVIES(ID) ON DELETE CASCADE,
+		P_ID       INTEGER            NOT NULL   REFERENCES PEOPLE(ID) ON DELETE CASCADE,
+		ROLE       TEXT               NOT NULL   CHECK (ROLE IN ('actor', 'director', 'writer')));''')
+	conn.execute("CREATE UNIQUE INDEX MOVIES_TITLE_YEAR_KEY ON MOVIES (TITLE, YEAR)")
+	conn.execute("CREATE INDEX MOVIES_UNWATCHED_IDX ON MOVIES (ID) WHERE WATCHED = 0")
+	conn.execute("CREATE UNIQUE INDEX PEOPLE_NAME_KEY ON PEOPLE (NAME)")
+	conn.execute("CREATE UNIQUE INDEX CREDITS_M_ID_ROLE_P_ID_KEY ON CREDITS (M_ID, ROLE, P_ID)")
+	conn.execute("CREATE INDEX CREDITS_P_ID_ROLE_M_ID_IDX ON CREDITS (P_ID, ROLE, M_ID)")
+	#what fuzzyMovies() and fuzzyPeople() match the start of titles and names on, whatever their case
+	conn.execute("CREATE INDEX MOVIES_TITLE_NOCASE_IDX ON MOVIES (TITLE COLLATE NOCASE)")
+	conn.execute("CREATE INDEX PEOPLE_NAME_NOCASE_IDX ON PEOPLE (NAME COLLATE NOCASE)")
+
+	conn.execute('''CREATE TABLE LIBRARY_STATS
+		(ID                 INTEGER            PRIMARY KEY   CHECK (ID = 1),
+		MOVIES              INTEGER            NOT NULL,
+		WATCHED             INTEGER            NOT NULL,
+		UNWATCHED           INTEGER            NOT NULL,
+		OWNED               INTEGER            NOT NULL,
+		RATED               INTEGER            NOT NULL,
+		RATING_SUM          REAL               NOT NULL,
+		UNWATCHED_RUNTIME   INTEGER            NOT NULL);''')
+	conn.execute('''CREATE TABLE PERSON_STATS
+		(P_ID      INTEGER            NOT NULL   REFERENCES PEOPLE(ID) ON DELETE CASCADE,
+		ROLE       TEXT               NOT NULL,
+		MOVIES     INTEGER            NOT NULL,
+		PRIMARY KEY (P_ID, ROLE));''')
+	conn.execute("CREATE INDEX PERSON_STATS_ROLE_MOVIES_IDX ON PERSON_STATS (ROLE, MOVIES DESC)")
+	conn.execute("INSERT INTO LIBRARY_STATS VALUES (1, 0, 0, 0, 0, 0, 0, 0)")
+	conn.execute("CREATE TRIGGER MOVIES_INSERT_STATS AFTER INSERT ON MOVIES BEGIN " +
+	             "UPDATE LIBRARY_STATS SET " + _applyLibrarySums("NEW", None) + "; END")
+	conn.execute("CREATE TRIGGER MOVIES_DELETE_STATS AFTER DELETE ON MOVIES BEGIN " +
+	             "UPDATE LIBRARY_STATS SET " + _applyLibrarySums(None, "OLD") + "; END")
+	conn.execute("CREATE TRIGGER MOVIES_UPDATE_STATS AFTER UPDATE ON MOVIES BEGIN " +
+	             "UPDATE LIBRARY_STATS SET " + _applyLibrarySums("NEW", "OLD") + "; END")
+	conn.execute("CREATE TRIGGER CREDITS_INSERT_STATS AFTER INSERT ON CREDITS BEGIN " +
+	             "INSERT INTO PERSON_STATS (P_ID, ROLE, MOVIES) VALUES (NEW.P_ID, NEW.ROLE, 1) " +
+	             "ON CONFLICT (P_ID, ROLE) DO UPDATE SET MOVIES = MOVIES + 1; END")
+	conn.execute("CREATE TRIGGER CREDITS_DELETE_STATS AFTER DELETE ON CREDITS BEGIN " +
+	             "UPDATE PERSON_STATS SET MOVIES = MOVIES - 1 WHERE P_ID = OLD.P_ID AND ROLE = OLD.ROLE; END")
+
+"""
+Version 2: PENDING_CREDITS, as in db_migrate.py's version 4. SQLite has no arrays, so the names and roles are JSON.
+"""
+def _creditQueue(conn):
+	conn.execute('''CREATE TABLE PENDING_CREDITS
+		(M_ID      INTEGER            PRIMARY KEY   REFERENCES MOVIES(ID) ON DELETE CASCADE,
+		NAMES      TEXT               NOT NULL,
+		ROLES      TEXT               NOT NULL,
+		CREDITS    INTEGER            NOT NULL);''')
+
+"""
+Builds the VALUES of the LIBRARY_STATS_DELTA row that adds a MOVIES row and/or takes one out.
+@params:
+	added:   "NEW", or None
+	removed: "OLD", or None
+"""
+def _libraryDelta(added, removed):
+	changes = []
+	for column, amount in _LIBRARY_SUMS:
+		if added is None:
+			changes.append("-" + amount.format(row=removed))
+		elif removed is None:
+			changes.append(amount.format(row=added))
+		else:
+			changes.append(amount.format(row=added) + " - " + amount.format(row=removed))
+	return ", ".join(changes)
+
+"""
+Version 3: LIBRARY_STATS_DELTA, as in db_migrate.py's version 5. The MOVIES triggers add a row of changes to it
+instead of updating the one LIBRARY_STATS row, and getLibraryStats() adds those up (and folds them in now and then).
+SQLite only lets one transaction write at a time anyway, so this keeps the two backends alike more than it saves time.
+The top people in a role are read off an index that ends in P_ID, the tie-breaker getLibraryStats() sorts by.
+"""
+def _libraryStatsDelta(conn):
+	conn.execute('''CREATE TABLE LIBRARY_STATS_DELTA
+		(ID                 INTEGER            PRIMARY KEY,
+		MOVIES              INTEGER            NOT NULL,
+		WATCHED             INTEGER            NOT NULL,
+		UNWATCHED           INTEGER            NOT NULL,
+		OWNED               INTEGER            NOT NULL,
+		RATED               INTEGER            NOT NULL,
+		RATING_SUM          REAL               NOT NULL,
+		UNWATCHED_RUNTIME   INTEGER            NOT NULL);''')
+	columns = ", ".join([column for column, amount in _LIBRARY_SUMS])
+	for event, added, removed in (("INSERT", "NEW", None), ("DELETE", None, "OLD"), ("UPDATE", "NEW", "OLD")):
+		conn.execute("DROP TRIGGER MOVIES_" + event + "_STATS")
+		conn.execute("CREATE TRIGGER MOVIES_" + event + "_STATS AFTER " + event + " ON MOVIES BEGIN " +
+		             "INSERT INTO LIBRARY_STATS_DELTA (" + columns + ") VALUES (" + _libraryDelta(added, removed) + "); END")
+	conn.execute("DROP INDEX PERSON_STATS_ROLE_MOVIES_IDX")
+	conn.execute("CREATE INDEX PERSON_STATS_ROLE_MOVIES_IDX ON PERSON_STATS (ROLE, MOVIES DESC, P_ID)")
+
+"""
+Version 4: movies with no year, as in db_migrate.py's version 6. The unique index moves to (TITLE, COALESCE(YEAR, '')),
+after the copies of a movie with no year are merged into the one with the lowest id.
+"""
+def _moviesWithoutYear(conn):
+	conn.execute("CREATE TEMPORARY TABLE MOVIE_COPIES AS SELECT MOVIES.ID AS OLD_ID, keep.ID AS ID FROM MOVIES JOIN " +
+	             "(SELECT TITLE, COALESCE(YEAR, '') AS YEAR, min(ID) AS ID FROM MOVIES GROUP BY 1, 2) keep " +
+	             "ON keep.TITLE = MOVIES.TITLE AND keep.YEAR = COALESCE(MOVIES.YEAR, '') WHERE MOVIES.ID <> keep.ID")
+	conn.execute("INSERT INTO CREDITS (M_ID, P_ID, ROLE) SELECT MOVIE_COPIES.ID, CREDITS.P_ID, CREDITS.ROLE " +
+	             "FROM CREDITS JOIN MOVIE_COPIES ON MOVIE_COPIES.OLD_ID = CREDITS.M_ID WHERE 1 ORDER BY CREDITS.ID " +
+	             "ON CONFLICT DO NOTHING")
+	conn.execute("INSERT INTO PENDING_CREDITS (M_ID, NAMES, ROLES, CREDITS) SELECT MOVIE_COPIES.ID, NAMES, ROLES, CREDITS " +
+	             "FROM PENDING_CREDITS JOIN MOVIE_COPIES ON MOVIE_COPIES.OLD_ID = PENDING_CREDITS.M_ID WHERE 1 " +
+	             "ON CONFLICT DO NOTHING")
+	conn.execute("DELETE FROM MOVIES WHERE ID IN (SELECT OLD_ID FROM MOVIE_COPIES)")
+	conn.execute("DROP TABLE MOVIE_COPIES")
+	conn.execute("DROP INDEX MOVIES_TITLE_YEAR_KEY")
+	conn.execute("CREATE UNIQUE INDEX MOVIES_TITLE_YEAR_KEY ON MOVIES (TITLE, COALESCE(YEAR, ''))")
+
+"""
+Recounts LIBRARY_STATS and PERSON_STATS from scratch (see db_migrate.rebuildStats()). The triggers keep them right
+after that, so this is only needed after loading data with the triggers dropped (see db_archive.py).
+@params:
+	conn: connection to the library file, from connect()
+"""
+def rebuildStats(conn):
+	conn.execute("DELETE FROM LIBRARY_STATS_DELTA")
+	conn.execute("DELETE FROM LIBRARY_STATS")
+	conn.execute("INSERT INTO LIBRARY_STATS SELECT 1, " +
+	             ", ".join(["COALESCE(sum(" + amount.format(row="MOVIES") + "), 0)" for column, amount in _LIBRARY_SUMS]) +
+	             " FROM MOVIES")
+	conn.execute("DELETE FROM PERSON_STATS")
+	conn.execute("INSERT INTO PERSON_STATS (P_ID, ROLE, MOVIES) SELECT P_ID, ROLE, count(*) FROM CREDITS GROUP BY P_ID, ROLE")
+
+"""
+Every version of the SQLite file, in order: (version, description, function that makes the change given a connection).
+The version a file is at is kept in its user_version. Like db_migrate.MIGRATIONS, never edit one that has been released.
+"""
+MIGRATIONS = [(1, "library tables", _libraryTables),
+              (2, "credit queue", _creditQueue),
+              (3, "library statistics deltas", _libraryStatsDelta),
+              (4, "movies with no year", _moviesWithoutYear)]
+
+"""
+The cursor class of TimedSqliteConnection. It records every statement with db_stats.recordQuery().
+SQLite doesn't know how many rows a query returns until they have been read, so those are counted as they are fetched,
+and the time recorded is what the statement took to start returning them.
+"""
+class TimedSqliteCursor(sqlite3.Cursor):
+	def execute(self, statement, params=()):
+		start = time.time()
+		try:
+			return sqlite3.Cursor.execute(self, statement, params)
+		finally:
+			db_stats.recordQuery(statement, params, time.time() - start, self.rowcount)
+
+	def executemany(self, statement, param_list):
+		start = time.time()
+		try:
+			return sqlite3.Cursor.executemany(self, statement, param_list)
+		finally:
+			db_stats.recordQuery(statement, None, time.time() - start, self.rowcount)
+
+	def fetchone(self):
+		row = sqlite3.Cursor.fetchone(self)
+		if row is not None:
+			db_stats.countRows(1)
+		return row
+
+	def fetchmany(self, *args):
+		rows = sqlite3.Cursor.fetchmany(self, *args)
+		db_stats.countRows(len(rows))
+		return rows
+
+	def fetchall(self):
+		rows = sqlite3.Cursor.fetchall(self)
+		db_stats.countRows(len(rows))
+		return rows
+
+	def next(self):
+		row = sqlite3.Cursor.next(self)
+		db_stats.countRows(1)
+		return row
+
+"""
+The kind of connection connect() opens. conn.execute() and conn.executemany() go through cursor(),
+so every statement ends up on a TimedSqliteCursor.
+"""
+class TimedSqliteConnection(sqlite3.Connection):
+	def cursor(self, factory=TimedSqliteCursor):
+		return sqlite3.Connection.cursor(self, factory)
+
+"""
+Returns this thread's connection to DB_PATH, opening it the first time.
+SQLite connections can't be shared between threads, so every thread gets its own.
+Statements run one at a time with no transaction unless _transaction() starts one (or the caller sends BEGIN itself).
+"""
+def connect():
+	conn = getattr(_local, "conn", None)
+	if conn is None or _local.path != DB_PATH:
+		directory = os.path.dirname(DB_PATH)
+		if directory and not os.path.isdir(directory):
+			try:
+				os.makedirs(directory)
+			except OSError:
+				pass
+		conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES,
+		                       factory=TimedSqliteConnection)
+		conn.text_factory = str
+		conn.execute("PRAGMA journal_mode=WAL")
+		#in WAL mode this only risks the last few transactions on a power cut, never a corrupt file
+		conn.execute("PRAGMA synchronous=NORMAL")
+		conn.execute("PRAGMA foreign_keys=ON")
+		conn.create_function("RATING_VALUE", 1, _ratingValue)
+		conn.create_function("RUNTIME_MINUTES", 1, _runtimeMinutes)
+		_local.conn = conn
+		_local.path = DB_PATH
+	return conn
+
+"""
+Runs the statements in a 'with' block as one transaction, committed if the block finishes and rolled back if it raises.
+A write transaction takes SQLite's write lock straight away, so two of them can't both read and then find they can't write.
+Usage:
+	with _transaction(write=True) as conn:
+		conn.execute(...)
+"""
+@contextmanager
+def _transaction(write=False):
+	conn = connect()
+	conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+	try:
+		yield conn
+		conn.execute("COMMIT")
+	except:
+		conn.execute("ROLLBACK")
+		raise
+
+"""
+Checks whether the library file exists yet.
+@returns:
+	True if it does
+	False if this is the first time the app is being used
+"""
+def dbExists():
+	return os.path.exists(DB_PATH)
+
+"""
+Brings the library file up to the newest version in MIGRATIONS, creating it first if it doesn't exist.
+This is safe to run every time the app starts: it does nothing once the file is up to date.
+@returns:
+	an array of the version numbers that were applied (empty if the file was already up to date)
+"""
+def migrate():
+	conn = connect()
+	applied = []
+	for version, description, steps in MIGRATIONS:
+		with _transaction(write=True):
+			if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+				continue
+			print "Updating database to version " + str(version) + " (" + description + ")..."
+			steps(conn)
+			conn.execute("PRAGMA user_version = " + str(version))
+		applied.append(version)
+	if applied != []:
+		print "Database is up to date (version " + str(applied[-1]) + ")."
+	return applied
+
+"""
+Closes this thread's connection to the library file, e.g. before the file is moved or deleted.
+"""
+def closeDb():
+	conn = getattr(_local, "conn", None)
+	if conn is not None:
+		conn.close()
+		_local.conn = None
+
+"""
+Returns the hit and miss counts of the movie and person id caches, e.g. to decide on ID_CACHE_SIZE.
+@returns:
+	a dictionary like {"movies": {"entries": .., "size": .., "hits": .., "misses": ..}, "people": {...}}
+"""
+def idCacheStats():
+	return {"movies": _movie_ids.stats(), "people": _person_ids.stats()}
+
+"""
+Empties both id caches. Anything that rewrites ids in bulk (merging duplicates, restoring a library)
+needs to call this so stale ids aren't handed out afterwards.
+"""
+def clearIdCaches():
+	_movie_ids.clear()
+	_person_ids.clear()
+
+"""
+Adds a person to PEOPLE (see db_postgres.addPerson()).
+@return:
+	True if the person is added
+	False if the person already existed
+"""
+def addPerson(new_person, passw):
+	with _transaction(write=True) as conn:
+		cur = conn.execute("INSERT INTO PEOPLE (NAME) VALUES (?) ON CONFLICT (NAME) DO NOTHING", (new_person.name,))
+		if cur.rowcount != 1:
+			return False
+		person_id = cur.lastrowid
+	_person_ids.put(new_person.name, person_id)
+	return True
+
+"""
+A helper function for addMovie() and addMovieWithCredits(). Inserts the movie, with the transaction already open.
+@returns:
+	the new movie's id, or None if it already existed
+"""
+def _insertMovie(conn, new_movie):
+	cur = conn.execute("INSERT INTO MOVIES (TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN) VALUES (?,?,?,?,?,?,?) " +
+	                   "ON CONFLICT (TITLE, COALESCE(YEAR, '')) DO NOTHING",
+	                   (new_movie.title, new_movie.year, new_movie.runtime, new_movie.mpaa, new_movie.rating, new_movie.watched, new_movie.own))
+	if cur.rowcount == 1:
+		return cur.lastrowid
+
+"""
+Adds a movie to MOVIES (see db_postgres.addMovie()).
+@return:
+	True if the movie was added
+	False if the movie already existed
+"""
+def addMovie(new_movie, passw):
+	with _transaction(write=True) as conn:
+		movie_id = _insertMovie(conn, new_movie)
+	if movie_id is None:
+		return False
+	_movie_ids.put((new_movie.title, new_movie.year), movie_id)
+	return True
+
+"""
+Adds a credit for a person and movie to CREDITS, with the person's p_type as its ROLE (see db_postgres.addRole()).
+@return:
+	False if one of the two objects does not exist or the role was already recorded, entry is unsuccessful
+	True if the entry is successful
+"""
+def addRole(amovie, aperson, passw):
+	with _transaction(write=True) as conn:
+		cur = conn.execute("INSERT INTO CREDITS (M_ID, P_ID, ROLE) SELECT MOVIES.ID, PEOPLE.ID, ? FROM MOVIES, PEOPLE " +
+		                   "WHERE MOVIES.TITLE = ? AND COALESCE(MOVIES.YEAR, '') = COALESCE(?, '') AND PEOPLE.NAME = ? ON CONFLICT DO NOTHING",
+		                   (personType(aperson), amovie.title, amovie.year, aperson.name))
+		return cur.rowcount == 1
+
+"""
+Splits values into lists of at most IN_LIST_SIZE, each with the "?, ?, ..." that goes between the brackets of an IN.
+"""
+def _inLists(values):
+	values = list(values)
+	for start in range(0, len(values), IN_LIST_SIZE):
+		chunk = values[start:start + IN_LIST_SIZE]
+		yield chunk, ", ".join(["?"] * len(chunk))
+
+"""
+Stores credits, given as parallel arrays, in CREDITS (see db_postgres._addCredits()).
+@returns:
+	a dictionary of name -> id in PEOPLE to be cached once the transaction commits
+"""
+def _addCredits(conn, movie_ids, names, roles):
+	person_ids = {}
+	if names == []:
+		return person_ids
+	conn.executemany("INSERT INTO PEOPLE (NAME) VALUES (?) ON CONFLICT (NAME) DO NOTHING",
+	                 [(name,) for name in sorted(set(names))])
+	for chunk, marks in _inLists(set(names)):
+		for person_id, name in conn.execute("SELECT ID, NAME FROM PEOPLE WHERE NAME IN (" + marks + ")", chunk):
+			person_ids[name] = person_id
+	conn.executemany("INSERT INTO CREDITS (M_ID, P_ID, ROLE) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+	                 [(movie_id, person_ids[name], role) for movie_id, name, role in zip(movie_ids, names, roles)])
+	return person_ids
+
+"""
+Adds a movie along with all of its directors, writers, and cast in a single transaction (see db_postgres.addMovieWithCredits()).
+The whole thing holds the write lock, so there is no race with movies being added from other threads.
+@return:
+	True if the movie and its credits were added (or queued)
+	False if the movie already existed
+"""
+def addMovieWithCredits(new_movie, passw, top_billed=None):
+	with _transaction(write=True) as conn:
+		movie_id = _insertMovie(conn, new_movie)
+		if movie_id is None:
+			return False
+		names, roles = creditLists(new_movie)
+		names, roles, later_names, later_roles = splitCredits(names, roles, top_billed)
+		person_ids = _addCredits(conn, [movie_id] * len(names), names, roles)
+		if later_names != []:
+			conn.execute("INSERT INTO PENDING_CREDITS (M_ID, NAMES, ROLES, CREDITS) VALUES (?, ?, ?, ?)",
+			             (movie_id, json.dumps(later_names), json.dumps(later_roles), len(later_names)))
+	#only now that everything is committed can the new ids be cached
+	_movie_ids.put((new_movie.title, new_movie.year), movie_id)
+	for name, person_id in person_ids.items():
+		_person_ids.put(name, person_id)
+	return True
+
+"""
+Stores the queued credits of the movies that have waited longest in PENDING_CREDITS as one batch
+(see db_postgres.indexPendingCredits()). The batch holds the write lock while it runs, which is why it is kept small.
+@returns:
+	int number of movies whose credits were stored, 0 once the queue is empty
+"""
+def indexPendingCredits(passw, limit=QUEUE_BATCH, credit_limit=QUEUE_BATCH_CREDITS):
+	with _transaction(write=True) as conn:
+		movie_ids = []
+		credit_ids = []
+		names = []
+		roles = []
+		for movie_id, movie_names, movie_roles in conn.execute("SELECT M_ID, NAMES, ROLES FROM PENDING_CREDITS " +
+		                                                       "ORDER BY M_ID LIMIT ?", (limit,)).fetchall():
+			movie_names = json.loads(movie_names)
+			if names != [] and len(names) + len(movie_names) > credit_limit:
+				break
+			movie_ids.append(movie_id)
+			credit_ids.extend([movie_id] * len(movie_names))
+			names.extend(movie_names)
+			roles.extend(json.loads(movie_roles))
+		if movie_ids == []:
+			return 0
+		person_ids = _addCredits(conn, credit_ids, names, roles)
+		conn.executemany("DELETE FROM PENDING_CREDITS WHERE M_ID = ?", [(movie_id,) for movie_id in movie_ids])
+	for name, person_id in person_ids.items():
+		_person_ids.put(name, person_id)
+	return len(movie_ids)
+
+"""
+Tells how far behind indexPendingCredits() is (see db_postgres.creditQueueStatus()).
+@returns:
+	a dictionary with the number of "movies" and "credits" waiting, and under "waiting",
+	the first limit of those movies, oldest first, as [(title, year, credits waiting), ...]
+"""
+def creditQueueStatus(passw, limit=PAGE_SIZE):
+	with _transaction() as conn:
+		movies, credits = conn.execute("SELECT count(*), COALESCE(sum(CREDITS), 0) FROM PENDING_CREDITS").fetchone()
+		waiting = conn.execute("SELECT MOVIES.TITLE, MOVIES.YEAR, PENDING_CREDITS.CREDITS FROM PENDING_CREDITS " +
+		                       "JOIN MOVIES ON MOVIES.ID = PENDING_CREDITS.M_ID ORDER BY PENDING_CREDITS.M_ID LIMIT ?",
+		                       (limit,)).fetchall()
+	return {"movies": movies, "credits": credits, "waiting": waiting}
+
+"""
+Checks whether all of a movie's credits are stored, or some are still waiting in PENDING_CREDITS.
+@returns:
+	True if the movie is in the db and none of its credits are waiting, False otherwise
+"""
+def isFullyIndexed(g_movie, passw):
+	movie_id = g_movie.movie_id or getMovieID(g_movie, passw)
+	if movie_id is None:
+		return False
+	with _transaction() as conn:
+		return conn.execute("SELECT 1 FROM PENDING_CREDITS WHERE M_ID = ?", (movie_id,)).fetchone() is None
+
+"""
+Searches for movies with a matching title.
+@returns:
+	an array of tempMovie objects that match the title
+	None if no movies are found
+"""
+def getMovies(title, passw):
+	with _transaction() as conn:
+		found_movies = _buildMovies(conn, conn.execute("SELECT * FROM MOVIES WHERE TITLE = ?", (title,)).fetchall())
+	if found_movies != []:
+		return found_movies
+
+"""
+Gets several movies, with their directors, writers, and cast, by their ids in the MOVIES table.
+@returns:
+	an array of tempMovie objects, in the same order as movie_ids. Ids that don't exist are skipped.
+"""
+def getMoviesByIds(movie_ids, passw):
+	if not movie_ids:
+		return []
+	with _transaction() as conn:
+		rows = {}
+		for chunk, marks in _inLists(set(movie_ids)):
+			for row in conn.execute("SELECT * FROM MOVIES WHERE ID IN (" + marks + ")", chunk):
+				rows[row[0]] = row
+		return _buildMovies(conn, [rows[m_id] for m_id in movie_ids if m_id in rows])
+
+"""
+A helper function for getMovies() and getMoviesByIds(). Turns full rows from the MOVIES table into tempMovie objects,
+with their people in billing order.
+"""
+def _buildMovies(conn, rows):
+	if rows == []:
+		return []
+	credits = {}
+	for row in rows:
+		credits[row[0]] = {"actor": [], "director": [], "writer": []}
+	for chunk, marks in _inLists(credits.keys()):
+		for m_id, p_type, name in conn.execute("SELECT CREDITS.M_ID, CREDITS.ROLE, PEOPLE.NAME FROM CREDITS, PEOPLE " +
+		                                       "WHERE CREDITS.M_ID IN (" + marks + ") AND PEOPLE.ID = CREDITS.P_ID " +
+		                                       "ORDER BY CREDITS.ID", chunk):
+			credits[m_id][p_type].append(name)
+	found_movies = []
+	for row in rows:
+		people = credits[row[0]]
+		found_movies.append(tempMovie(row[1], people["director"], people["writer"], people["actor"], row[2], row[3], row[4], row[5], row[6], row[7],
+		                              movie_id=row[0]))
+	return found_movies
+
+"""
+Given a person, returns info from the Movies table for all the films they've worked on.
+@returns:
+	an array of tempMovie objects where the people categories are 'None'
+	None if the person has no credits of their p_type in the database
+"""
+def portfolio(person, passw):
+	person_id = _creditedID(person, passw)
+	if person_id == None:
+		return None
+	rows = connect().execute("SELECT TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES, CREDITS " +
+	                       "WHERE CREDITS.P_ID = ? AND CREDITS.ROLE = ? AND MOVIES.ID = CREDITS.M_ID",
+	                       (person_id, personType(person))).fetchall()
+	return [simpleMovie(row) for row in rows]
+
+"""
+Like portfolio(), but hands the movies back batch_size at a time as they are read (see db_postgres.iterPortfolio()).
+No transaction is held open between batches, so the caller can write to the db while going through them.
+@returns:
+	a generator of tempMovie objects where the people categories are 'None' (empty if the person isn't in the database)
+"""
+def iterPortfolio(person, passw, batch_size=STREAM_BATCH_SIZE):
+	person_id = getPersonID(person, passw)
+	if person_id == None:
+		return
+	for movie in _streamMovies("SELECT MOVIES.ID,TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES, CREDITS " +
+	                           "WHERE CREDITS.P_ID = ? AND CREDITS.ROLE = ? AND MOVIES.ID = CREDITS.M_ID" +
+	                           " AND MOVIES.ID > ? ORDER BY MOVIES.ID LIMIT ?", (person_id, personType(person)), batch_size):
+		yield movie
+
+"""
+Gets one page of a person's portfolio (see db_postgres.portfolioPage()).
+@returns:
+	(array of tempMovie objects, key for the next page or None if this is the last page)
+	None if the person has no credits of their p_type in the database
+"""
+def portfolioPage(person, passw, after_id=None, limit=PAGE_SIZE):
+	person_id = _creditedID(person, passw)
+	if person_id == None:
+		return None
+	return _moviePage("SELECT MOVIES.ID,TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES, CREDITS " +
+	                  "WHERE CREDITS.P_ID = ? AND CREDITS.ROLE = ? AND MOVIES.ID = CREDITS.M_ID" +
+	                  " AND MOVIES.ID > ? ORDER BY MOVIES.ID LIMIT ?", (person_id, personType(person)), after_id, limit)
+
+"""
+Returns every movie in the database a person worked on, in any role, along with what they did on each.
+@returns:
+	an array of (tempMovie object where the people categories are 'None', array of roles like ["actor", "director"])
+	None if the person does not exist in the database
+"""
+def filmography(name, passw):
+	person_id = getPersonID(tempPerson(name, None), passw)
+	if person_id == None:
+		return None
+	rows = connect().execute("SELECT TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN, group_concat(CREDITS.ROLE) " +
+	                       "FROM MOVIES, CREDITS WHERE CREDITS.P_ID = ? AND MOVIES.ID = CREDITS.M_ID " +
+	                       "GROUP BY MOVIES.ID ORDER BY MOVIES.ID", (person_id,)).fetchall()
+	return [(simpleMovie(row[:-1]), sorted(row[-1].split(","))) for row in rows]
+
+"""
+Returns all movies that the user hasn't watched.
+@returns:
+	an array of tempMovie objects
+"""
+def getMoviesToWatch(passw):
+	rows = connect().execute("SELECT TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES WHERE WATCHED = 0").fetchall()
+	return [simpleMovie(row) for row in rows]
+
+"""
+Like getMoviesToWatch(), but hands the movies back batch_size at a time (see iterPortfolio()).
+@returns:
+	a generator of tempMovie objects
+"""
+def iterMoviesToWatch(passw, batch_size=STREAM_BATCH_SIZE):
+	for movie in _streamMovies("SELECT ID,TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES WHERE WATCHED = 0" +
+	                           " AND ID > ? ORDER BY ID LIMIT ?", (), batch_size):
+		yield movie
+
+"""
+Gets one page of the movies the user hasn't watched (see db_postgres.portfolioPage()).
+@returns:
+	(array of tempMovie objects, key for the next page or None if this is the last page)
+"""
+def getMoviesToWatchPage(passw, after_id=None, limit=PAGE_SIZE):
+	return _moviePage("SELECT ID,TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES WHERE WATCHED = 0" +
+	                  " AND ID > ? ORDER BY ID LIMIT ?", (), after_id, limit)
+
+"""
+Gets the numbers shown on the (S)tatistics screen, from LIBRARY_STATS, LIBRARY_STATS_DELTA, and PERSON_STATS
+(see db_postgres.getLibraryStats()).
+@returns:
+	a dictionary with the number of "movies", "watched", "unwatched", and "owned" movies, the "average_rating",
+	the "unwatched_runtime" in minutes, and the "top" people for each role
+"""
+def getLibraryStats(passw, top=STATS_TOP):
+	columns = ", ".join([column for column, amount in _LIBRARY_SUMS])
+	with _transaction() as conn:
+		movies, watched, unwatched, owned, rated, rating_sum, unwatched_runtime, deltas = \
+			conn.execute("SELECT " + ", ".join(["sum(" + column + ")" for column, amount in _LIBRARY_SUMS]) + ", count(*) - 1 " +
+			             "FROM (SELECT " + columns + " FROM LIBRARY_STATS UNION ALL SELECT " + columns + " FROM LIBRARY_STATS_DELTA)").fetchone()
+		stats = {"movies": movies, "watched": watched, "unwatched": unwatched, "owned": owned, "average_rating": None,
+		         "unwatched_runtime": unwatched_runtime, "top": {"director": [], "writer": [], "actor": []}}
+		if rated > 0:
+			stats["average_rating"] = float(rating_sum) / rated
+		for role in stats["top"]:
+			stats["top"][role] = conn.execute("SELECT PEOPLE.NAME, best.MOVIES FROM (SELECT P_ID, MOVIES FROM PERSON_STATS " +
+			                                  "WHERE ROLE = ? AND MOVIES > 0 ORDER BY MOVIES DESC, P_ID LIMIT ?) best, PEOPLE " +
+			                                  "WHERE PEOPLE.ID = best.P_ID ORDER BY best.MOVIES DESC, PEOPLE.NAME", (role, top)).fetchall()
+	if deltas >= STATS_COMPACT_ROWS:
+		_compactLibraryStats()
+	return stats
+
+"""
+A helper function for getLibraryStats(). Adds the rows of LIBRARY_STATS_DELTA to LIBRARY_STATS and deletes them.
+"""
+def _compactLibraryStats():
+	with _transaction(write=True) as conn:
+		conn.execute("UPDATE LIBRARY_STATS SET " + ", ".join([column + " = " + column + " + (SELECT COALESCE(sum(" + column +
+		                                                      "), 0) FROM LIBRARY_STATS_DELTA)" for column, amount in _LIBRARY_SUMS]))
+		conn.execute("DELETE FROM LIBRARY_STATS_DELTA")
+
+"""
+A helper function for iterPortfolio() and iterMoviesToWatch(). The query is like the one given to _moviePage(),
+and is run once per batch, carrying on after the last id of the one before.
+"""
+def _streamMovies(query, params, batch_size):
+	after_id = 0
+	while True:
+		rows = connect().execute(query, params + (after_id, batch_size)).fetchall()
+		for row in rows:
+			yield simpleMovie(row[1:])
+		if len(rows) < batch_size:
+			return
+		after_id = rows[-1][0]
+
+"""
+A helper function for portfolioPage() and getMoviesToWatchPage(). The query has to select the MOVIES id first,
+then the usual (TITLE,...,OWN) columns, and end with "ID > ? ORDER BY ID LIMIT ?".
+"""
+def _moviePage(query, params, after_id, limit):
+	rows = connect().execute(query, params + (after_id or 0, limit + 1)).fetchall()
+	found_movies = [simpleMovie(row[1:]) for row in rows[:limit]]
+	if len(rows) > limit:
+		return found_movies, rows[limit - 1][0]
+	return found_movies, None
+
+"""
+Finds the movies whose titles start with what the user typed, in any case (see db_postgres.fuzzyMovies()).
+SQLite has nothing like pg_trgm, so this is the same as the PostgreSQL search without it: every match scores 1.0.
+@returns:
+	an array of (tempMovie object where the people categories are 'None', score), best match first
+"""
+def fuzzyMovies(text, passw, limit=FUZZY_LIMIT):
+	return _prefixSearch("SELECT TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES", "TITLE", text, limit, simpleMovie)
+
+"""
+Finds the actors, directors, or writers whose names start with the one typed (see fuzzyMovies()).
+Only people with credits of the person's p_type are matched.
+@returns:
+	an array of (tempPerson object, score), best match first
+"""
+def fuzzyPeople(person, passw, limit=FUZZY_LIMIT):
+	p_type = personType(person)
+	return _prefixSearch("SELECT NAME FROM PEOPLE", "NAME", person.name, limit, lambda row: tempPerson(row[0], p_type),
+	                     "EXISTS (SELECT 1 FROM CREDITS WHERE P_ID = PEOPLE.ID AND ROLE = ?)", (p_type,))
+
+"""
+A helper function for fuzzyMovies() and fuzzyPeople().
+The start of the column is matched with a range on its NOCASE index: everything from the text up to the text followed
+by the highest character there is.
+@params:
+	select: string, the start of the query
+	column: string, the column being searched
+	text:   string, what the user typed
+	make:   function that turns a row into the object handed back
+	where:  string, an extra condition every match has to meet, or None
+	extra:  tuple of the parameters used in where
+"""
+def _prefixSearch(select, column, text, limit, make, where=None, extra=()):
+	text = text.strip()
+	if text == "":
+		return []
+	condition = ""
+	if where != None:
+		condition = " AND " + where
+	rows = connect().execute(select + " WHERE " + column + " COLLATE NOCASE >= ? AND " + column + " COLLATE NOCASE < ? || char(1114111)" +
+	                       condition + " ORDER BY " + column + " COLLATE NOCASE LIMIT ?", (text, text) + extra + (limit,)).fetchall()
+	return [(make(row), 1.0) for row in rows]
+
+"""
+Checks for a duplicate of the movie object entered.
+@returns:
+	False if no movie in the db matches h_movie
+	True if match is found
+"""
+def hasMovie(h_movie, passw):
+	return getMovieID(h_movie, passw) != None
+
+"""
+Checks whether the person entered has worked on a movie in the db as their p_type.
+@returns:
+	False if no person in the db matches h_person in that role
+	True if match is found
+"""
+def hasPerson(h_person, passw):
+	return _creditedID(h_person, passw) != None
+
+"""
+A helper function for hasPerson() and the portfolio functions.
+Returns the person's id in PEOPLE if they have at least one credit of their p_type, None otherwise.
+"""
+def _creditedID(person, passw):
+	person_id = getPersonID(person, passw)
+	if person_id == None:
+		return None
+	if connect().execute("SELECT 1 FROM CREDITS WHERE P_ID = ? AND ROLE = ? LIMIT 1", (person_id, personType(person))).fetchone() != None:
+		return person_id
+
+"""
+Finds the id of the desired movie in the MOVIES table.
+@returns:
+	int id of the movie if it exists
+	None if the movie is not in the db
+"""
+def getMovieID(g_movie, passw):
+	key = (g_movie.title, g_movie.year)
+	movie_id = _movie_ids.get(key)
+	if movie_id != None:
+		return movie_id
+	row = connect().execute("SELECT ID FROM MOVIES WHERE TITLE = ? AND COALESCE(YEAR, '') = COALESCE(?, '')", key).fetchone()
+	if row != None:
+		_movie_ids.put(key, row[0])
+		return row[0]
+
+"""
+Finds the id of the desired person in the PEOPLE table. The person's p_type doesn't matter here.
+@returns:
+	int id of the person if it exists
+	None if the person is not in the db
+"""
+def getPersonID(g_person, passw):
+	person_id = _person_ids.get(g_person.name)
+	if person_id != None:
+		return person_id
+	row = connect().execute("SELECT ID FROM PEOPLE WHERE NAME = ?", (g_person.name,)).fetchone()
+	if row != None:
+		_person_ids.put(g_person.name, row[0])
+		return row[0]
+
+"""
+Changes any combination of a movie's rating, watched, and own flags with a single UPDATE (see db_postgres.updateMovie()).
+@returns:
+	True if the movie was updated
+	False if it isn't in the db (or there was nothing to change)
+"""
+def updateMovie(u_movie, passw, rating=None, watched=None, own=None):
+	if rating is None and watched is None and own is None:
+		return False
+	key = (u_movie.title, u_movie.year)
+	movie_id = u_movie.movie_id or _movie_ids.get(key)
+	with _transaction(write=True) as conn:
+		if movie_id is None:
+			row = conn.execute("SELECT ID FROM MOVIES WHERE TITLE = ? AND COALESCE(YEAR, '') = COALESCE(?, '')", key).fetchone()
+			movie_id = row[0] if row != None else None
+		updated = movie_id != None and conn.execute("UPDATE MOVIES SET RATING = CASE WHEN ? = '' THEN NULL ELSE COALESCE(?, RATING) END, " +
+		                                            "WATCHED = COALESCE(?, WATCHED), OWN = COALESCE(?, OWN) WHERE ID = ?",
+		                                            (rating, rating, _flag(watched), _flag(own), movie_id)).rowcount > 0
+	if not updated:
+		_movie_ids.invalidate(key)
+		return False
+	_movie_ids.put(key, movie_id)
+	return True
+
+"""
+Turns a yes/no value into a boolean, leaving None (no change) as it is.
+"""
+def _flag(value):
+	if value is None:
+		return None
+	return bool(value)
+
+"""
+Changes the rating, watched, and/or own flags of a whole set of movies at once (see db_postgres.updateMovies()).
+The ids go in IN_LIST_SIZE at a time, all in one transaction.
+@returns:
+	int, the number of movies that were changed
+"""
+def updateMovies(passw, movie_ids=None, person=None, rating=None, watched=None, own=None):
+	if movie_ids is None and person is None:
+		raise ValueError("updateMovies() needs movie_ids and/or a person to pick the movies to change")
+	changes = [(column, value) for column, value in (("RATING", rating), ("WATCHED", _flag(watched)), ("OWN", _flag(own)))
+	           if value is not None]
+	#CLEAR_RATING takes the rating away, which is stored as NULL
+	changes = [(column, None if value == CLEAR_RATING else value) for column, value in changes]
+	if changes == [] or movie_ids == []:
+		return 0
+	query = "UPDATE MOVIES SET " + ", ".join([column + " = ?" for column, value in changes]) + " WHERE (" + \
+	        " OR ".join([column + " IS NOT ?" for column, value in changes]) + ")"
+	params = [value for column, value in changes] * 2
+	if person is not None:
+		query += " AND ID IN (SELECT CREDITS.M_ID FROM CREDITS, PEOPLE WHERE PEOPLE.NAME = ? AND CREDITS.P_ID = PEOPLE.ID " + \
+		         "AND CREDITS.ROLE = ?)"
+		params += [person.name, personType(person)]
+	changed = 0
+	with _transaction(write=True) as conn:
+		if movie_ids is None:
+			changed = conn.execute(query, params).rowcount
+		else:
+			for chunk, marks in _inLists(movie_ids):
+				changed += conn.execute(query + " AND ID IN (" + marks + ")", params + chunk).rowcount
+	return changed
+
+"""
+Change/Add a rating to an existing movie in the database, or take it away with a rating of None (see updateMovie()).
+"""
+def setRating(r_movie, rating, passw):
+	return updateMovie(r_movie, passw, rating=CLEAR_RATING if rating is None else rating)
+
+"""
+Mark an existing movie as "Owned" (see updateMovie())
+"""
+def setOwn(o_movie, own, passw):
+	return updateMovie(o_movie, passw, own=bool(own))
+
+"""
+Mark an existing movie as "Watched" (see updateMovie())
+"""
+def setWatched(w_movie, watched, passw):
+	return updateMovie(w_movie, passw, watched=bool(watched))
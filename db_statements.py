@@ -0,0 +1,63 @@
+"""
+db_statements.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+A registry of the queries db_personal.py runs the most, used for myMDb project.
+Each query is sent to PostgreSQL as a prepared statement the first time a pooled connection runs it,
+so the server parses and plans it once per connection instead of once per call.
+Values are always passed as bound parameters, never pasted into the SQL, so names like O'Brien are stored as-is.
+"""
+
+"""
+Every registered statement, by name.
+Each entry is (parameter types, SQL), where the SQL uses $1, $2, ... for its parameters.
+"""
+STATEMENTS = {
+	#movies are matched on COALESCE(YEAR, ''), like the unique index on them, so a movie with no year is found too
+	"movie_id":    ("text, text", "SELECT ID FROM MOVIES WHERE TITLE = $1 AND COALESCE(YEAR, '') = COALESCE($2, '')"),
+	"person_id":   ("text", "SELECT ID FROM PEOPLE WHERE NAME = $1"),
+	"has_role":    ("int, text", "SELECT 1 FROM CREDITS WHERE P_ID = $1 AND ROLE = $2 LIMIT 1"),
+	"portfolio":   ("int, text", "SELECT TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN FROM MOVIES, CREDITS " +
+	                             "WHERE CREDITS.P_ID = $1 AND CREDITS.ROLE = $2 AND MOVIES.ID = CREDITS.M_ID"),
+	"filmography": ("int", "SELECT TITLE,YEAR,RUNTIME,MPAA,RATING,WATCHED,OWN, array_agg(CREDITS.ROLE ORDER BY CREDITS.ROLE) " +
+	                       "FROM MOVIES, CREDITS WHERE CREDITS.P_ID = $1 AND MOVIES.ID = CREDITS.M_ID " +
+	                       "GROUP BY MOVIES.ID ORDER BY MOVIES.ID"),
+	#a value of NULL leaves that column as it is, so one statement covers any combination of changes.
+	#a rating of '' (db_backend.CLEAR_RATING) sets it to NULL
+	"update_movie":          ("text, boolean, boolean, int",
+	                          "UPDATE MOVIES SET RATING = CASE WHEN $1 = '' THEN NULL ELSE COALESCE($1, RATING) END, " +
+	                          "WATCHED = COALESCE($2, WATCHED), OWN = COALESCE($3, OWN) WHERE ID = $4 RETURNING ID"),
+	"update_movie_by_title": ("text, boolean, boolean, text, text",
+	                          "UPDATE MOVIES SET RATING = CASE WHEN $1 = '' THEN NULL ELSE COALESCE($1, RATING) END, " +
+	                          "WATCHED = COALESCE($2, WATCHED), OWN = COALESCE($3, OWN) " +
+	                          "WHERE TITLE = $4 AND COALESCE(YEAR, '') = COALESCE($5, '') RETURNING ID")
+}
+
+"""
+Runs a registered statement, preparing it on the cursor's connection first if that connection hasn't seen it yet.
+Connections keep track of what they have prepared themselves (see db_pool.PreparingConnection).
+@params:
+	cur:    cursor of a pooled connection
+	name:   string, a key of STATEMENTS
+	params: tuple of the values for $1, $2, ...
+"""
+def execute(cur, name, params):
+	prepared = cur.connection.prepared
+	if name not in prepared:
+		cur.execute(prepareSQL(name))
+		prepared.add(name)
+	cur.execute(executeSQL(name, params), params)
+
+"""
+Returns the PREPARE statement for a registered statement, for a connection that hasn't seen it yet.
+"""
+def prepareSQL(name):
+	types, sql = STATEMENTS[name]
+	return "PREPARE " + name + " (" + types + ") AS " + sql
+
+"""
+Returns the EXECUTE statement that runs a registered statement with params, with a %s placeholder for each of them.
+"""
+def executeSQL(name, params):
+	return "EXECUTE " + name + " (" + ", ".join(["%s"] * len(params)) + ")"
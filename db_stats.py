@@ -0,0 +1,312 @@
+"""
+db_stats.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Keeps count of where the time goes in the myMDb data layer.
+Every statement run on a db cursor, every IMDb call made by db_web.py, and every connection borrowed from db_pool.py
+is counted under the logical operation running at the time: the menu action the user picked in myMDb.py,
+like "movie search" or "add movie". For each operation this records how many times it ran, and for its queries
+and IMDb calls the count, total time, rows returned, and a histogram of how long they took.
+IMDb calls also record how much data they gave back (see MEASURE_SIZES), and every IMDb lookup (see db_web.pullMovie()) how many
+candidates were shown and how many were fetched in full, so the full fetches saved are visible too.
+Statements that take longer than SLOW_QUERY_MS are also written to the slow-query log at SLOW_LOG_PATH,
+with the operation, the time taken, and the statement itself.
+Run myMDb.py with --stats to have report() print all of this when the app exits.
+
+The connections handed out by db_pool.py and db_sqlite.py use cursors that report every statement here, so nothing
+in db_postgres.py or db_sqlite.py has to. The app does one menu action at a time, so the current operation is shared by
+every thread, and work that db_async.py or db_web.py hands to other threads is counted under the action that started it.
+Threads that work on their own instead, like the credit indexer (see db_indexer.py), count under an operation of their own.
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+#statements that take at least this many milliseconds are written to the slow-query log. MYMDB_SLOW_MS changes it
+SLOW_QUERY_MS = float(os.environ.get("MYMDB_SLOW_MS", "100"))
+
+#where the slow-query log is kept. MYMDB_SLOW_LOG changes it, and an empty value turns the log off
+SLOW_LOG_PATH = os.environ.get("MYMDB_SLOW_LOG", os.path.join(os.path.expanduser("~"), ".mymdb", "slow_queries.log"))
+
+#upper bounds (in milliseconds) of the latency histogram buckets. Anything slower goes in one last bucket
+HISTOGRAM_MS = [0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000]
+
+#the operation anything done outside of a menu action is counted under
+NO_OPERATION = "other"
+
+#whether TimedIMDb measures how much data each IMDb call gave back (see dataSize()). That takes a pass over the results,
+#so it is only turned on when the numbers will be looked at, by myMDb.py --stats and the benchmarks
+MEASURE_SIZES = False
+
+_lock = threading.Lock()
+_operations = {}
+_current = [NO_OPERATION]
+_thread = threading.local()
+
+"""
+Returns the numbers kept for one kind of call (queries or IMDb calls) of an operation, starting them at zero.
+"""
+def _calls():
+	return {"count": 0, "seconds": 0.0, "rows": 0, "histogram": [0] * (len(HISTOGRAM_MS) + 1)}
+
+"""
+Returns the numbers kept for an operation, starting them at zero the first time. Call with _lock held.
+"""
+def _operation(name):
+	if name not in _operations:
+		_operations[name] = {"runs": 0, "queries": _calls(), "imdb": _calls(),
+		                     "connections": {"count": 0, "seconds": 0.0},
+		                     "imdb_bytes": {}, "lookups": {"searches": 0, "shown": 0, "fetched": 0}}
+	return _operations[name]
+
+"""
+Adds one call to the numbers kept for its kind. Call with _lock held.
+"""
+def _add(calls, seconds, rows):
+	calls["count"] += 1
+	calls["seconds"] += seconds
+	if rows is not None and rows > 0:
+		calls["rows"] += rows
+	ms = seconds * 1000
+	bucket = 0
+	while bucket < len(HISTOGRAM_MS) and ms >= HISTOGRAM_MS[bucket]:
+		bucket += 1
+	calls["histogram"][bucket] += 1
+
+"""
+Starts a new logical operation. Everything recorded from now on is counted under it, until the next one starts.
+@params:
+	name: string, e.g. "movie search", or None to go back to NO_OPERATION
+"""
+def setOperation(name):
+	with _lock:
+		_current[0] = name or NO_OPERATION
+		_operation(_current[0])["runs"] += 1
+
+"""
+Counts everything recorded on the calling thread under its own operation from now on, whatever menu action is running.
+This is for threads that work on their own, like the worker in db_indexer.py, rather than for a menu action.
+@params:
+	name: string, e.g. "indexer", or None to go back to counting under the menu action
+"""
+def setThreadOperation(name):
+	with _lock:
+		_thread.operation = name
+		if name:
+			_operation(name)["runs"] += 1
+
+"""
+Returns the name of the operation anything recorded now is counted under: the calling thread's own (see
+setThreadOperation()) if it has one, and the current menu action if not. Call with _lock held.
+"""
+def _currentName():
+	return getattr(_thread, "operation", None) or _current[0]
+
+"""
+Records one statement run on a db cursor, and writes it to the slow-query log if it was slow.
+@params:
+	statement: string, the SQL
+	params:    the values bound to it, or None
+	seconds:   float, how long it took
+	rows:      int, rows it returned or changed, or None if that isn't known
+"""
+def recordQuery(statement, params, seconds, rows):
+	with _lock:
+		operation = _currentName()
+		_add(_operation(operation)["queries"], seconds, rows)
+	if seconds * 1000 >= SLOW_QUERY_MS and SLOW_LOG_PATH:
+		_logSlow(operation, statement, params, seconds, rows)
+
+"""
+Records one call to IMDb.
+@params:
+	call:    string, name of the IMDbPY method
+	seconds: float, how long it took
+	results: int, number of results it gave back, or None
+	size:    int, bytes of data it gave back (see dataSize()), or None
+"""
+def recordImdb(call, seconds, results, size=None):
+	with _lock:
+		operation = _operation(_currentName())
+		_add(operation["imdb"], seconds, results)
+		if size is not None:
+			calls = operation["imdb_bytes"].setdefault(call, {"count": 0, "bytes": 0})
+			calls["count"] += 1
+			calls["bytes"] += size
+
+"""
+Records one IMDb lookup: a search whose results were shown as candidates, of which some were then fetched in full.
+Every candidate shown but not fetched is a full fetch saved.
+@params:
+	shown:   int, number of candidates shown
+	fetched: int, number of them fetched in full
+"""
+def recordLookup(shown, fetched):
+	with _lock:
+		lookups = _operation(_currentName())["lookups"]
+		lookups["searches"] += 1
+		lookups["shown"] += shown
+		lookups["fetched"] += fetched
+
+"""
+Returns roughly how many bytes of data an IMDb call gave back: the size of its results written out as JSON.
+IMDbPY objects keep their fields in .data. This is the data myMDb was handed, not the HTTP traffic behind it,
+but it grows and shrinks with it.
+@returns:
+	int, or None if the results can't be written out
+"""
+def dataSize(found):
+	encode = lambda item: getattr(item, "data", None) or unicode(item)
+	items = found if isinstance(found, list) else [found]
+	try:
+		return sum([len(json.dumps(getattr(item, "data", item), default=encode)) for item in items])
+	except (TypeError, ValueError):
+		return None
+
+"""
+Records how long it took to borrow a connection from the pool.
+"""
+def recordAcquire(seconds):
+	with _lock:
+		connections = _operation(_currentName())["connections"]
+		connections["count"] += 1
+		connections["seconds"] += seconds
+
+"""
+Writes a line to the slow-query log: when, which operation, how long, how many rows, and the statement.
+"""
+def _logSlow(operation, statement, params, seconds, rows):
+	line = "\t".join([time.strftime("%Y-%m-%d %H:%M:%S"), operation, "%.1f ms" % (seconds * 1000), str(rows) + " rows",
+	                  " ".join(str(statement).split())])
+	if params:
+		line += "\t" + repr(params)[:500]
+	try:
+		directory = os.path.dirname(SLOW_LOG_PATH)
+		if directory and not os.path.isdir(directory):
+			os.makedirs(directory)
+		with _lock:
+			with open(SLOW_LOG_PATH, "a") as log:
+				log.write(line + "\n")
+	except (IOError, OSError):
+		pass
+
+"""
+Returns a copy of everything recorded so far.
+@returns:
+	a dictionary of operation name -> {"runs": int, "queries": {...}, "imdb": {...}, "connections": {"count", "seconds"},
+	"imdb_bytes": {call: {"count", "bytes"}}, "lookups": {"searches", "shown", "fetched"}},
+	where "queries" and "imdb" each have a "count", total "seconds", "rows", and a "histogram" with a count for every
+	bucket in HISTOGRAM_MS plus one for anything slower
+"""
+def snapshot():
+	with _lock:
+		copy = {}
+		for name, numbers in _operations.items():
+			copy[name] = {"runs": numbers["runs"], "connections": dict(numbers["connections"]), "lookups": dict(numbers["lookups"]),
+			              "imdb_bytes": dict([(call, dict(calls)) for call, calls in numbers["imdb_bytes"].items()])}
+			for kind in ("queries", "imdb"):
+				copy[name][kind] = dict(numbers[kind])
+				copy[name][kind]["histogram"] = list(numbers[kind]["histogram"])
+		return copy
+
+"""
+Adds rows read from a cursor to the current operation's queries, for cursors that only find out how many rows
+a query returned as they are fetched (see db_sqlite.TimedSqliteCursor).
+"""
+def countRows(rows):
+	with _lock:
+		_operation(_currentName())["queries"]["rows"] += rows
+
+"""
+Forgets everything recorded so far.
+"""
+def reset():
+	with _lock:
+		_operations.clear()
+		_current[0] = NO_OPERATION
+
+"""
+Formats a histogram as "<0.1ms: 3  <0.3ms: 12 ...", leaving out empty buckets.
+"""
+def _histogramText(histogram):
+	labels = ["<" + str(limit) + "ms" for limit in HISTOGRAM_MS] + [">=" + str(HISTOGRAM_MS[-1]) + "ms"]
+	return "  ".join([label + ": " + str(count) for label, count in zip(labels, histogram) if count > 0])
+
+"""
+Prints everything recorded so far, one operation at a time, busiest first. myMDb.py runs this at exit when given --stats.
+@params:
+	out: file to print to
+"""
+def report(out=sys.stdout):
+	operations = snapshot()
+	out.write("\nData layer statistics, by operation:\n")
+	if operations == {}:
+		out.write("  nothing was recorded.\n")
+	for name in sorted(operations, key=lambda name: -operations[name]["queries"]["count"]):
+		numbers = operations[name]
+		if numbers["queries"]["count"] + numbers["imdb"]["count"] + numbers["connections"]["count"] == 0:
+			continue
+		runs = max(numbers["runs"], 1)
+		out.write("\n" + name + " (ran " + str(numbers["runs"]) + " time(s))\n")
+		for kind, label in (("queries", "queries"), ("imdb", "IMDb calls")):
+			calls = numbers[kind]
+			if calls["count"] == 0:
+				continue
+			out.write("  %-11s %d (%.1f per run), %.1f ms total, %.2f ms average, %d rows\n" %
+			          (label + ":", calls["count"], calls["count"] / float(runs), calls["seconds"] * 1000,
+			           calls["seconds"] * 1000 / calls["count"], calls["rows"]))
+			out.write("              " + _histogramText(calls["histogram"]) + "\n")
+		for call in sorted(numbers["imdb_bytes"]):
+			calls = numbers["imdb_bytes"][call]
+			out.write("              %s: %d, %.1f KB (%.1f KB each)\n" % (call, calls["count"], calls["bytes"] / 1024.0,
+			                                                          calls["bytes"] / 1024.0 / calls["count"]))
+		lookups = numbers["lookups"]
+		if lookups["searches"] > 0:
+			saved = lookups["shown"] - lookups["fetched"]
+			line = "  %-11s %d, %d candidates shown, %d fetched in full, %d full fetches saved" % \
+			       ("lookups:", lookups["searches"], lookups["shown"], lookups["fetched"], saved)
+			movies = numbers["imdb_bytes"].get("get_movie")
+			if movies:
+				line += " (about %.1f KB)" % (saved * movies["bytes"] / 1024.0 / movies["count"])
+			out.write(line + "\n")
+		connections = numbers["connections"]
+		if connections["count"] > 0:
+			out.write("  %-11s %d borrowed, %.1f ms waiting for them\n" % ("connections:", connections["count"], connections["seconds"] * 1000))
+	if SLOW_LOG_PATH:
+		out.write("\nStatements slower than " + str(SLOW_QUERY_MS) + " ms are logged in " + SLOW_LOG_PATH + "\n")
+
+"""
+Wraps an IMDb object (see db_web.IMDB_FACTORY) so that its search_movie() and get_movie() calls are recorded
+with recordImdb(), along with the size of what they gave back when MEASURE_SIZES is on.
+Everything else is passed straight through.
+@params:
+	ia: the IMDb object
+"""
+class TimedIMDb(object):
+	def __init__(self, ia):
+		self.ia = ia
+
+	def search_movie(self, *args, **kwargs):
+		return self._timed("search_movie", args, kwargs)
+
+	def get_movie(self, *args, **kwargs):
+		return self._timed("get_movie", args, kwargs)
+
+	def _timed(self, call, args, kwargs):
+		start = time.time()
+		try:
+			found = getattr(self.ia, call)(*args, **kwargs)
+		except Exception:
+			recordImdb(call, time.time() - start, None)
+			raise
+		#the clock stops before the results are measured, so measuring them doesn't count as IMDb time
+		seconds = time.time() - start
+		results = len(found) if isinstance(found, list) else 1
+		recordImdb(call, seconds, results, dataSize(found) if MEASURE_SIZES else None)
+		return found
+
+	def __getattr__(self, name):
+		return getattr(self.ia, name)
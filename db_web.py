@@ -6,10 +6,34 @@ author: Peter Jindra, peterfjindra@gmail.com
 A series of functions used for myMDb project.
 These functions specifically use the IMDbPY python package to get information about movies from IMDb.
 The package was not created by me, is open-source, and can be found at http://imdbpy.sourceforge.net/
+If there is a local mirror of IMDb (see db_mirror.py), movies are looked up there first, and IMDbPY is only used
+for what the mirror doesn't have.
 """
-from imdb import IMDb
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+import db_mirror as mirror
+import db_stats
+import db_webcache as webcache
 from temp_objects import *
 
+#what pullMovie() uses to talk to IMDb. Anything with search_movie() and get_movie() will do, e.g. a local stub for testing.
+#None means IMDbPY's IMDb class. IMDbPY is big and slow to import, so that only happens the first time IMDb is needed,
+#not when the app starts (someone who only looks through their library never needs it at all).
+IMDB_FACTORY = None
+
+#most movie details fetched from IMDb at the same time
+FETCH_WORKERS = 8
+
+#seconds fetchMovies() waits for a whole batch of movies before giving up on the ones that haven't come back
+FETCH_TIMEOUT = 20
+
+#number of search results shown at first, and after (A)dvanced search
+FIRST_RESULTS = 3
+ADVANCED_RESULTS = 20
+
+_worker = threading.local()
+
 """
 A function which gets info from IMDb, and queries you to select the correct movie to add to your personal db.
 
@@ -17,96 +41,221 @@ Many of the IMDbPy queries don't have every field, so this function does some aw
 to stick a python null type, called 'None', into places where trying to extract the information causes a KeyError.
 For example, if a movie doesn't have a year listed, asking the IMDbPy movie object for the year causes an error, instead
 of returning an empty string or Nonetype. When this happens, the code below will put a 'None' into the year field so that
-the other sections of the code can recognize there is nothing there.
+the other sections of the code can recognize there is nothing there. (That happens in extractFields() and buildTempMovie() below.)
 
-When this function is first run, it will grab the top 5 entries from the search results of the title it is given.
-This is done to save time. It builds tempMovie objects (defined in temp_objects.py of this project) for each one, and displays some basic info 
-so the user can choose which title he wants. Alternatively, the user can choose to run this function again, this time returning ALL the search 
-results, which takes quite a bit longer.
+Finding the movie is done in two steps. First, IMDb is searched for the title, and the top FIRST_RESULTS results are shown
+so the user can choose which title he wants. These are shown straight from the search results (title, year, and kind,
+see buildCandidate() below), so nothing else has to be fetched. Alternatively, the user can ask for an advanced search,
+which shows up to ADVANCED_RESULTS of the same search results. Only once a title is chosen are its full details,
+with all its people, fetched from IMDb and built into a tempMovie object (defined in temp_objects.py of this project).
+Every list shown is counted by db_stats.py, along with whether a movie was fetched from it.
 
 @params:
 	title:    string, the title that the user is searching for.
-	grab_all: boolean, False if only grabbing the top 5 results, True if grabbing all results. 
+	grab_all: boolean, False if only showing the top few results, True if showing all results. 
+	results:  array of search results from searchMovies(), if the title has already been searched for, or None
 @returns:
-	False if the user decides to exit without choosing a movie
+	False if the user decides to exit without choosing a movie, or if the movie couldn't be loaded within FETCH_TIMEOUT seconds
 	otherwise, a tempMovie object selected by the user
 """
-def pullMovie(s_title, grab_all):
-	ia = IMDb()
+def pullMovie(s_title, grab_all, results=None):
+	if results is None:
+		print "\nSearching IMDb. This may take a moment..."
+		results = searchMovies(s_title)
 	if grab_all:
-		print "\nGetting lots of information from IMDb. Please be patient..."
-		try:
-			id_list = ia.search_movie(s_title)[:20]
-		except IndexError:
-			id_list = ia.search_movie(s_title)
+		candidates = [buildCandidate(result) for result in results[:ADVANCED_RESULTS]]
 	else:
-		print "\nGetting information from IMDb. This may take a moment..."
-		try:
-			id_list = ia.search_movie(s_title)[:3]
-		except IndexError:
-			id_list = ia.search_movie(s_title)			
-	mymovie_objs = []
-	imdbpy_objs = []
-	for basic_movie in id_list:
-		imdbpy_objs.append(ia.get_movie(basic_movie.movieID))
-	for imdbpy_obj in imdbpy_objs:
-		runtime = "n/a"
-		try:	
-			if len(imdbpy_obj['runtimes']) == 1:
-				runtime = imdbpy_obj['runtimes'][0]
-			else:
-				for time in imdbpy_obj['runtimes']:
-					if "USA" in time:
-						runtime = time[4:]
-		except KeyError:
-			runtime = "n/a"
-		try:
-			for rating in imdbpy_obj['certificates']:
-				if "USA" in rating:
-					mpaa = rating[4:].split(":")[0]
-		except KeyError:
-			mpaa = "n/a"
-		try:
-			title = imdbpy_obj['title'].replace("'","").upper()	
-		except KeyError:
-			title = "n/a"
-		try:
-			director = []  
-			for person in imdbpy_obj['director']:
-				director.append(person['name'].replace("'",""))
-		except KeyError:
-			director = None
-		try:
-			writer = []  
-			for person in imdbpy_obj['writer']:
-				writer.append(person['name'].replace("'",""))
-		except KeyError:
-			writer = None
+		candidates = [buildCandidate(result) for result in results[:FIRST_RESULTS]]
+	selection = chooseResult(s_title, candidates, grab_all, results)
+	if not isinstance(selection, tempCandidate):
+		#the user exited, or picked a movie from the advanced search (which has already been fetched)
+		db_stats.recordLookup(len(candidates), 0)
+		return selection
+	db_stats.recordLookup(len(candidates), 1)
+	print "\nGetting the details from IMDb..."
+	#a batch of one, so a hung fetch gives up after FETCH_TIMEOUT like the others do
+	movie = fetchMovies([selection.imdb_id], FETCH_TIMEOUT)[0]
+	if movie is None:
+		print "This movie couldn't be loaded from IMDb. Please try again later."
+		return False
+	return movie
+
+"""
+Returns this thread's IMDb object, creating it the first time. IMDb objects aren't shared between threads.
+Its calls are timed and counted by db_stats.py.
+"""
+def _ia():
+	if not hasattr(_worker, "ia"):
+		factory = IMDB_FACTORY
+		if factory is None:
+			from imdb import IMDb
+			factory = IMDb
+		_worker.ia = db_stats.TimedIMDb(factory())
+	return _worker.ia
+
+"""
+Searches for movies by title, in the local mirror if there is one (see db_mirror.py), and on IMDb if the mirror
+finds nothing. Results from IMDb are kept in the local cache (see db_webcache.py),
+so searching for the same thing again doesn't go back to IMDb.
+@params:
+	s_title: string, the title that the user is searching for.
+@returns:
+	an array of dictionaries with the "id", "title", "year", and "kind" of every search result, in IMDb's ranking order.
+	Results from the mirror also have the "runtime"
+"""
+def searchMovies(s_title):
+	results = mirror.searchMovies(s_title)
+	if results != []:
+		return results
+	key = webcache.searchKey(s_title)
+	results = webcache.get(key)
+	if results is None:
+		results = []
+		for basic_movie in _ia().search_movie(s_title):
+			results.append({"id": basic_movie.movieID, "title": basic_movie.get('title'),
+			                "year": basic_movie.get('year'), "kind": basic_movie.get('kind')})
+		webcache.put(key, results)
+	return results
+
+"""
+Gets the full details of one movie, from the local mirror or cache if it's in either, and from IMDb if not.
+@params:
+	movie_id: string, IMDb movie id (the "id" of a searchMovies() result)
+@returns:
+	a tempMovie object with no rating, watched, or own info
+"""
+def getMovie(movie_id):
+	fields = mirror.getMovie(movie_id)
+	if fields is not None:
+		return buildTempMovie(fields)
+	key = webcache.movieKey(movie_id)
+	fields = webcache.get(key)
+	if fields is None:
+		fields = extractFields(_ia().get_movie(movie_id))
+		webcache.put(key, fields)
+	return buildTempMovie(fields)
+
+"""
+Gets the full details of several movies at the same time, using up to FETCH_WORKERS threads.
+The whole batch shares one deadline, timeout seconds from the start, so a few hung fetches don't add up to
+several timeouts. A movie that fails to load, or hasn't come back by the deadline, comes back as None instead of
+holding up or breaking the rest.
+@params:
+	movie_ids: array of IMDb movie ids
+	timeout:   seconds to wait for the whole batch
+@returns:
+	an array of tempMovie objects (or None for the ones that couldn't be loaded), in the same order as movie_ids
+"""
+def fetchMovies(movie_ids, timeout=FETCH_TIMEOUT):
+	if not movie_ids:
+		return []
+	pool = ThreadPool(min(FETCH_WORKERS, len(movie_ids)))
+	try:
+		pending = [pool.apply_async(getMovie, (movie_id,)) for movie_id in movie_ids]
+		deadline = time.time() + timeout
+		movies = []
+		for result in pending:
+			try:
+				movies.append(result.get(max(deadline - time.time(), 0)))
+			except Exception:
+				movies.append(None)
+		return movies
+	finally:
+		#anything still running past the deadline is abandoned, not waited for
+		pool.terminate()
+
+"""
+Pulls the fields myMDb uses out of a full IMDbPY movie object (from ia.get_movie).
+This is what gets stored in the local cache, so it only holds plain strings, numbers, and arrays.
+Fields the movie doesn't have are set to None.
+@params:
+	imdbpy_obj: IMDbPY Movie object
+@returns:
+	a dictionary with "title", "year", "runtimes", "certificates", and the names of the "director", "writer", and "cast"
+"""
+def extractFields(imdbpy_obj):
+	fields = {}
+	for key in ('title', 'year', 'runtimes', 'certificates'):
 		try:
-			cast = []  
-			for person in imdbpy_obj['cast']:
-				cast.append(person['name'].replace("'",""))
+			fields[key] = imdbpy_obj[key]
 		except KeyError:
-			cast = None
+			fields[key] = None
+	for key in ('director', 'writer', 'cast'):
 		try:
-			year = str(imdbpy_obj['year'])
+			fields[key] = [person['name'] for person in imdbpy_obj[key]]
 		except KeyError:
-			year = None
-		
-		mymovie_objs.append(tempMovie(title, director, writer, cast, year, runtime, mpaa, None, None, None))
-	
-	return chooseResult(s_title, mymovie_objs, grab_all)
-	
+			fields[key] = None
+	return fields
+
+"""
+Turns a search result into a tempCandidate object, to be shown by chooseResult().
+Search results from IMDb don't have the runtime or mpaa rating, but if the whole movie is already in the local cache
+(see db_webcache.py), they are filled in from there, which doesn't need IMDb. Results from the mirror have the runtime.
+@params:
+	result: dictionary from searchMovies()
+@returns:
+	a tempCandidate object
+"""
+def buildCandidate(result):
+	if result.get('title'):
+		title = result['title'].upper()
+	else:
+		title = "n/a"
+	year = None
+	if result.get('year') is not None:
+		year = str(result['year'])
+	candidate = tempCandidate(result['id'], title, year, result.get('kind'), result.get('runtime'))
+	if candidate.runtime is not None:
+		return candidate
+	fields = webcache.get(webcache.movieKey(result['id']))
+	if fields is not None:
+		movie = buildTempMovie(fields)
+		candidate.runtime = movie.runtime
+		candidate.mpaa = movie.mpaa
+	return candidate
+
+"""
+Turns the fields from extractFields() into a tempMovie object.
+Used by pullMovie() and by the bulk importer in db_import.py.
+Fields that IMDb doesn't have for the movie are filled in with "n/a" or None, as described above pullMovie().
+@params:
+	fields: dictionary from extractFields()
+@returns:
+	a tempMovie object with no rating, watched, or own info
+"""
+def buildTempMovie(fields):
+	runtime = "n/a"
+	if fields.get('runtimes'):
+		if len(fields['runtimes']) == 1:
+			runtime = fields['runtimes'][0]
+		else:
+			for time in fields['runtimes']:
+				if "USA" in time:
+					runtime = time[4:]
+	mpaa = "n/a"
+	for rating in fields.get('certificates') or []:
+		if "USA" in rating:
+			mpaa = rating[4:].split(":")[0]
+	if fields.get('title'):
+		title = fields['title'].upper()
+	else:
+		title = "n/a"
+	if fields.get('year') is not None:
+		year = str(fields['year'])
+	else:
+		year = None
+	return tempMovie(title, fields.get('director'), fields.get('writer'), fields.get('cast'), year, runtime, mpaa, None, None, None)
 
 """
 A helper function for pullMovies(). Displays found movies and asks the user to make a decision.
 @params:
-	mymovie_objs: array of tempMovie objects, used to hold the information for potential movies to be added
-	grab_all:     boolean, False if only grabbing the top 5 results, True if grabbing all results. 
+	mymovie_objs: array of tempMovie or tempCandidate objects, used to hold the information for potential movies to be added
+	grab_all:     boolean, False if only showing the top few results, True if showing all results. 
+	results:      array of search results from searchMovies(), kept for the advanced search, or None
 @returns:
-	the users input, either an int representing their selection, 'A' for advanced search, or 'E' for exit.
+	the object the user selected, the movie picked from the advanced search, or False if the user exited.
 """
-def chooseResult(s_title, mymovie_objs, grab_all):
+def chooseResult(s_title, mymovie_objs, grab_all, results=None):
 	count = 1
 	for movie_obj in mymovie_objs:
 		try:
@@ -117,20 +266,20 @@ def chooseResult(s_title, mymovie_objs, grab_all):
 	print "\nIs one of the above titles what you're looking for?"
 	print "(#) Select this title."
 	if not grab_all:
-		print "(A)dvanced search. Grabs 20 titles that match the query, instead of just 3."
+		print "(A)dvanced search. Grabs " + str(ADVANCED_RESULTS) + " titles that match the query, instead of just " + str(FIRST_RESULTS) + "."
 	#print (M)anually enter the desired title. This feature will hopefully be ready for version 1.0
 	print "(E)xit this search."
 	answer = raw_input(":").upper()
 	if answer.isdigit():
-		if  0 < int(answer) < (count + 1):
+		if  0 < int(answer) < count:
 			return mymovie_objs[int(answer) - 1]
 		else:
 			print "Number out of range."
-			chooseResult(mymovie_objs, grab_all)
+			return chooseResult(s_title, mymovie_objs, grab_all, results)
 	elif not grab_all and answer == "A":
-		return pullMovie(s_title, True)
+		return pullMovie(s_title, True, results)
 	elif answer == "E":
 		return False
 	else:
 		print "Not a valid input."
-		chooseResult(s_title, mymovie_objs, grab_all)
\ No newline at end of file
+		return chooseResult(s_title, mymovie_objs, grab_all, results)
\ No newline at end of file
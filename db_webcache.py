@@ -0,0 +1,174 @@
+"""
+db_webcache.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+A local, on-disk cache of what db_web.py gets from IMDb, used for myMDb project.
+Search results are stored under the normalized search string, and movies under their IMDb movieID.
+Only the fields myMDb actually uses are kept (as JSON), not whole IMDbPY objects, so entries stay small.
+Entries expire after CACHE_TTL seconds, and once the cache grows past CACHE_MAX_BYTES the least recently used
+entries are dropped. The cache is a SQLite file, so several copies of the app can share it safely.
+
+Usage:
+	python db_webcache.py stats
+	python db_webcache.py clear
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+CACHE_ENABLED = True
+
+#where the cache is kept. MYMDB_CACHE changes it
+CACHE_PATH = os.environ.get("MYMDB_CACHE", os.path.join(os.path.expanduser("~"), ".mymdb", "imdb_cache.sqlite"))
+
+#how long (in seconds) an entry is trusted before it has to be fetched from IMDb again. One week by default.
+CACHE_TTL = 7 * 24 * 60 * 60
+
+#once the entries add up to more than this many bytes, the least recently used ones are dropped
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+#the size cap is checked once every this many writes
+EVICT_EVERY = 50
+
+_local = threading.local()
+_writes = [0]
+
+"""
+Returns this thread's connection to the cache file, creating the file and its table the first time.
+SQLite connections can't be shared between threads, so every thread gets its own.
+It is opened again if CACHE_PATH has changed since.
+"""
+def _conn():
+	conn = getattr(_local, "conn", None)
+	if conn is None or getattr(_local, "path", None) != CACHE_PATH:
+		directory = os.path.dirname(CACHE_PATH)
+		if directory and not os.path.isdir(directory):
+			try:
+				os.makedirs(directory)
+			except OSError:
+				pass
+		conn = sqlite3.connect(CACHE_PATH, timeout=30, isolation_level=None)
+		conn.execute("PRAGMA journal_mode=WAL")
+		conn.execute("CREATE TABLE IF NOT EXISTS ENTRIES (KEY TEXT PRIMARY KEY, VALUE TEXT NOT NULL, " +
+		             "STORED REAL NOT NULL, USED REAL NOT NULL, SIZE INTEGER NOT NULL)")
+		conn.execute("CREATE INDEX IF NOT EXISTS ENTRIES_USED_IDX ON ENTRIES (USED)")
+		_local.conn = conn
+		_local.path = CACHE_PATH
+	return conn
+
+"""
+Turns what the user typed into a search key, so "The  Matrix " and "the matrix" share an entry.
+"""
+def searchKey(s_title):
+	if isinstance(s_title, str):
+		s_title = s_title.decode("utf-8", "replace")
+	return "search:" + " ".join(s_title.lower().split())
+
+"""
+The key a movie is stored under.
+"""
+def movieKey(movie_id):
+	return "movie:" + str(movie_id)
+
+"""
+Looks up an entry.
+@params:
+	key: string, from searchKey() or movieKey()
+@returns:
+	the stored value, or None if there is no fresh entry (or the cache is turned off)
+"""
+def get(key):
+	if not CACHE_ENABLED:
+		return None
+	try:
+		conn = _conn()
+		row = conn.execute("SELECT VALUE, STORED FROM ENTRIES WHERE KEY = ?", (key,)).fetchone()
+		if row is None:
+			return None
+		now = time.time()
+		if now - row[1] > CACHE_TTL:
+			conn.execute("DELETE FROM ENTRIES WHERE KEY = ?", (key,))
+			return None
+		conn.execute("UPDATE ENTRIES SET USED = ? WHERE KEY = ?", (now, key))
+		return json.loads(row[0])
+	except sqlite3.Error:
+		#a cache that can't be read is just a cache miss
+		return None
+
+"""
+Stores an entry, replacing any older one under the same key.
+@params:
+	key:   string, from searchKey() or movieKey()
+	value: anything that can be written as JSON
+"""
+def put(key, value):
+	if not CACHE_ENABLED:
+		return
+	data = json.dumps(value, separators=(",", ":"))
+	now = time.time()
+	try:
+		_conn().execute("INSERT OR REPLACE INTO ENTRIES (KEY, VALUE, STORED, USED, SIZE) VALUES (?, ?, ?, ?, ?)",
+		                (key, data, now, now, len(data)))
+		_writes[0] += 1
+		if _writes[0] % EVICT_EVERY == 0:
+			evict()
+	except sqlite3.Error:
+		pass
+
+"""
+Drops expired entries, then the least recently used ones until the cache fits in CACHE_MAX_BYTES.
+"""
+def evict():
+	conn = _conn()
+	conn.execute("DELETE FROM ENTRIES WHERE STORED < ?", (time.time() - CACHE_TTL,))
+	total = conn.execute("SELECT COALESCE(SUM(SIZE), 0) FROM ENTRIES").fetchone()[0]
+	if total <= CACHE_MAX_BYTES:
+		return
+	doomed = []
+	for key, size in conn.execute("SELECT KEY, SIZE FROM ENTRIES ORDER BY USED").fetchall():
+		if total <= CACHE_MAX_BYTES:
+			break
+		doomed.append((key,))
+		total -= size
+	conn.executemany("DELETE FROM ENTRIES WHERE KEY = ?", doomed)
+
+"""
+Returns a dictionary describing the cache: number of search and movie entries, total bytes, and where it lives.
+"""
+def stats():
+	conn = _conn()
+	result = {"path": CACHE_PATH, "searches": 0, "movies": 0, "bytes": 0, "max_bytes": CACHE_MAX_BYTES, "ttl": CACHE_TTL}
+	for kind, count, size in conn.execute("SELECT substr(KEY, 1, instr(KEY, ':') - 1), COUNT(*), SUM(SIZE) FROM ENTRIES GROUP BY 1"):
+		if kind == "search":
+			result["searches"] = count
+		elif kind == "movie":
+			result["movies"] = count
+		result["bytes"] += size
+	return result
+
+"""
+Deletes every entry.
+"""
+def clear():
+	_conn().execute("DELETE FROM ENTRIES")
+
+def main():
+	if len(sys.argv) != 2 or sys.argv[1] not in ("stats", "clear"):
+		print "Usage: python db_webcache.py stats|clear"
+		return
+	if sys.argv[1] == "clear":
+		clear()
+		print "The IMDb cache has been cleared."
+	else:
+		info = stats()
+		print "IMDb cache at " + info["path"]
+		print str(info["searches"]) + " searches, " + str(info["movies"]) + " movies, " + \
+		      "%.1f of %.1f MB used" % (info["bytes"] / 1048576.0, info["max_bytes"] / 1048576.0)
+		print "Entries expire after %.1f days." % (info["ttl"] / 86400.0)
+
+if __name__ == "__main__":
+	main()
@@ -4,10 +4,12 @@ language: python2
 author: Peter Jindra, peterfjindra@gmail.com
 
 Main page for the myMDb application.
-This application utilizes a PostgreSQL database to store information about movies for the user.
+This application utilizes a PostgreSQL database to store information about movies for the user
+(or a SQLite file, with MYMDB_BACKEND=sqlite, see db_backend.py).
 The IMBbPY python package is used to get data from IMDb, which is stored in a local database.
 More info on how this application works can be found in the function header comments and the README file.
 To run the application, just run this python program (after installing PostgreSQL and IMDbPY)!
+Run it as "python myMDb.py --stats" to see how many queries and IMDb calls each menu action made, and how long they took.
 
 This code is publicly available on https://github.com/peterfjindra/capstone-project.git
 IMDbPY package is hosted on: http://imdbpy.sourceforge.net/
@@ -18,42 +20,112 @@ Special 'thank you' to www.imdb.com for keeping all this info available so we do
 terminology, since more people are probably familiar with it.] 
 """
 
+import atexit
 import sys
-import db_setup
+import db_indexer
+import db_stats
 from db_web import *
 from db_personal import *
 from temp_objects import tempMovie, tempPerson
 from getpass import getpass
 
+#only the backend in use is loaded: db_personal imports db_postgres (and with it psycopg2, db_pool, and db_aio) or
+#db_sqlite, and nothing here imports the other one. db_setup and db_migrate are imported by openPostgres().
+#IMDbPY is only imported by db_web.py the first time a movie is looked up.
+
+#the logical operation each menu choice is counted under by db_stats.py
+VIEW_OPERATIONS = {"M": "movie search", "C": "check person", "P": "portfolio", "F": "filmography",
+                   "L": "movies to watch", "S": "statistics"}
+ADD_OPERATIONS = {"A": "add movie", "U": "update movie"}
+
 """
-A preliminary check to see if the db exists.
+Checks the password, and whether the app's database exists, with as few connections to the server as possible.
+Normally the database is there, and the first connection of the pool (see db_pool.py) answers both questions.
+That connection is kept, and is the one the app goes on to use. Only if it can't be opened is the server's default db
+tried, to tell a wrong password from a database that hasn't been created yet, and that connection is closed straight away.
 @params:
 	passw: string, the password entered by the user
 @returns:
-	True if the database exists
-	False if the password doesn't exist
+	"ready" if the password is correct and the database exists (the pool is up and running)
+	"missing" if the password is correct but the database hasn't been created yet
+	"wrong password" if no connection could be made
 """
-def dbExists(passw):
+def checkLogin(passw):
+	import psycopg2
+	import db_pool
+	try:
+		db_pool.initPool(passw)
+		return "ready"
+	except psycopg2.OperationalError:
+		pass
 	try:
-		psycopg2.connect(database="test", user="postgres", password=passw, host="127.0.0.1", port="5432")
-		return True
+		conn = psycopg2.connect(database="postgres", user=db_pool.DB_USER, password=passw, host=db_pool.DB_HOST, port=db_pool.DB_PORT)
 	except psycopg2.OperationalError:
-		return False
+		return "wrong password"
+	conn.close()
+	return "missing"
 
 """
-Checks for the correct password by attempting to connect to the default db.
+Prints a list of movies one page at a time, asking before each new page is fetched.
 @params:
-	passw: string, the password entered by the user
+	first_page: (array of tempMovie objects, key for the next page), from one of the *Page functions in db_personal.py
+	next_page:  function that takes the key of the next page and returns that page, like first_page
+"""
+def showPages(first_page, next_page):
+	movies, after_id = first_page
+	while(1):
+		for movie in movies:
+			print movie.simpleToString()
+		if after_id == None:
+			break
+		print "\n(N)ext page, or press enter to stop."
+		if raw_input(":").upper() != "N":
+			break
+		movies, after_id = next_page(after_id)
+
+"""
+Lists the closest matches from a fuzzy search, with how well each one matched, and lets the user pick one.
+@params:
+	matches: array of (object, score) from fuzzyMovies() or fuzzyPeople() in db_personal.py
+	label:   function that gives the line to show for one of the objects
 @returns:
-	True if the password is correct
-	False if the password is incorrect
+	the object the user picked
+	None if they didn't pick one
 """
-def correctPass(passw):
-	try:
-		psycopg2.connect(database="postgres", user="postgres", password=passw, host="127.0.0.1", port="5432")
-		return True
-	except psycopg2.OperationalError:
-		return False
+def pickMatch(matches, label):
+	for i in range(len(matches)):
+		match, score = matches[i]
+		print "(" + str(i + 1) + ") " + label(match) + "  [" + str(int(round(score * 100))) + "% match]"
+	print "Type the number of the one you meant, or press enter to go back."
+	answer = raw_input(":")
+	if answer.isdigit() and 1 <= int(answer) <= len(matches):
+		return matches[int(answer) - 1][0]
+	return None
+
+"""
+Prints the numbers from getLibraryStats() in db_personal.py, and how many credits are still waiting to be stored.
+@params:
+	stats: dictionary from getLibraryStats()
+	queue: dictionary from db_indexer.status()
+"""
+def showStats(stats, queue):
+	print "\nYour library has " + str(stats["movies"]) + " movie(s)."
+	print "Watched: " + str(stats["watched"]) + ", not watched yet: " + str(stats["unwatched"]) + ", owned: " + str(stats["owned"])
+	if stats["average_rating"] == None:
+		print "You haven't rated any movies yet."
+	else:
+		print "Your average rating: %.1f" % stats["average_rating"]
+	hours, minutes = divmod(stats["unwatched_runtime"], 60)
+	print "Watching everything you haven't seen yet would take " + str(hours) + " hour(s) and " + str(minutes) + " minute(s)."
+	for role, heading in (("director", "Directors"), ("writer", "Writers"), ("actor", "Actors")):
+		if stats["top"][role] != []:
+			print "\nTop " + heading + ":"
+			for name, count in stats["top"][role]:
+				print "  " + name + " (" + str(count) + " movie(s))"
+	if queue["movies"] > 0:
+		print "\nThe rest of the cast of " + str(queue["movies"]) + " movie(s) (" + str(queue["credits"]) + " credit(s)) is still being added."
+		if queue["error"] != None:
+			print "The last try at adding them failed: " + queue["error"]
 
 def viewStuff(passw):
 	while(1):
@@ -61,20 +133,32 @@ def viewStuff(passw):
 		print "(M)ovie search."
 		print "(C)heck if a specific actor, director, or writer is in my database."
 		print "(P)ortfolio display of an actor, director, or writer in my database."
+		print "(F)ilmography of someone in my database, in every role."
 		print "(L)ist of movies in my database I haven't watched."
+		print "(S)tatistics about my library."
 		print "(E)xit to the main menu."
 		answer = raw_input(":").upper()
+		db_stats.setOperation(VIEW_OPERATIONS.get(answer))
 		if answer.upper() == "M":
 			print "What's the title of the movie you want to search for?"
-			title = raw_input(":").upper().replace("'","")
+			title = raw_input(":").upper()
 			found_movies = getMovies(title, passw)
 			if found_movies == None:
-				print "No movies in the database by that title."
-				continue
-			else:
+				matches = fuzzyMovies(title, passw)
+				if matches == []:
+					print "No movies in the database by that title."
+					continue
+				print "\nNo movies in the database by exactly that title. Did you mean:"
+				match = pickMatch(matches, lambda movie: movie.title + " (" + str(movie.year) + ")")
+				if match == None:
+					continue
+				found_movies = getMovies(match.title, passw)
+			if found_movies != None:
 				print "\nWe found " + str(len(found_movies)) + " movie(s) with that title in the db."
 				for movie in found_movies:
 					movie.printInfo()
+					if not isFullyIndexed(movie, passw):
+						print "(The rest of the cast is still being added.)"
 		elif answer == "C":
 			print "Are you searching for an (A)ctor, (D)irector, or (W)riter?"
 			type_input = raw_input(":")
@@ -88,11 +172,16 @@ def viewStuff(passw):
 				print "Incorrect type. Valid inputs are A, D, and W."
 				continue
 			print "What's the name of the person you're searching for?"
-			name = raw_input(":").upper().replace("'","")
+			name = raw_input(":").upper()
 			if hasPerson(tempPerson(name, p_type), passw):
 				print "\n" + name + " is in your database."
 			else:
 				print name + " is not in your database."
+				matches = fuzzyPeople(tempPerson(name, p_type), passw)
+				if matches != []:
+					print "People in your database with similar names:"
+					for match, score in matches:
+						print match.name + "  [" + str(int(round(score * 100))) + "% match]"
 			continue
 		elif answer == "P":
 			print "\nAre you searching for an (A)ctor, (D)irector, or (W)riter?"
@@ -108,19 +197,41 @@ def viewStuff(passw):
 				continue
 			print "What's the name of the person you're searching for?"
 			name = raw_input(":").upper()
-			results = portfolio(tempPerson(name, p_type), passw)
-			if portfolio:
+			person = tempPerson(name, p_type)
+			first_page = portfolioPage(person, passw)
+			if first_page == None:
+				matches = fuzzyPeople(person, passw)
+				if matches != []:
+					print "\n" + name + " is not in your database. Did you mean:"
+					match = pickMatch(matches, lambda match: match.name)
+					if match == None:
+						continue
+					person = match
+					name = person.name
+					first_page = portfolioPage(person, passw)
+			if first_page != None:
 				print "\n" + name + " worked on these movies in your database:"
-				for movie in results:
-					print movie.simpleToString()
+				showPages(first_page, lambda after_id: portfolioPage(person, passw, after_id))
 				continue
 			else:
 				print name + " is not in your database."
+		elif answer == "F":
+			print "What's the name of the person you're searching for?"
+			name = raw_input(":").upper()
+			found_movies = filmography(name, passw)
+			if found_movies == None:
+				print name + " is not in your database."
+				continue
+			print "\n" + name + " worked on these movies in your database:"
+			for movie, roles in found_movies:
+				print movie.simpleToString() + " (" + ", ".join(roles) + ")"
+			continue
 		elif answer == "L":
-			unwatched_movies = getMoviesToWatch(passw)
 			print "\nMovies To Watch:\n"
-			for movie in unwatched_movies:
-				print movie.simpleToString()
+			showPages(getMoviesToWatchPage(passw), lambda after_id: getMoviesToWatchPage(passw, after_id))
+			continue
+		elif answer == "S":
+			showStats(getLibraryStats(passw), db_indexer.status(passw))
 			continue
 		elif answer == "E":
 			break
@@ -135,6 +246,7 @@ def addStuff(passw):
 		print "(U)pdate a movie in the database."
 		print "(E)xit to the main menu."
 		answer = raw_input(":").upper()
+		db_stats.setOperation(ADD_OPERATIONS.get(answer))
 		if answer == "E":
 			break
 		elif answer == "A":
@@ -147,27 +259,19 @@ def addStuff(passw):
 			pulled_movie.rating = rating
 			pulled_movie.watched = watched
 			pulled_movie.own = own
-			if not addMovie(pulled_movie, passw):
+			print "Adding info to the database. This may take a moment..."
+			#only the top billed are added now, db_indexer.py adds the rest of a big cast in the background
+			if not addMovieWithCredits(pulled_movie, passw, top_billed=TOP_BILLED):
 				print "This movie is already in the database."
 			else:
-				print "Adding info to the database. This may take a moment..."
-				for director in pulled_movie.director:
-					new_director = tempPerson(director.upper(), 'director')
-					addPerson(new_director, passw)
-					addRole(pulled_movie, new_director, passw)
-				for writer in pulled_movie.writer:
-					new_writer = tempPerson(writer.upper(), 'writer')
-					addPerson(new_writer, passw)
-					addRole(pulled_movie, new_writer, passw)
-				for actor in pulled_movie.cast:
-					new_actor = tempPerson(actor.upper(), 'actor')
-					addPerson(new_actor, passw)
-					addRole(pulled_movie, new_actor, passw)
+				db_indexer.wake()
 				print "The movie and the people associated with it have been added to the db."
+				if len(pulled_movie.cast or []) > TOP_BILLED:
+					print "The other " + str(len(pulled_movie.cast) - TOP_BILLED) + " cast member(s) are being added in the background."
 				continue
 		elif answer == "U":
 			print "\nWhat's the title of the movie you want to search for?"
-			title = raw_input(":").upper().replace("'","")
+			title = raw_input(":").upper()
 			found_movies = getMovies(title, passw)
 			if found_movies == None:
 				print "No movies in the database by that name."
@@ -177,9 +281,7 @@ def addStuff(passw):
 				if selection:
 					print "OK. Lets update " + selection.title
 					rating, watched, own = userSpecificInfo()
-					setRating(selection, rating, passw)
-					setOwn(selection, own, passw)
-					setWatched(selection, watched, passw)
+					updateMovie(selection, passw, rating=rating, watched=watched, own=own)
 			continue
 		else:
 			print "Invalid input."
@@ -245,25 +347,71 @@ def mainMenu(passw):
 			print "Please enter one of the suggested options."
 			continue
 
-def main():
-	print "Welcome to myMDb!"
+"""
+Gets the PostgreSQL database ready: asks for the password, creates the database the first time, and brings it up to date.
+@returns:
+	the password, which every db_personal function is given from here on out
+"""
+def openPostgres():
+	import db_migrate
+	import db_pool
+	import db_setup
 	passw = getpass("To begin, please enter your PostgreSQL password:")
 
 	#first, we make sure they entered the correct password
 	attempts = 0
-	while not correctPass(passw):
+	login = checkLogin(passw)
+	while login == "wrong password":
 		attempts += 1
 		if attempts % 3 == 0:
 			print "Unable to connect to the db. Make sure you have PostgreSQL installed correctly."
 		passw = getpass("Incorrect password. Please try again:")
+		login = checkLogin(passw)
 
 	#if this is their first time using the app, we need to create the database
-	if not dbExists(passw):
+	first_time = login == "missing"
+	if first_time:
 		print "Welcome, first time user! Please give me a moment to set things up."
 		db_setup.createDb(passw)
+		#every db_personal function borrows its connection from this pool from here on out
+		db_pool.initPool(passw)
+
+	#then bring its tables up to date, whether they are brand new or from an older version of the app.
+	#This is done on the pool's own connection, so normally startup only ever connects to the server once
+	with db_pool.connection(passw) as conn:
+		db_migrate.migrate(passw, conn)
+	if first_time:
+		print "\nSetup complete!"
+	return passw
+
+"""
+Gets the SQLite library file ready, creating it the first time. There is no server and no password.
+@returns:
+	None, in place of a password
+"""
+def openSqlite():
+	import db_sqlite
+	if not db_sqlite.dbExists():
+		print "Welcome, first time user! Your library will be kept in " + db_sqlite.DB_PATH
+	db_sqlite.migrate()
+	return None
+
+def main():
+	#with --stats, the queries and IMDb calls made for each menu action are listed when the app exits (see db_stats.py)
+	if "--stats" in sys.argv[1:]:
+		db_stats.MEASURE_SIZES = True
+		atexit.register(db_stats.report)
+	print "Welcome to myMDb!"
+	if BACKEND == "sqlite":
+		passw = openSqlite()
+	else:
+		passw = openPostgres()
+	#stores the rest of the cast of movies added with only their top billed people, starting with any left from last time
+	db_indexer.start(passw)
 
 	mainMenu(passw)
 
+	#the connection pool, if there is one, is closed as the app exits (see db_pool.closePool())
 	sys.exit("Thanks for using myMDb!")		
 
 if __name__ == "__main__":
@@ -5,13 +5,33 @@ author: Peter Jindra, peterfjindra@gmail.com
 
 Classes that are part of the myMDb project.
 Mainly, these objects are used for temporary data storage.
+A big library or portfolio can mean a lot of these at once, so they are kept small: they use __slots__ instead of
+a __dict__ per object, the people of a movie are kept in tuples, and names are interned so a name that shows up in
+many movies is only stored once. benchmarks/bench_objects.py measures how much this saves.
 """
 
+"""
+Returns the single shared copy of a name.
+Only byte strings (which is what the db hands back) can be interned; unicode names from IMDb are returned as they are.
+"""
+def internName(name):
+	if type(name) is str:
+		return intern(name)
+	return name
+
+"""
+Turns an array of names into a tuple of interned names. None (no info) stays None.
+"""
+def _names(people):
+	if people is None:
+		return None
+	return tuple([internName(name) for name in people])
+
 """
 Class which temporarily holds the data of a film.
 @params:
 	title:    string
-	director: array of strings, there may be multiple directors
+	director: array of strings, there may be multiple directors (stored as a tuple)
 	writer:   (see director)
 	cast:     (see director)
 	year:     string, year(s) of release. ("XXXX" for movies, "XXXX-XXXX" for TV shows)
@@ -20,19 +40,24 @@ Class which temporarily holds the data of a film.
 	rating:   float, your personal 1 to 10 rating
 	watched:  boolean, True if you've seen the movie
 	own:      boolean, True if you own the movie
+	movie_id: int, its id in the MOVIES table if it came from the db, so it can be updated without looking it up again.
+	          None if it didn't (or isn't known)
 """
-class tempMovie:
-	def __init__(self, title, director, writer, cast, year, runtime, mpaa, rating, watched, own):
+class tempMovie(object):
+	__slots__ = ("title", "director", "writer", "cast", "year", "runtime", "mpaa", "rating", "watched", "own", "movie_id")
+
+	def __init__(self, title, director, writer, cast, year, runtime, mpaa, rating, watched, own, movie_id=None):
 		self.title = title
-		self.director = director
-		self.writer = writer
-		self.cast = cast
+		self.director = _names(director)
+		self.writer = _names(writer)
+		self.cast = _names(cast)
 		self.year = year
 		self.runtime = runtime
 		self.mpaa = mpaa
 		self.rating = rating
 		self.watched = watched
 		self.own = own
+		self.movie_id = movie_id
 
 	"""
 	Neatly prints all the info about the movie.
@@ -113,13 +138,51 @@ class tempMovie:
 			rating = self.rating
 		return title + ", " + year + ", " + runtime + " minutes, " + mpaa + ", " + str(rating) + ", " + w_string + ", " + o_string
 
+"""
+Class which temporarily holds a search result from IMDb: just enough to tell which movie it is, without fetching
+the whole movie (see db_web.pullMovie()).
+@params:
+	imdb_id: string, IMDb movie id, used to fetch the whole movie once it is picked
+	title:   string
+	year:    string, year(s) of release, or None
+	kind:    string, what IMDb says it is ("movie", "tv series", "video game", ...), or None
+	runtime: string, runtime in minutes, or None if it isn't known without fetching the movie
+	mpaa:    string, mpaa rating, or None (see runtime)
+"""
+class tempCandidate(object):
+	__slots__ = ("imdb_id", "title", "year", "kind", "runtime", "mpaa")
+
+	def __init__(self, imdb_id, title, year, kind, runtime=None, mpaa=None):
+		self.imdb_id = imdb_id
+		self.title = title
+		self.year = year
+		self.kind = kind
+		self.runtime = runtime
+		self.mpaa = mpaa
+
+	"""
+	Returns a string of its basic info, leaving out what isn't known.
+	Used to show search results.
+	"""
+	def simpleToString(self):
+		parts = [self.title or "n/a", self.year or "n/a"]
+		if self.kind and self.kind != "movie":
+			parts.append(self.kind)
+		if self.runtime not in (None, "n/a"):
+			parts.append(self.runtime + " minutes")
+		if self.mpaa not in (None, "n/a"):
+			parts.append(self.mpaa)
+		return ", ".join(parts)
+
 """
 Class which temporarily holds the data of a person.
 @params:
 	name:   string
 	p_type: string, exclusively "actor", "director", or "writer"
 """
-class tempPerson:
+class tempPerson(object):
+	__slots__ = ("name", "p_type")
+
 	def __init__(self, name, p_type):
-		self.name = name
+		self.name = internName(name)
 		self.p_type = p_type
\ No newline at end of file
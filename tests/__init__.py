@@ -0,0 +1,11 @@
+"""
+tests
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Tests for the myMDb project. None of them touch the real library or IMDb itself: IMDb is played by a local stub
+(see stub_imdb.py), and the db, the IMDb cache, and the mirror are kept in temporary files.
+
+Usage (from the project folder):
+	python -m unittest discover -s tests -t .
+"""
@@ -0,0 +1,91 @@
+"""
+postgres_db.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+A scratch PostgreSQL database for the tests that need a server, built by the same migrations as the real library.
+The password is read from PGPASSWORD. Without it, or when no server answers, the tests that need one are skipped.
+"""
+import os
+import sys
+import unittest
+from StringIO import StringIO
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+import db_aio
+import db_migrate
+import db_pool
+import db_postgres
+
+#the database the tests build on the server, and drop again when they are done
+TEST_DB = "mymdb_tests"
+
+_settings = []
+
+"""
+Connects to the server's "postgres" database, outside of any transaction, to create or drop TEST_DB.
+"""
+def _server(passw):
+	conn = psycopg2.connect(database="postgres", user=db_pool.DB_USER, password=passw, host=db_pool.DB_HOST, port=db_pool.DB_PORT)
+	conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+	return conn
+
+"""
+Points db_pool.py and db_aio.py at another database, closing whatever they had open and forgetting cached ids.
+"""
+def _useDb(name):
+	db_aio.shutdown()
+	db_pool.closePool()
+	db_pool.DB_NAME = name
+	db_postgres.clearIdCaches()
+	del db_postgres._trigram[:]
+
+"""
+Builds an empty, fully migrated TEST_DB and points the app at it. Call this from setUpClass().
+@returns:
+	string, the password
+@raises:
+	unittest.SkipTest if PGPASSWORD isn't set or the server can't be reached
+"""
+def createTestDb():
+	passw = os.environ.get("PGPASSWORD")
+	if not passw:
+		raise unittest.SkipTest("PGPASSWORD isn't set, so there's no PostgreSQL server to test against")
+	try:
+		conn = _server(passw)
+	except psycopg2.OperationalError as e:
+		raise unittest.SkipTest("no PostgreSQL server to test against: " + str(e).strip())
+	cur = conn.cursor()
+	cur.execute("DROP DATABASE IF EXISTS " + TEST_DB)
+	cur.execute("CREATE DATABASE " + TEST_DB)
+	conn.close()
+	_settings.append(db_pool.DB_NAME)
+	_useDb(TEST_DB)
+	#the migrations report each step, which would only clutter the test output
+	stdout = sys.stdout
+	sys.stdout = StringIO()
+	try:
+		db_migrate.migrate(passw)
+	finally:
+		sys.stdout = stdout
+	return passw
+
+"""
+Drops TEST_DB and points the app back at the database it used before. Call this from tearDownClass().
+"""
+def dropTestDb(passw):
+	_useDb(_settings.pop())
+	conn = _server(passw)
+	conn.cursor().execute("DROP DATABASE IF EXISTS " + TEST_DB)
+	conn.close()
+
+"""
+Empties every table of TEST_DB between tests, and forgets the ids that were cached from it.
+The library statistics are rebuilt to match (see db_migrate.rebuildStats()).
+"""
+def emptyTestDb(passw):
+	with db_pool.connection(passw) as conn:
+		cur = conn.cursor()
+		cur.execute("TRUNCATE MOVIES, PEOPLE, CREDITS, PENDING_CREDITS CASCADE")
+		db_migrate.rebuildStats(cur)
+	db_postgres.clearIdCaches()
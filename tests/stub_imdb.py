@@ -0,0 +1,76 @@
+"""
+stub_imdb.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+A local stand-in for IMDbPY's IMDb class, used by the tests so they don't depend on IMDb being up.
+Unlike benchmarks/fake_imdb.py, which serves a big made-up catalog, this one is told exactly what to do for each movie:
+how long get_movie() takes, whether it fails, and whether it hangs until released. To use it:
+	db_web.IMDB_FACTORY = StubIMDb
+The behavior is kept on the class, since db_web.py makes a new IMDb object for every thread.
+"""
+import threading
+import time
+
+"""
+A movie or person, which IMDbPY represents as a dictionary that also has an id.
+"""
+class StubItem(dict):
+	def __init__(self, item_id, fields):
+		dict.__init__(self, fields)
+		self.movieID = item_id
+		self.personID = item_id
+
+class StubIMDb(object):
+	#movie id -> seconds get_movie() waits before answering
+	delays = {}
+	#movie ids get_movie() raises an error for
+	failing = set()
+	#movie ids get_movie() doesn't answer for until release() is called
+	hanging = set()
+	#every get_movie() call, as (movie id, time it started)
+	calls = []
+	_released = threading.Event()
+	_lock = threading.Lock()
+
+	"""
+	Forgets every movie's behavior and the calls made, and releases anything still hanging.
+	"""
+	@classmethod
+	def reset(cls):
+		cls.release()
+		cls.delays = {}
+		cls.failing = set()
+		cls.hanging = set()
+		cls.calls = []
+		cls._released = threading.Event()
+
+	"""
+	Lets every hanging get_movie() call give up.
+	"""
+	@classmethod
+	def release(cls):
+		cls._released.set()
+
+	"""
+	Gives one basic movie per word of the title searched for, with ids "0000001", "0000002", ...
+	"""
+	def search_movie(self, title):
+		return [StubItem("%07d" % (i + 1), {"title": word, "year": 2000 + i, "kind": "movie"})
+		        for i, word in enumerate(title.split())]
+
+	"""
+	Gives the full movie with the given id, with the fields db_web.extractFields() reads.
+	"""
+	def get_movie(self, movie_id):
+		with self._lock:
+			self.calls.append((movie_id, time.time()))
+		if movie_id in self.hanging:
+			self._released.wait()
+			raise IOError("gave up on " + movie_id)
+		time.sleep(self.delays.get(movie_id, 0))
+		if movie_id in self.failing:
+			raise IOError("couldn't load " + movie_id)
+		return StubItem(movie_id, {"title": "MOVIE " + movie_id, "year": 2000, "runtimes": ["100"],
+		                           "certificates": ["USA:PG"], "director": [StubItem("1", {"name": "A DIRECTOR"})],
+		                           "writer": [], "cast": [StubItem("2", {"name": "AN ACTOR"})]})
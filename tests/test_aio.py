@@ -0,0 +1,161 @@
+"""
+test_aio.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Tests of the asynchronous layer under the PostgreSQL backend (db_aio.py).
+The coroutine and Future tests need no database. The event-loop tests run against a scratch database
+(see postgres_db.py), and are skipped when there's no PostgreSQL server to test against.
+"""
+import threading
+import unittest
+from multiprocessing import TimeoutError
+import db_aio
+import db_postgres
+from db_aio import coroutine, query, Return, COMMIT
+from temp_objects import tempMovie, tempPerson
+from tests import postgres_db
+
+def _inner(value):
+	rows = yield query("SELECT %s", (value,))
+	raise Return(rows[0][0] * 2)
+
+def _outer():
+	doubled = yield _inner(2)
+	yield COMMIT
+	tripled = yield _inner(3)
+	raise Return((doubled, tripled))
+
+class StepsTest(unittest.TestCase):
+	"""
+	Nested coroutines run in their caller's place, and their values are sent back into it.
+	"""
+	def testNested(self):
+		steps = db_aio._Steps(_outer())
+		self.assertEqual(steps.send(None), (("query", "SELECT %s", (2,)), None))
+		self.assertEqual(steps.send([(2,)]), (COMMIT, None))
+		self.assertEqual(steps.send(None), (("query", "SELECT %s", (3,)), None))
+		self.assertEqual(steps.send([(3,)]), (None, (4, 6)))
+
+	"""
+	A coroutine that runs nothing is done on the first step, and a plain return gives None.
+	"""
+	def testNoStatements(self):
+		def cached():
+			if True:
+				raise Return(42)
+			yield
+		def nothing():
+			if False:
+				yield
+		self.assertEqual(db_aio._Steps(cached()).send(None), (None, 42))
+		self.assertEqual(db_aio._Steps(nothing()).send(None), (None, None))
+
+	"""
+	A coroutine whose answer is cached never borrows a connection (there's no server here to borrow one from).
+	"""
+	def testCachedRunsWithoutConnection(self):
+		@coroutine
+		def cached(passw):
+			if True:
+				raise Return(passw)
+			yield
+		self.assertEqual(cached("no password"), "no password")
+		self.assertEqual(db_aio.submit(cached, "no password").get(0), "no password")
+
+	def testYieldingNoneFails(self):
+		def broken():
+			yield None
+		self.assertRaises(TypeError, db_aio._Steps(broken()).send, None)
+
+class FutureTest(unittest.TestCase):
+	def testCallbacks(self):
+		future = db_aio.Future()
+		seen = []
+		future.addCallback(lambda done: seen.append(("before", done.get(0))))
+		self.assertFalse(future.ready())
+		future._finish(5)
+		future.addCallback(lambda done: seen.append(("after", done.get(0))))
+		self.assertEqual(seen, [("before", 5), ("after", 5)])
+		self.assertTrue(future.successful())
+
+	def testError(self):
+		future = db_aio.Future()
+		future._finish(None, ValueError("bad"))
+		self.assertFalse(future.successful())
+		self.assertRaises(ValueError, future.get, 0)
+
+	def testTimeout(self):
+		self.assertRaises(TimeoutError, db_aio.Future().get, 0.05)
+
+"""
+A coroutine that adds a movie and then fails, to check that the whole call is rolled back.
+"""
+@coroutine
+def _addThenFail(title, passw):
+	yield query("INSERT INTO MOVIES (TITLE, YEAR, WATCHED, OWN) VALUES (%s, '2001', FALSE, FALSE)", (title,))
+	yield query("SELECT 1/0")
+
+class EventLoopTest(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.passw = postgres_db.createTestDb()
+
+	@classmethod
+	def tearDownClass(cls):
+		postgres_db.dropTestDb(cls.passw)
+
+	def setUp(self):
+		postgres_db.emptyTestDb(self.passw)
+		self.movies = []
+		for i in range(40):
+			movie = tempMovie("MOVIE " + str(i), ["DIRECTOR " + str(i % 5)], [], ["ACTOR " + str(i), "ACTOR " + str(i + 1)],
+			                  "2000", "90", "PG", None, False, False)
+			db_postgres.addMovieWithCredits(movie, self.passw)
+			self.movies.append(movie)
+		#so every call below has to go to the server
+		db_postgres.clearIdCaches()
+
+	"""
+	Hundreds of calls are in flight at once on the one event-loop thread, and give the same answers as the plain calls.
+	"""
+	def testManyCallsOnOneThread(self):
+		threads = threading.active_count()
+		futures = []
+		for i in range(5):
+			futures += [db_aio.submit(db_postgres.getMovies, movie.title, self.passw) for movie in self.movies]
+			futures += [db_aio.submit(db_postgres.hasPerson, tempPerson("DIRECTOR " + str(j), "director"), self.passw)
+			            for j in range(10)]
+		self.assertGreaterEqual(len(futures), 250)
+		values = [future.get(30) for future in futures]
+		self.assertLessEqual(threading.active_count(), threads + 1)
+		self.assertLessEqual(len(db_aio._loops[0].connections), db_aio.AIO_CONNECTIONS)
+		found = [value[0] for value in values if isinstance(value, list)]
+		self.assertEqual([movie.title for movie in found], [movie.title for movie in self.movies] * 5)
+		self.assertEqual(list(found[3].cast), ["ACTOR 3", "ACTOR 4"])
+		self.assertEqual([value for value in values if not isinstance(value, list)], ([True] * 5 + [False] * 5) * 5)
+		credits = lambda found: [(movie.title, roles) for movie, roles in found]
+		self.assertEqual(credits(db_aio.submit(db_postgres.filmography, "ACTOR 4", self.passw).get(10)),
+		                 credits(db_postgres.filmography("ACTOR 4", self.passw)))
+
+	"""
+	Writes are committed, and ids are only cached once they are.
+	"""
+	def testWrites(self):
+		movie = tempMovie("NEW MOVIE", ["NEW DIRECTOR"], [], ["NEW ACTOR"], "2010", "100", "R", None, False, False)
+		self.assertTrue(db_aio.submit(db_postgres.addMovieWithCredits, movie, self.passw).get(10))
+		self.assertTrue(db_aio.submit(db_postgres.setRating, movie, "7.5", self.passw).get(10))
+		self.assertEqual(db_postgres.getMovies("NEW MOVIE", self.passw)[0].rating, "7.5")
+		self.assertIsNotNone(db_postgres._movie_ids.get(("NEW MOVIE", "2010")))
+
+	"""
+	A call that fails is rolled back and raises from get(), and the loop carries on with the next one.
+	"""
+	def testFailureRollsBack(self):
+		failed = db_aio.submit(_addThenFail, "NEVER ADDED", self.passw)
+		self.assertRaises(Exception, failed.get, 10)
+		self.assertIsNone(db_aio.submit(db_postgres.getMovies, "NEVER ADDED", self.passw).get(10))
+		self.assertTrue(db_aio.submit(db_postgres.hasMovie, self.movies[0], self.passw).get(10))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,276 @@
+"""
+test_archive.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Tests of backing up and restoring a whole library with db_archive.py.
+ArchiveTests holds the tests, and each storage backend has a TestCase that runs them on a library of its own,
+the same way as in test_backends.py. Every archive format is restored into an empty library and has to come back
+row for row, with titles and names that have tabs, newlines, backslashes, and quotes in them.
+"""
+import json
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+import zlib
+from StringIO import StringIO
+import psycopg2
+import db_archive
+import db_personal
+import db_pool
+import db_sqlite
+from temp_objects import tempMovie
+from tests import postgres_db
+
+#errors a cut off archive can come out as, from tarfile and gzip before db_archive.py sees it is short,
+#or from PostgreSQL when COPY was reading the member that broke off
+_TRUNCATED_ERRORS = (ValueError, IOError, EOFError, tarfile.TarError, zlib.error, psycopg2.Error)
+
+def _movies():
+	return [tempMovie("TAB\tIN THE TITLE", ["JOHN O'BRIEN"], ["SAM \"THE PEN\" SMITH"], ["ANNE\tTAB", "BOB BACK\\SLASH"], "1999",
+	                  "101 min", "PG", "7.5", True, False),
+	        tempMovie("TWO\nLINES, \"QUOTED\"", ["JOHN O'BRIEN"], None, ["CARRIAGE\rRETURN", "ANNE\tTAB"], "2004", None, None, None,
+	                  False, True),
+	        tempMovie("NOT NULL \\N, BACK\\SLASH", None, ["SAM \"THE PEN\" SMITH"], ["BOB BACK\\SLASH"], None, None, None, None,
+	                  False, False),
+	        tempMovie("{\"JSON\": [1, 2]}", ["JOHN O'BRIEN"], None, ["ANNE\tTAB"] + ["EXTRA " + str(i) for i in range(20)], "2010",
+	                  "90 min", "R", "10", True, True)]
+
+"""
+Every row of every archived table, in id order, to compare a library before and after a round trip.
+"""
+def _rows(execute):
+	return dict([(table, execute("SELECT " + ", ".join(columns) + " FROM " + table + " ORDER BY ID"))
+	             for table, columns in db_archive.TABLES])
+
+"""
+Writes a copy of an archive with its manifest and members changed by edit(manifest, members),
+where members is an array of [name, contents].
+"""
+def _rewrite(path, new_path, edit):
+	with tarfile.open(path, "r:gz") as tar:
+		members = [[member.name, tar.extractfile(member).read()] for member in tar]
+	manifest = json.loads(members.pop(0)[1])
+	edit(manifest, members)
+	members.insert(0, ["manifest.json", json.dumps(manifest)])
+	with tarfile.open(new_path, "w:gz") as tar:
+		for name, contents in members:
+			info = tarfile.TarInfo(name)
+			info.size = len(contents)
+			tar.addfile(info, StringIO(contents))
+
+"""
+Runs a function without letting it print anything.
+"""
+def _quietly(function):
+	stdout = sys.stdout
+	sys.stdout = StringIO()
+	try:
+		function()
+	finally:
+		sys.stdout = stdout
+
+def _dropLastLine(contents):
+	return contents.rstrip("\n").rsplit("\n", 1)[0] + "\n"
+
+"""
+The tests every backend has to pass. A TestCase that mixes this in sets backend to its name and passw to its
+password, starts every test with the library from _movies(), and empties the library when asked to by empty().
+"""
+class ArchiveTests(object):
+	backend = None
+	passw = None
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp(prefix="mymdb-archive-")
+		self.archive = os.path.join(self.folder, "library.tar.gz")
+		self.previous = db_personal.BACKEND
+		db_personal.useBackend(self.backend)
+		for movie in _movies():
+			#the long cast of the last movie is partly queued, so exporting has to store it first
+			self.assertTrue(db_personal.addMovieWithCredits(movie, self.passw, 5))
+
+	def tearDown(self):
+		db_personal.useBackend(self.previous)
+		shutil.rmtree(self.folder)
+
+	def roundTrip(self, archive_format):
+		manifest = db_archive.exportLibrary(self.archive, self.passw, archive_format)
+		before = self.rows()
+		stats = db_personal.getLibraryStats(self.passw)
+		self.assertEqual([table["rows"] for table in manifest["tables"]], [len(before[table]) for table, columns in db_archive.TABLES])
+		self.assertEqual(len(before["CREDITS"]), 31)
+		self.empty()
+		self.assertEqual(db_archive.importLibrary(self.archive, self.passw)["format"], archive_format)
+		self.assertEqual(self.rows(), before)
+		self.assertEqual(db_personal.getLibraryStats(self.passw), stats)
+		self.assertEqual(list(db_personal.getMovies("TWO\nLINES, \"QUOTED\"", self.passw)[0].cast), ["CARRIAGE\rRETURN", "ANNE\tTAB"])
+		#new movies get ids past the restored ones
+		self.assertTrue(db_personal.addMovieWithCredits(tempMovie("AFTER", ["JOHN O'BRIEN"], None, None, "2020", None, None, None,
+		                                                          False, False), self.passw))
+
+	def testCopy(self):
+		self.roundTrip("copy")
+
+	def testCsv(self):
+		self.roundTrip("csv")
+
+	def testJsonl(self):
+		self.roundTrip("jsonl")
+
+	def testEveryFormatTested(self):
+		self.assertEqual(sorted(db_archive.ARCHIVE_FORMATS), ["copy", "csv", "jsonl"])
+
+	"""
+	A library that isn't empty is only overwritten with replace.
+	"""
+	def testReplace(self):
+		db_archive.exportLibrary(self.archive, self.passw)
+		before = self.rows()
+		db_personal.setRating(_movies()[0], "1", self.passw)
+		changed = self.rows()
+		self.assertRaisesRegexp(ValueError, "isn't empty", db_archive.importLibrary, self.archive, self.passw)
+		self.assertEqual(self.rows(), changed)
+		db_archive.importLibrary(self.archive, self.passw, replace=True)
+		self.assertEqual(self.rows(), before)
+
+	"""
+	An archive that stops short is turned down, and the library is left as it was.
+	"""
+	def testTruncated(self):
+		db_archive.exportLibrary(self.archive, self.passw)
+		before = self.rows()
+		with open(self.archive, "rb") as f:
+			contents = f.read()
+		cut = os.path.join(self.folder, "cut.tar.gz")
+		with open(cut, "wb") as f:
+			f.write(contents[:len(contents) * 2 // 3])
+		self.assertRaises(_TRUNCATED_ERRORS, db_archive.importLibrary, cut, self.passw, True)
+		self.assertEqual(self.rows(), before)
+
+	def testMissingRows(self):
+		db_archive.exportLibrary(self.archive, self.passw)
+		before = self.rows()
+		short = os.path.join(self.folder, "short.tar.gz")
+		def edit(manifest, members):
+			members[-1][1] = _dropLastLine(members[-1][1])
+		_rewrite(self.archive, short, edit)
+		self.assertRaisesRegexp(ValueError, "Expected 31 rows in CREDITS but the archive had 30",
+		                        db_archive.importLibrary, short, self.passw, True)
+		self.assertEqual(self.rows(), before)
+
+	def testMissingTable(self):
+		db_archive.exportLibrary(self.archive, self.passw)
+		before = self.rows()
+		short = os.path.join(self.folder, "short.tar.gz")
+		_rewrite(self.archive, short, lambda manifest, members: members.pop())
+		self.assertRaisesRegexp(ValueError, "missing CREDITS", db_archive.importLibrary, short, self.passw, True)
+		self.assertEqual(self.rows(), before)
+
+	def testNewerVersion(self):
+		db_archive.exportLibrary(self.archive, self.passw)
+		newer = os.path.join(self.folder, "newer.tar.gz")
+		def edit(manifest, members):
+			manifest["archive_version"] = db_archive.ARCHIVE_VERSION + 1
+		_rewrite(self.archive, newer, edit)
+		self.empty()
+		self.assertRaisesRegexp(ValueError, "newer version", db_archive.importLibrary, newer, self.passw)
+		self.assertEqual(self.rows(), {"MOVIES": [], "PEOPLE": [], "CREDITS": []})
+
+	def testNotAnArchive(self):
+		with open(self.archive, "w") as f:
+			f.write("TITLE\tYEAR\n")
+		self.assertRaisesRegexp(ValueError, "isn't a myMDb archive", db_archive.importLibrary, self.archive, self.passw, True)
+
+	def testUnknownFormat(self):
+		self.assertRaises(ValueError, db_archive.exportLibrary, self.archive, self.passw, "xml")
+		self.assertFalse(os.path.exists(self.archive))
+
+class SqliteArchiveTest(ArchiveTests, unittest.TestCase):
+	backend = "sqlite"
+
+	@classmethod
+	def setUpClass(cls):
+		cls.library = tempfile.mkdtemp(prefix="mymdb-tests-")
+		cls.path = db_sqlite.DB_PATH
+		db_sqlite.DB_PATH = os.path.join(cls.library, "library.sqlite")
+
+	@classmethod
+	def tearDownClass(cls):
+		db_sqlite.closeDb()
+		db_sqlite.DB_PATH = cls.path
+		shutil.rmtree(cls.library)
+
+	def setUp(self):
+		self.empty()
+		ArchiveTests.setUp(self)
+
+	"""
+	Starts over with a new, empty library file.
+	"""
+	def empty(self):
+		db_sqlite.closeDb()
+		for name in os.listdir(self.library):
+			os.remove(os.path.join(self.library, name))
+		_quietly(db_sqlite.migrate)
+		db_sqlite.clearIdCaches()
+
+	def rows(self):
+		return _rows(lambda statement: db_sqlite.connect().execute(statement).fetchall())
+
+class PostgresArchiveTest(ArchiveTests, unittest.TestCase):
+	backend = "postgresql"
+
+	@classmethod
+	def setUpClass(cls):
+		cls.passw = postgres_db.createTestDb()
+
+	@classmethod
+	def tearDownClass(cls):
+		postgres_db.dropTestDb(cls.passw)
+
+	def setUp(self):
+		self.empty()
+		ArchiveTests.setUp(self)
+
+	def empty(self):
+		postgres_db.emptyTestDb(self.passw)
+
+	def rows(self):
+		with db_pool.connection(self.passw) as conn:
+			cur = conn.cursor()
+			def execute(statement):
+				cur.execute(statement)
+				return cur.fetchall()
+			return _rows(execute)
+
+	"""
+	A library goes over to SQLite and comes back through an archive of each, with the same rows.
+	"""
+	def testOtherBackend(self):
+		db_archive.exportLibrary(self.archive, self.passw, "csv")
+		before = self.rows()
+		path = db_sqlite.DB_PATH
+		db_sqlite.closeDb()
+		db_sqlite.DB_PATH = os.path.join(self.folder, "library.sqlite")
+		try:
+			_quietly(db_sqlite.migrate)
+			db_personal.useBackend("sqlite")
+			db_archive.importLibrary(self.archive, None)
+			found = db_personal.getMovies("TAB\tIN THE TITLE", None)[0]
+			self.assertEqual((found.rating, bool(found.watched), bool(found.own)), ("7.5", True, False))
+			self.assertEqual(list(found.writer), ["SAM \"THE PEN\" SMITH"])
+			db_archive.exportLibrary(self.archive, None)
+		finally:
+			db_sqlite.closeDb()
+			db_sqlite.DB_PATH = path
+		db_personal.useBackend(self.backend)
+		self.empty()
+		db_archive.importLibrary(self.archive, self.passw)
+		self.assertEqual(self.rows(), before)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,342 @@
+"""
+test_backends.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+One set of tests for every storage backend (see db_backend.py), so the two keep giving the same answers.
+BackendTests holds the tests, and each backend has a TestCase that runs them on an empty library of its own:
+the SQLite one always, on a file in a temporary folder, and the PostgreSQL one on a scratch database when there is
+a server to test against (see postgres_db.py).
+Between them, the tests call every function in db_backend.FUNCTIONS.
+"""
+import os
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+import db_backend
+import db_migrate
+import db_pool
+import db_postgres
+import db_sqlite
+from temp_objects import tempMovie, tempPerson
+from tests import postgres_db
+
+def _alien():
+	return tempMovie("ALIEN", ["RIDLEY SCOTT"], ["DAN O'BANNON"], ["SIGOURNEY WEAVER", "TOM SKERRITT"], "1979", "117 min", "R", "8.5",
+	                 True, True)
+
+def _bladeRunner():
+	return tempMovie("BLADE RUNNER", ["RIDLEY SCOTT"], ["HAMPTON FANCHER"], ["HARRISON FORD", "SEAN YOUNG"], "1982", "117 min", "R",
+	                 None, False, False)
+
+def _aliens():
+	return tempMovie("ALIENS", ["JAMES CAMERON"], ["JAMES CAMERON"], ["SIGOURNEY WEAVER", "MICHAEL BIEHN"], "1986", "137 min", "R", "8.4",
+	                 False, True)
+
+def _titles(movies):
+	return sorted([movie.title for movie in movies])
+
+"""
+The tests every backend has to pass. A TestCase that mixes this in sets db to the backend's module and passw
+to its password, and starts every test with an empty library.
+"""
+class BackendTests(object):
+	db = None
+	passw = None
+
+	def setUp(self):
+		for movie in (_alien(), _bladeRunner(), _aliens()):
+			self.assertTrue(self.db.addMovieWithCredits(movie, self.passw))
+		#so nothing below is answered from what adding the movies cached
+		self.db.clearIdCaches()
+
+	def testAddMovieWithCredits(self):
+		self.assertFalse(self.db.addMovieWithCredits(_alien(), self.passw))
+		found = self.db.getMovies("ALIEN", self.passw)
+		self.assertEqual(len(found), 1)
+		self.assertEqual((found[0].year, found[0].runtime, found[0].mpaa, found[0].rating, bool(found[0].watched), bool(found[0].own)),
+		                 ("1979", "117 min", "R", "8.5", True, True))
+		self.assertEqual(list(found[0].director), ["RIDLEY SCOTT"])
+		self.assertEqual(list(found[0].writer), ["DAN O'BANNON"])
+		self.assertEqual(list(found[0].cast), ["SIGOURNEY WEAVER", "TOM SKERRITT"])
+		self.assertIsNone(self.db.getMovies("NOT A MOVIE", self.passw))
+
+	def testGetMoviesByIds(self):
+		ids = [self.db.getMovieID(movie, self.passw) for movie in (_aliens(), _alien())]
+		found = self.db.getMoviesByIds(ids + [ids[0] + ids[1] + 1000], self.passw)
+		self.assertEqual([movie.title for movie in found], ["ALIENS", "ALIEN"])
+		self.assertEqual([movie.movie_id for movie in found], ids)
+		self.assertEqual(self.db.getMoviesByIds([], self.passw), [])
+
+	def testAddOneAtATime(self):
+		movie = tempMovie("THE THING", None, None, None, "1982", "109 min", "R", None, False, False)
+		person = tempPerson("KURT RUSSELL", "actor")
+		self.assertTrue(self.db.addMovie(movie, self.passw))
+		self.assertFalse(self.db.addMovie(movie, self.passw))
+		self.assertTrue(self.db.addPerson(person, self.passw))
+		self.assertFalse(self.db.addPerson(person, self.passw))
+		self.assertFalse(self.db.hasPerson(person, self.passw))
+		self.assertTrue(self.db.addRole(movie, person, self.passw))
+		self.assertFalse(self.db.addRole(movie, person, self.passw))
+		self.assertTrue(self.db.hasPerson(person, self.passw))
+		self.assertFalse(self.db.hasPerson(tempPerson("KURT RUSSELL", "director"), self.passw))
+		self.assertFalse(self.db.addRole(movie, tempPerson("NOBODY", "actor"), self.passw))
+		self.assertEqual(list(self.db.getMovies("THE THING", self.passw)[0].cast), ["KURT RUSSELL"])
+
+	"""
+	A movie with no year is still only added once, and is found by its title alone.
+	"""
+	def testNoYear(self):
+		movie = tempMovie("NO YEAR", ["A DIRECTOR"], None, None, None, None, None, None, False, False)
+		self.assertTrue(self.db.addMovieWithCredits(movie, self.passw))
+		self.assertFalse(self.db.addMovieWithCredits(movie, self.passw))
+		self.assertFalse(self.db.addMovie(movie, self.passw))
+		self.db.clearIdCaches()
+		self.assertEqual(len(self.db.getMovies("NO YEAR", self.passw)), 1)
+		self.assertIsNotNone(self.db.getMovieID(movie, self.passw))
+		self.assertTrue(self.db.addPerson(tempPerson("AN ACTOR", "actor"), self.passw))
+		self.assertTrue(self.db.addRole(movie, tempPerson("AN ACTOR", "actor"), self.passw))
+		self.db.clearIdCaches()
+		self.assertTrue(self.db.updateMovie(movie, self.passw, watched=True))
+		found = self.db.getMovies("NO YEAR", self.passw)[0]
+		self.assertEqual((list(found.cast), bool(found.watched)), (["AN ACTOR"], True))
+
+	def testIds(self):
+		self.assertTrue(self.db.hasMovie(_alien(), self.passw))
+		self.assertFalse(self.db.hasMovie(tempMovie("ALIEN", None, None, None, "2099", None, None, None, None, None), self.passw))
+		movie_id = self.db.getMovieID(_alien(), self.passw)
+		self.assertEqual(self.db.getMovies("ALIEN", self.passw)[0].movie_id, movie_id)
+		self.assertIsNotNone(self.db.getPersonID(tempPerson("JAMES CAMERON", None), self.passw))
+		self.assertIsNone(self.db.getPersonID(tempPerson("NOBODY", None), self.passw))
+		self.assertIsNone(self.db.getMovieID(tempMovie("NOT A MOVIE", None, None, None, "2000", None, None, None, None, None),
+		                                     self.passw))
+
+	def testIdCaches(self):
+		self.db.getMovieID(_alien(), self.passw)
+		self.db.getMovieID(_alien(), self.passw)
+		stats = self.db.idCacheStats()
+		self.assertEqual(stats["movies"]["entries"], 1)
+		self.assertGreaterEqual(stats["movies"]["hits"], 1)
+		self.db.clearIdCaches()
+		self.assertEqual(self.db.idCacheStats()["movies"]["entries"], 0)
+		self.assertIsNotNone(self.db.getMovieID(_alien(), self.passw))
+
+	def testPortfolio(self):
+		ridley = tempPerson("RIDLEY SCOTT", "director")
+		self.assertEqual(_titles(self.db.portfolio(ridley, self.passw)), ["ALIEN", "BLADE RUNNER"])
+		self.assertIsNone(self.db.portfolio(tempPerson("RIDLEY SCOTT", "actor"), self.passw))
+		self.assertEqual(_titles(self.db.iterPortfolio(ridley, self.passw, batch_size=1)), ["ALIEN", "BLADE RUNNER"])
+		self.assertEqual(list(self.db.iterPortfolio(tempPerson("NOBODY", "actor"), self.passw)), [])
+		first, after = self.db.portfolioPage(ridley, self.passw, limit=1)
+		second, last = self.db.portfolioPage(ridley, self.passw, after_id=after, limit=1)
+		self.assertEqual(_titles(first + second), ["ALIEN", "BLADE RUNNER"])
+		self.assertIsNone(last)
+		self.assertIsNone(self.db.portfolioPage(tempPerson("NOBODY", "actor"), self.passw))
+
+	def testFilmography(self):
+		found = self.db.filmography("JAMES CAMERON", self.passw)
+		self.assertEqual([(movie.title, list(roles)) for movie, roles in found], [("ALIENS", ["director", "writer"])])
+		self.assertEqual(_titles([movie for movie, roles in self.db.filmography("SIGOURNEY WEAVER", self.passw)]), ["ALIEN", "ALIENS"])
+		self.assertIsNone(self.db.filmography("NOBODY", self.passw))
+
+	def testMoviesToWatch(self):
+		self.assertEqual(_titles(self.db.getMoviesToWatch(self.passw)), ["ALIENS", "BLADE RUNNER"])
+		self.assertEqual(_titles(self.db.iterMoviesToWatch(self.passw, batch_size=1)), ["ALIENS", "BLADE RUNNER"])
+		first, after = self.db.getMoviesToWatchPage(self.passw, limit=1)
+		second, last = self.db.getMoviesToWatchPage(self.passw, after_id=after, limit=1)
+		self.assertEqual(_titles(first + second), ["ALIENS", "BLADE RUNNER"])
+		self.assertIsNone(last)
+
+	def testUpdateMovie(self):
+		self.assertTrue(self.db.updateMovie(_alien(), self.passw, rating="9", watched=False))
+		found = self.db.getMovies("ALIEN", self.passw)[0]
+		self.assertEqual((found.rating, bool(found.watched), bool(found.own)), ("9", False, True))
+		self.assertFalse(self.db.updateMovie(found, self.passw))
+		missing = tempMovie("NOT A MOVIE", None, None, None, "2000", None, None, None, None, None)
+		self.assertFalse(self.db.updateMovie(missing, self.passw, own=True))
+
+	def testSetters(self):
+		movie = self.db.getMovies("BLADE RUNNER", self.passw)[0]
+		self.assertTrue(self.db.setRating(movie, "8.1", self.passw))
+		self.assertTrue(self.db.setOwn(movie, True, self.passw))
+		self.assertTrue(self.db.setWatched(movie, True, self.passw))
+		found = self.db.getMovies("BLADE RUNNER", self.passw)[0]
+		self.assertEqual((found.rating, bool(found.watched), bool(found.own)), ("8.1", True, True))
+
+	def testClearRating(self):
+		self.assertTrue(self.db.setRating(_alien(), None, self.passw))
+		found = self.db.getMovies("ALIEN", self.passw)[0]
+		self.assertEqual((found.rating, bool(found.watched)), (None, True))
+		self.assertFalse(self.db.setRating(tempMovie("NOT A MOVIE", None, None, None, "2000", None, None, None, None, None),
+		                                   None, self.passw))
+		self.assertEqual(self.db.updateMovies(self.passw, movie_ids=[self.db.getMovieID(_aliens(), self.passw)],
+		                                      rating=db_backend.CLEAR_RATING), 1)
+		self.assertIsNone(self.db.getMovies("ALIENS", self.passw)[0].rating)
+		self.assertIsNone(self.db.getLibraryStats(self.passw)["average_rating"])
+
+	def testUpdateMovies(self):
+		ridley = tempPerson("RIDLEY SCOTT", "director")
+		#ALIEN is owned already, so only BLADE RUNNER changes
+		self.assertEqual(self.db.updateMovies(self.passw, person=ridley, own=True), 1)
+		self.assertEqual(self.db.updateMovies(self.passw, person=ridley, own=True), 0)
+		ids = [self.db.getMovieID(movie, self.passw) for movie in (_alien(), _aliens())]
+		self.assertEqual(self.db.updateMovies(self.passw, movie_ids=ids, person=ridley, watched=False), 1)
+		self.assertEqual(_titles(self.db.getMoviesToWatch(self.passw)), ["ALIEN", "ALIENS", "BLADE RUNNER"])
+		self.assertEqual(self.db.updateMovies(self.passw, movie_ids=[], watched=True), 0)
+		self.assertRaises(ValueError, self.db.updateMovies, self.passw, watched=True)
+
+	def testLibraryStats(self):
+		stats = self.db.getLibraryStats(self.passw, top=2)
+		self.assertEqual((stats["movies"], stats["watched"], stats["unwatched"], stats["owned"], stats["unwatched_runtime"]),
+		                 (3, 1, 2, 2, 254))
+		self.assertAlmostEqual(stats["average_rating"], 8.45)
+		self.assertEqual(stats["top"]["director"], [("RIDLEY SCOTT", 2), ("JAMES CAMERON", 1)])
+		#the four actors with one movie tie, and the one added first wins
+		self.assertEqual(stats["top"]["actor"], [("SIGOURNEY WEAVER", 2), ("TOM SKERRITT", 1)])
+		self.db.setWatched(_bladeRunner(), True, self.passw)
+		stats = self.db.getLibraryStats(self.passw)
+		self.assertEqual((stats["watched"], stats["unwatched"], stats["unwatched_runtime"]), (2, 1, 137))
+
+	def testFuzzySearch(self):
+		found = self.db.fuzzyMovies("alie", self.passw)
+		self.assertEqual(_titles([movie for movie, score in found]), ["ALIEN", "ALIENS"])
+		self.assertEqual(self.db.fuzzyMovies("  ", self.passw), [])
+		people = self.db.fuzzyPeople(tempPerson("ridley", "director"), self.passw)
+		self.assertEqual([(person.name, person.p_type) for person, score in people], [("RIDLEY SCOTT", "director")])
+		self.assertEqual(self.db.fuzzyPeople(tempPerson("ridley", "actor"), self.passw), [])
+
+	def testCreditQueue(self):
+		movie = tempMovie("HEAT", ["MICHAEL MANN"], [], ["AL PACINO", "ROBERT DE NIRO", "VAL KILMER", "JON VOIGHT"], "1995", "170 min",
+		                  "R", None, False, False)
+		self.assertTrue(self.db.addMovieWithCredits(movie, self.passw, top_billed=2))
+		queue = self.db.creditQueueStatus(self.passw)
+		self.assertEqual((queue["movies"], queue["credits"]), (1, 2))
+		self.assertEqual([(title, year, credits) for title, year, credits in queue["waiting"]], [("HEAT", "1995", 2)])
+		self.assertFalse(self.db.isFullyIndexed(movie, self.passw))
+		self.assertTrue(self.db.isFullyIndexed(_alien(), self.passw))
+		self.assertEqual(self.db.indexPendingCredits(self.passw), 1)
+		self.assertEqual(self.db.indexPendingCredits(self.passw), 0)
+		self.assertTrue(self.db.isFullyIndexed(movie, self.passw))
+		self.assertEqual(list(self.db.getMovies("HEAT", self.passw)[0].cast), ["AL PACINO", "ROBERT DE NIRO", "VAL KILMER", "JON VOIGHT"])
+
+class CoverageTest(unittest.TestCase):
+	"""
+	Every function a backend has to provide is called by at least one of the tests in BackendTests.
+	"""
+	def testEveryFunction(self):
+		with open(os.path.splitext(__file__)[0] + ".py") as f:
+			called = set(re.findall(r"self\.db\.(\w+)\(", f.read()))
+		self.assertEqual([function for function in db_backend.FUNCTIONS if function not in called], [])
+
+class SqliteBackendTest(BackendTests, unittest.TestCase):
+	db = db_sqlite
+
+	@classmethod
+	def setUpClass(cls):
+		cls.folder = tempfile.mkdtemp(prefix="mymdb-tests-")
+		cls.path = db_sqlite.DB_PATH
+		db_sqlite.DB_PATH = os.path.join(cls.folder, "library.sqlite")
+
+	@classmethod
+	def tearDownClass(cls):
+		db_sqlite.closeDb()
+		db_sqlite.DB_PATH = cls.path
+		shutil.rmtree(cls.folder)
+
+	def setUp(self):
+		#a new file for every test, since building one takes next to no time
+		db_sqlite.closeDb()
+		for name in os.listdir(self.folder):
+			os.remove(os.path.join(self.folder, name))
+		stdout = sys.stdout
+		sys.stdout = StringIO()
+		try:
+			db_sqlite.migrate()
+		finally:
+			sys.stdout = stdout
+		db_sqlite.clearIdCaches()
+		BackendTests.setUp(self)
+
+	"""
+	Copies of a movie with no year, let in by the unique index before version 4, are merged by that migration.
+	"""
+	def testMergeMoviesWithoutYear(self):
+		conn = db_sqlite.connect()
+		conn.execute("DROP INDEX MOVIES_TITLE_YEAR_KEY")
+		conn.execute("CREATE UNIQUE INDEX MOVIES_TITLE_YEAR_KEY ON MOVIES (TITLE, YEAR)")
+		conn.execute("PRAGMA user_version = 3")
+		_addCopies(conn.execute)
+		self.assertEqual(len(self.db.getMovies("NO YEAR", self.passw)), 3)
+		_quietly(db_sqlite.migrate)
+		_checkMerged(self, self.db, self.passw)
+
+class PostgresBackendTest(BackendTests, unittest.TestCase):
+	db = db_postgres
+
+	@classmethod
+	def setUpClass(cls):
+		cls.passw = postgres_db.createTestDb()
+
+	@classmethod
+	def tearDownClass(cls):
+		postgres_db.dropTestDb(cls.passw)
+
+	def setUp(self):
+		postgres_db.emptyTestDb(self.passw)
+		BackendTests.setUp(self)
+
+	"""
+	Copies of a movie with no year, let in by the unique index before version 6, are merged by that migration.
+	"""
+	def testMergeMoviesWithoutYear(self):
+		with db_pool.connection(self.passw) as conn:
+			cur = conn.cursor()
+			cur.execute("DROP INDEX MOVIES_TITLE_YEAR_KEY")
+			cur.execute("CREATE UNIQUE INDEX MOVIES_TITLE_YEAR_KEY ON MOVIES (TITLE, YEAR)")
+			cur.execute("DELETE FROM SCHEMA_VERSION WHERE VERSION = 6")
+			_addCopies(cur.execute)
+		self.assertEqual(len(self.db.getMovies("NO YEAR", self.passw)), 3)
+		_quietly(db_migrate.migrate, self.passw)
+		_checkMerged(self, self.db, self.passw)
+
+"""
+Runs a function without letting it print anything.
+"""
+def _quietly(function, *args):
+	stdout = sys.stdout
+	sys.stdout = StringIO()
+	try:
+		return function(*args)
+	finally:
+		sys.stdout = stdout
+
+"""
+Adds three copies of a movie with no year, each with credits of its own, the way the old unique index let them in.
+@params:
+	execute: function that runs a statement on the library, in one transaction with the others
+"""
+def _addCopies(execute):
+	for cast in (["FIRST ACTOR"], ["SECOND ACTOR"], ["FIRST ACTOR", "THIRD ACTOR"]):
+		execute("INSERT INTO MOVIES (TITLE, YEAR, WATCHED, OWN) VALUES ('NO YEAR', NULL, FALSE, FALSE)")
+		for name in cast:
+			execute("INSERT INTO PEOPLE (NAME) SELECT '" + name + "' WHERE NOT EXISTS (SELECT 1 FROM PEOPLE WHERE NAME = '" + name + "')")
+			execute("INSERT INTO CREDITS (M_ID, P_ID, ROLE) SELECT max(MOVIES.ID), PEOPLE.ID, 'actor' FROM MOVIES, PEOPLE " +
+			        "WHERE MOVIES.TITLE = 'NO YEAR' AND PEOPLE.NAME = '" + name + "' GROUP BY PEOPLE.ID")
+
+"""
+Checks that the copies from _addCopies() are one movie now, with all of their credits, and that the library
+statistics count it once.
+"""
+def _checkMerged(test, db, passw):
+	db.clearIdCaches()
+	found = db.getMovies("NO YEAR", passw)
+	test.assertEqual(len(found), 1)
+	test.assertEqual(list(found[0].cast), ["FIRST ACTOR", "SECOND ACTOR", "THIRD ACTOR"])
+	test.assertEqual(db.getLibraryStats(passw)["movies"], 4)
+	test.assertFalse(db.addMovie(tempMovie("NO YEAR", None, None, None, None, None, None, None, False, False), passw))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,158 @@
+"""
+test_mirror.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Tests of the local IMDb mirror (db_mirror.py), built from the small dataset files in imdb_datasets/.
+Those are cut down from IMDb's own files: title.basics is gzipped in two parts, split in the middle of a line,
+it has a TV episode in it, and name.basics has someone who isn't in any of the titles.
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+import db_mirror
+
+DATASETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "imdb_datasets")
+
+"""
+Stands in for the sqlite3 module in db_mirror.py, with connections that can't make FTS5 tables,
+like the SQLite of an older Python.
+"""
+class _NoFts5(object):
+	OperationalError = sqlite3.OperationalError
+
+	def connect(self, *args, **kwargs):
+		return _NoFts5Connection(sqlite3.connect(*args, **kwargs))
+
+class _NoFts5Connection(object):
+	def __init__(self, conn):
+		self.conn = conn
+
+	def execute(self, statement, *args):
+		if "fts5" in statement:
+			raise sqlite3.OperationalError("no such module: fts5")
+		return self.conn.execute(statement, *args)
+
+	def __getattr__(self, name):
+		return getattr(self.conn, name)
+
+class MirrorTestCase(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.settings = (db_mirror.MIRROR_PATH, db_mirror.MIRROR_ENABLED, db_mirror.READ_SIZE, db_mirror.sqlite3)
+		db_mirror.MIRROR_PATH = os.path.join(self.folder, "imdb_mirror.sqlite")
+		db_mirror.MIRROR_ENABLED = True
+
+	def tearDown(self):
+		db_mirror.MIRROR_PATH, db_mirror.MIRROR_ENABLED, db_mirror.READ_SIZE, db_mirror.sqlite3 = self.settings
+		#every thread keeps its connection to the mirror, so let go of this one before the file goes
+		db_mirror._local = threading.local()
+		shutil.rmtree(self.folder)
+
+class ImportTest(MirrorTestCase):
+	def testCounts(self):
+		counts = db_mirror.importDatasets(DATASETS)
+		#the episode, its host, and the person with no titles are left out
+		self.assertEqual(counts, {"titles": 7, "people": 12, "credits": 15})
+		self.assertEqual(db_mirror.stats()["titles"], "7")
+		self.assertFalse(os.path.exists(db_mirror.MIRROR_PATH + ".building"))
+
+	def testEpisodes(self):
+		counts = db_mirror.importDatasets(DATASETS, episodes=True)
+		self.assertEqual(counts, {"titles": 8, "people": 13, "credits": 17})
+		self.assertEqual([result["kind"] for result in db_mirror.searchMovies("matrix unlocked")], ["episode"])
+
+	"""
+	Lines split across reads, and across the two gzip members, come out whole.
+	"""
+	def testSmallReads(self):
+		db_mirror.READ_SIZE = 7
+		self.assertEqual(db_mirror.importDatasets(DATASETS)["titles"], 7)
+		self.assertEqual(db_mirror.getMovie("0090605")["title"], "Aliens")
+
+	def testMissingDataset(self):
+		empty = os.path.join(self.folder, "empty")
+		os.mkdir(empty)
+		self.assertRaises(ValueError, db_mirror.importDatasets, empty)
+		self.assertFalse(db_mirror.available())
+
+	"""
+	A new import replaces the mirror that was there.
+	"""
+	def testReimport(self):
+		db_mirror.importDatasets(DATASETS)
+		db_mirror._local = threading.local()
+		db_mirror.importDatasets(DATASETS, episodes=True)
+		self.assertEqual(db_mirror.stats()["episodes"], "True")
+
+class SearchTest(MirrorTestCase):
+	def setUp(self):
+		MirrorTestCase.setUp(self)
+		db_mirror.importDatasets(DATASETS)
+
+	"""
+	The last word can be the start of a word, and the most voted titles come first.
+	"""
+	def testPrefix(self):
+		results = db_mirror.searchMovies("the matr")
+		self.assertEqual([result["title"] for result in results], ["The Matrix", "The Matrix Reloaded", "The Matrix Revolutions"])
+		self.assertEqual(results[0], {"id": "0133093", "title": "The Matrix", "year": 1999, "kind": "movie", "runtime": "136"})
+
+	"""
+	A title that matches exactly comes first, even with fewer votes.
+	"""
+	def testExactMatchFirst(self):
+		results = db_mirror.searchMovies("MATRIX")
+		self.assertEqual([result["title"] for result in results],
+		                 ["Matrix", "The Matrix", "The Matrix Reloaded", "The Matrix Revolutions"])
+		self.assertEqual(results[0]["kind"], "tv series")
+		self.assertEqual([result["title"] for result in db_mirror.searchMovies("alien")], ["Alien", "Aliens"])
+
+	def testOriginalTitle(self):
+		self.assertEqual([result["id"] for result in db_mirror.searchMovies("fabuleux destin")], ["0211915"])
+		self.assertEqual([result["id"] for result in db_mirror.searchMovies(u"am\xe9lie")], ["0211915"])
+
+	def testLimit(self):
+		self.assertEqual(len(db_mirror.searchMovies("matrix", limit=2)), 2)
+
+	def testNothingFound(self):
+		self.assertEqual(db_mirror.searchMovies("no such movie"), [])
+		self.assertEqual(db_mirror.searchMovies("?!"), [])
+
+	def testNoMirror(self):
+		db_mirror.MIRROR_ENABLED = False
+		self.assertEqual(db_mirror.searchMovies("matrix"), [])
+		self.assertIsNone(db_mirror.getMovie("0133093"))
+
+	def testGetMovie(self):
+		fields = db_mirror.getMovie("0133093")
+		self.assertEqual(fields, {"title": "The Matrix", "year": 1999, "runtimes": ["136"], "certificates": None,
+		                          "director": ["Lilly Wachowski", "Lana Wachowski"],
+		                          "writer": ["Lana Wachowski", "Lilly Wachowski"],
+		                          "cast": ["Keanu Reeves", "Laurence Fishburne", "Carrie-Anne Moss"]})
+		alien = db_mirror.getMovie("0078748")
+		self.assertEqual(alien["writer"], ["Dan O'Bannon", "Ronald Shusett"])
+		self.assertIsNone(db_mirror.getMovie("0242653")["director"])
+		self.assertIsNone(db_mirror.getMovie("0389790"))
+
+class Fts4Test(MirrorTestCase):
+	"""
+	Without FTS5 the search index is built with FTS4, and searches the same way.
+	"""
+	def testFallback(self):
+		db_mirror.sqlite3 = _NoFts5()
+		db_mirror.importDatasets(DATASETS)
+		db_mirror.sqlite3 = sqlite3
+		conn = sqlite3.connect(db_mirror.MIRROR_PATH)
+		self.assertIn("fts4", conn.execute("SELECT sql FROM sqlite_master WHERE name = 'TITLE_SEARCH'").fetchone()[0])
+		conn.close()
+		self.assertEqual([result["title"] for result in db_mirror.searchMovies("matrix")],
+		                 ["Matrix", "The Matrix", "The Matrix Reloaded", "The Matrix Revolutions"])
+		self.assertEqual(len(db_mirror.searchMovies("the matr")), 3)
+		self.assertEqual([result["id"] for result in db_mirror.searchMovies("fabuleux")], ["0211915"])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,50 @@
+"""
+test_stats.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Tests of how db_stats.py decides which operation a query is counted under.
+"""
+import threading
+import unittest
+import db_stats
+
+class ThreadOperationTest(unittest.TestCase):
+	def setUp(self):
+		self.slow_log = db_stats.SLOW_LOG_PATH
+		db_stats.SLOW_LOG_PATH = ""
+		db_stats.reset()
+
+	def tearDown(self):
+		db_stats.reset()
+		db_stats.SLOW_LOG_PATH = self.slow_log
+
+	"""
+	A thread with an operation of its own counts under it, while every other thread counts under the menu action.
+	"""
+	def testOwnOperation(self):
+		db_stats.setOperation("movie search")
+		def work():
+			db_stats.setThreadOperation("indexer")
+			db_stats.recordQuery("SELECT 1", None, 0.001, 1)
+			db_stats.recordAcquire(0.001)
+		worker = threading.Thread(target=work)
+		worker.start()
+		worker.join()
+		db_stats.recordQuery("SELECT 2", None, 0.001, 1)
+		numbers = db_stats.snapshot()
+		self.assertEqual((numbers["indexer"]["runs"], numbers["indexer"]["queries"]["count"]), (1, 1))
+		self.assertEqual(numbers["indexer"]["connections"]["count"], 1)
+		self.assertEqual(numbers["movie search"]["queries"]["count"], 1)
+
+	def testBackToMenuAction(self):
+		db_stats.setOperation("add movie")
+		db_stats.setThreadOperation("indexer")
+		db_stats.setThreadOperation(None)
+		db_stats.recordQuery("SELECT 1", None, 0.001, 1)
+		numbers = db_stats.snapshot()
+		self.assertEqual(numbers["indexer"]["queries"]["count"], 0)
+		self.assertEqual(numbers["add movie"]["queries"]["count"], 1)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,182 @@
+"""
+test_web.py
+language: python2
+author: Peter Jindra, peterfjindra@gmail.com
+
+Tests of the IMDb side of the myMDb project (db_web.py), run against the local stub in stub_imdb.py.
+The IMDb cache and the local mirror are turned off, so every movie comes from the stub.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from StringIO import StringIO
+import db_mirror
+import db_stats
+import db_web
+import db_webcache
+from tests.stub_imdb import StubIMDb
+
+class WebTestCase(unittest.TestCase):
+	def setUp(self):
+		StubIMDb.reset()
+		self.settings = (db_web.IMDB_FACTORY, db_webcache.CACHE_ENABLED, db_mirror.MIRROR_ENABLED)
+		db_web.IMDB_FACTORY = StubIMDb
+		db_webcache.CACHE_ENABLED = False
+		db_mirror.MIRROR_ENABLED = False
+		#every thread makes its IMDb object the first time it needs one, so start over with the stub
+		db_web._worker = threading.local()
+
+	def tearDown(self):
+		StubIMDb.release()
+		db_web.IMDB_FACTORY, db_webcache.CACHE_ENABLED, db_mirror.MIRROR_ENABLED = self.settings
+		db_web._worker = threading.local()
+
+class FetchMoviesTest(WebTestCase):
+	"""
+	Movies come back in the order they were asked for, not the order they finished in.
+	"""
+	def testKeepsOrder(self):
+		StubIMDb.delays = {"0000001": 0.3, "0000002": 0.1, "0000003": 0.2}
+		movies = db_web.fetchMovies(["0000001", "0000002", "0000003"])
+		self.assertEqual([movie.title for movie in movies], ["MOVIE 0000001", "MOVIE 0000002", "MOVIE 0000003"])
+		self.assertEqual(list(movies[0].cast), ["AN ACTOR"])
+
+	"""
+	The fetches run at the same time, so a batch takes about as long as one fetch.
+	"""
+	def testFetchesConcurrently(self):
+		movie_ids = ["%07d" % i for i in range(1, db_web.FETCH_WORKERS + 1)]
+		StubIMDb.delays = dict([(movie_id, 0.3) for movie_id in movie_ids])
+		start = time.time()
+		movies = db_web.fetchMovies(movie_ids)
+		self.assertLess(time.time() - start, 0.9)
+		self.assertEqual(len([movie for movie in movies if movie is not None]), len(movie_ids))
+		self.assertEqual(len(StubIMDb.calls), len(movie_ids))
+
+	"""
+	No more than FETCH_WORKERS fetches are made at the same time.
+	"""
+	def testBoundedPool(self):
+		movie_ids = ["%07d" % i for i in range(1, db_web.FETCH_WORKERS * 2 + 1)]
+		StubIMDb.delays = dict([(movie_id, 0.2) for movie_id in movie_ids])
+		start = time.time()
+		db_web.fetchMovies(movie_ids)
+		started = sorted([started for movie_id, started in StubIMDb.calls])
+		self.assertLess(started[db_web.FETCH_WORKERS - 1] - start, 0.15)
+		self.assertGreaterEqual(started[db_web.FETCH_WORKERS] - start, 0.15)
+
+	"""
+	A movie that fails comes back as None, and the rest still load.
+	"""
+	def testFailureIsolated(self):
+		StubIMDb.failing = set(["0000002"])
+		movies = db_web.fetchMovies(["0000001", "0000002", "0000003"])
+		self.assertIsNone(movies[1])
+		self.assertEqual(movies[0].title, "MOVIE 0000001")
+		self.assertEqual(movies[2].title, "MOVIE 0000003")
+
+	"""
+	Hung fetches share one deadline: two of them take one timeout between them, not two.
+	"""
+	def testSharedDeadline(self):
+		StubIMDb.hanging = set(["0000001", "0000003"])
+		start = time.time()
+		movies = db_web.fetchMovies(["0000001", "0000002", "0000003"], timeout=0.5)
+		elapsed = time.time() - start
+		self.assertGreaterEqual(elapsed, 0.5)
+		self.assertLess(elapsed, 0.9)
+		self.assertIsNone(movies[0])
+		self.assertEqual(movies[1].title, "MOVIE 0000002")
+		self.assertIsNone(movies[2])
+
+	def testEmpty(self):
+		self.assertEqual(db_web.fetchMovies([]), [])
+
+class PullMovieTest(WebTestCase):
+	def setUp(self):
+		WebTestCase.setUp(self)
+		self.timeout = db_web.FETCH_TIMEOUT
+		self.stdout = sys.stdout
+		#the user picks the first result, and the menus are kept out of the test output
+		db_web.raw_input = lambda prompt: "1"
+		sys.stdout = StringIO()
+
+	def tearDown(self):
+		sys.stdout = self.stdout
+		del db_web.raw_input
+		db_web.FETCH_TIMEOUT = self.timeout
+		WebTestCase.tearDown(self)
+
+	def testPicksMovie(self):
+		self.assertEqual(db_web.pullMovie("ALIEN", False).title, "MOVIE 0000001")
+
+	"""
+	A movie that hangs gives up after FETCH_TIMEOUT, and the user is told it couldn't be loaded.
+	"""
+	def testHungFetchTimesOut(self):
+		StubIMDb.hanging = set(["0000001"])
+		db_web.FETCH_TIMEOUT = 0.3
+		start = time.time()
+		self.assertFalse(db_web.pullMovie("ALIEN", False))
+		self.assertLess(time.time() - start, 0.9)
+		self.assertIn("couldn't be loaded", sys.stdout.getvalue())
+
+class TimedIMDbTest(WebTestCase):
+	def tearDown(self):
+		db_stats.MEASURE_SIZES = False
+		db_stats.setOperation(None)
+		WebTestCase.tearDown(self)
+
+	"""
+	The size of what IMDb gave back is only measured when MEASURE_SIZES is on.
+	"""
+	def testSizesOnlyWhenMeasured(self):
+		db_stats.setOperation("timed imdb test")
+		db_web.getMovie("0000001")
+		db_stats.MEASURE_SIZES = True
+		db_web.getMovie("0000002")
+		numbers = db_stats.snapshot()["timed imdb test"]
+		self.assertEqual(numbers["imdb"]["count"], 2)
+		self.assertEqual(numbers["imdb_bytes"]["get_movie"]["count"], 1)
+		self.assertGreater(numbers["imdb_bytes"]["get_movie"]["bytes"], 0)
+
+	"""
+	A failed call is still counted, with no results.
+	"""
+	def testFailureCounted(self):
+		StubIMDb.failing = set(["0000001"])
+		db_stats.setOperation("failed imdb test")
+		self.assertRaises(IOError, db_web.getMovie, "0000001")
+		numbers = db_stats.snapshot()["failed imdb test"]
+		self.assertEqual((numbers["imdb"]["count"], numbers["imdb"]["rows"]), (1, 0))
+
+class WebCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.settings = (db_webcache.CACHE_PATH, db_webcache.CACHE_ENABLED)
+		db_webcache.CACHE_ENABLED = True
+
+	def tearDown(self):
+		db_webcache.CACHE_PATH, db_webcache.CACHE_ENABLED = self.settings
+		db_webcache._local = threading.local()
+		shutil.rmtree(self.folder)
+
+	"""
+	Changing CACHE_PATH moves the cache to the new file, on a thread that already had the old one open.
+	"""
+	def testPathChange(self):
+		db_webcache.CACHE_PATH = os.path.join(self.folder, "first.sqlite")
+		db_webcache.put(db_webcache.movieKey("0000001"), {"title": "FIRST"})
+		db_webcache.CACHE_PATH = os.path.join(self.folder, "second.sqlite")
+		self.assertIsNone(db_webcache.get(db_webcache.movieKey("0000001")))
+		db_webcache.put(db_webcache.movieKey("0000001"), {"title": "SECOND"})
+		self.assertEqual(db_webcache.stats()["path"], db_webcache.CACHE_PATH)
+		db_webcache.CACHE_PATH = os.path.join(self.folder, "first.sqlite")
+		self.assertEqual(db_webcache.get(db_webcache.movieKey("0000001")), {"title": "FIRST"})
+
+if __name__ == "__main__":
+	unittest.main()